@@ -1,6 +1,91 @@
 import json  # JSON library for configuration handling
+import logging
+import threading
+from collections.abc import Mapping
 from pathlib import Path
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+def parse_duration(duration_str: str, default: int = 3600) -> int:
+    """'HH:MM:SS' (or 'MM:SS', 'SS') to seconds; default if it can't be parsed."""
+    try:
+        parts = [int(p) for p in str(duration_str).split(":")]
+        while len(parts) < 3:
+            parts.insert(0, 0)
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    except ValueError:
+        return default
+
+
+def hex_to_rgb(hex_color: str) -> tuple[int, int, int]:
+    hex_color = hex_color.lstrip('#')
+    return int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
+
+
+def _freeze(value: Any) -> Any:
+    """A read-only copy of a JSON value: dicts become mapping proxies and lists tuples, all the way down."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    """The mutable JSON value _freeze made value from."""
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class ConfigSnapshot(Mapping):
+    """
+    One immutable version of the configuration. Reads like the config dict
+    (config["active_theme"], config.get(...)) and also carries fields parsed
+    once when the snapshot is made. Nested values are read-only too: objects
+    read as mappings and arrays as tuples.
+    """
+    __slots__ = ("_data", "version", "display_seconds", "background_rgb")
+
+    def __init__(self, data: Dict[str, Any], version: int = 0):
+        data = _freeze(data)
+        object.__setattr__(self, "_data", data)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "display_seconds", parse_duration(data.get("display_duration", "")))
+        try:
+            background_rgb = hex_to_rgb(data.get("background_color", "#000000"))
+        except ValueError:
+            background_rgb = (0, 0, 0)
+        object.__setattr__(self, "background_rgb", background_rgb)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot is immutable")
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f"ConfigSnapshot(v{self.version}, {self.to_dict()!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """A mutable deep copy, for editing and passing to save_config."""
+        return _thaw(self._data)
+
+    def changed_keys(self, other: "ConfigSnapshot | None") -> set[str]:
+        if other is None:
+            return set(self._data)
+        return {key for key in set(self._data) | set(other) if self._data.get(key) != other.get(key)}
 
 
 class ConfigMgr:
@@ -11,17 +96,25 @@ class ConfigMgr:
 
     def __init__(self, config_file_name: str = LOCAL_CONFIG_FILE_NAME):
         self.config_file_path: Path = Path(config_file_name)
-        self._config_cache: Dict[str, Any] = {}
-        self._last_read_time: float = 0.0  # Stores last read timestamp
+        # Published snapshot; readers just read this attribute, writers swap it under _reload_lock.
+        self._snapshot: ConfigSnapshot | None = None
+        self._file_signature: tuple[int, int] | None = None  # (mtime_ns, size) of the file last read
+        self._reload_lock = threading.RLock()
+        self._subscribers: list[tuple[frozenset[str] | None, Callable[[ConfigSnapshot, ConfigSnapshot], None]]] = []
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
 
-    def _is_config_modified(self) -> bool:
-        """Check if the config file has been modified since the last read."""
-        if not self.config_file_path.exists():
-            return True  # If the file doesn't exist, treat it as modified
+    def _read_file_signature(self) -> tuple[int, int] | None:
+        try:
+            stat = self.config_file_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
 
-        last_modified = self.config_file_path.stat().st_mtime
-        b = (last_modified - self._last_read_time) > 0.5
-        return b
+    def _is_config_modified(self) -> bool:
+        """Check if the config file has changed since it was last read or written."""
+        signature = self._read_file_signature()
+        return signature is None or signature != self._file_signature
 
     def read_factory_config(self) -> dict:
         """
@@ -37,6 +130,21 @@ class ConfigMgr:
         fconfig = self.read_factory_config()
         self.save_config(fconfig)
 
+    @property
+    def current(self) -> ConfigSnapshot:
+        """
+        The current snapshot, without touching the disk or taking a lock; safe
+        to call from any thread. Loads the config on first use.
+        """
+        snapshot = self._snapshot
+        return snapshot if snapshot is not None else self.snapshot()
+
+    def snapshot(self) -> ConfigSnapshot:
+        """The current snapshot, reloading it first if the file changed."""
+        if self._snapshot is None or self._is_config_modified():
+            self._reload()
+        return self._snapshot
+
     def load_config(self) -> dict:
         """
         Load the app's configuration.
@@ -44,60 +152,116 @@ class ConfigMgr:
         - if config_local.json doesn't exist, write it using config_factory.json
         - read in the config_local.json file
             - merge in any new values found in config_factory.json
-        - write the config_local.json file
+        - write the config_local.json file only if factory values were added
         - ensure themes and image_out directories exist
-        :return: a dictionary containing the configuration data
+        The file is only re-read if it changed since the last read.
+        :return: a mutable copy of the configuration data; see current for a shared, read-only one
         """
-        if self._config_cache and not self._is_config_modified():
-            # we'll just use the cached version, then, shall we?
-            return self._config_cache
+        return self.snapshot().to_dict()
 
-        default_config = self.read_factory_config()
+    def _reload(self) -> None:
+        with self._reload_lock:
+            if self._snapshot is not None and not self._is_config_modified():
+                return  # another thread got here first
+            default_config = self.read_factory_config()
 
-        # Write the config file if one does not exist
-        if not self.config_file_path.exists():
-            with self.config_file_path.open("w", encoding="utf-8") as file:
-                json.dump(default_config, file, indent=4)  # type: ignore
-                print(f"New config file written to: {self.config_file_path}")
+            # Write the config file if one does not exist
+            if not self.config_file_path.exists():
+                self._write(default_config)
+                logger.info(f"New config file written to: {self.config_file_path}")
 
-        # Read in the config_local.json file.
-        # Merge with default values to include any new items
-        with self.config_file_path.open("r", encoding="utf-8") as file:
-            the_data = json.load(file)
+            # Read in the config_local.json file.
+            # Merge with default values to include any new items
+            signature = self._read_file_signature()
+            with self.config_file_path.open("r", encoding="utf-8") as file:
+                the_data = json.load(file)
             loaded_config = {**default_config, **the_data}
-            print(f"Full Read of config_local.json: {loaded_config}")
-            self._config_cache = loaded_config
-            self._last_read_time = self.config_file_path.stat().st_mtime
-
-        self.validate_config_values(config_dict=loaded_config)
 
-        # Write the file to ensure all new data is on file,
-        # will update the cached version & last-read-date
-        self.save_config(config=loaded_config)
+            # Ensure themes and save directories exist before they are validated
+            Path(loaded_config["themes_directory"]).mkdir(parents=True, exist_ok=True)
+            Path(loaded_config["save_directory_path"]).mkdir(parents=True, exist_ok=True)
 
-        # Ensure themes directory exists
-        themes_dir = Path(loaded_config["themes_directory"])
-        if not themes_dir.exists():
-            themes_dir.mkdir(parents=True, exist_ok=True)
+            self.validate_config_values(config_dict=loaded_config)
 
-        # Ensure save directory exists
-        save_dir = Path(loaded_config["save_directory_path"])
-        if not save_dir.exists():
-            save_dir.mkdir(parents=True, exist_ok=True)
-
-        print("Loaded config:\n" + json.dumps(loaded_config, indent=4))
-
-        return loaded_config
+            added_keys = set(default_config) - set(the_data)
+            if added_keys:
+                # only now is there something new to put on file
+                logger.info(f"Adding new config values to {self.config_file_path}: {sorted(added_keys)}")
+                self._write(loaded_config)
+            else:
+                self._file_signature = signature
+            self._publish(loaded_config)
 
     def save_config(self, config: Dict[str, Any]):
         """
         Saves the current configuration to the config_local.json file.
         This will remember when it was written.
         """
+        with self._reload_lock:
+            self._write(config)
+            self._publish(config)
+
+    def _write(self, config: Dict[str, Any]) -> None:
         with self.config_file_path.open("w", encoding="utf-8") as file:
             json.dump(config, file, indent=4)  # type: ignore
-        self._config_cache = config
-        self._last_read_time = self.config_file_path.stat().st_mtime
+        self._file_signature = self._read_file_signature()
+
+    def _publish(self, config: Dict[str, Any]) -> None:
+        """Swap in a new snapshot if the config really changed, then tell subscribers."""
+        old = self._snapshot
+        if old is not None and old.to_dict() == config:
+            return
+        new = ConfigSnapshot(config, version=old.version + 1 if old is not None else 1)
+        self._snapshot = new
+        if old is None:
+            logger.info(f"Loaded config: {json.dumps(config)}")
+            return
+        changed = new.changed_keys(old)
+        logger.info(f"Config changed: {sorted(changed)}")
+        for keys, callback in list(self._subscribers):
+            if keys is None or keys & changed:
+                try:
+                    callback(old, new)
+                except Exception as e:
+                    logger.warning(f"Config subscriber failed: {e}")
+
+    # ----------------------------
+    # Change notification
+    # ----------------------------
+    def subscribe(self, keys: Iterable[str] | None,
+                  callback: Callable[[ConfigSnapshot, ConfigSnapshot], None]) -> None:
+        """
+        callback(old, new) is called after a new snapshot is published in which
+        any of keys changed (any key at all if keys is None). It runs on the
+        thread that noticed the change, usually the watcher.
+        """
+        self._subscribers.append((frozenset(keys) if keys is not None else None, callback))
+
+    def unsubscribe(self, callback: Callable[[ConfigSnapshot, ConfigSnapshot], None]) -> None:
+        self._subscribers = [(k, cb) for k, cb in self._subscribers if cb != callback]
+
+    def start_watcher(self, poll_interval: float = 2.0) -> None:
+        """Reload the config in the background whenever the file changes."""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(poll_interval,),
+                                         name="ConfigWatcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        self._watcher = None
+
+    def _watch(self, poll_interval: float) -> None:
+        while not self._stop.wait(poll_interval):
+            try:
+                if self._is_config_modified():
+                    self._reload()
+            except Exception as e:
+                # keep the last good snapshot; a half-saved or invalid edit shouldn't stop the app
+                logger.warning(f"Ignoring config change in {self.config_file_path}: {e}")
+                self._file_signature = self._read_file_signature()
 
     def validate_time_string(self, time_str: str) -> bool:
         try:
@@ -0,0 +1,168 @@
+"""
+Module: ContentHash.py
+
+Content checks for S3Sync: the MD5 of a local file and the ETag S3 would
+give it, so a local file can be compared with an object in the bucket
+without downloading either.
+
+For an object uploaded in one piece the ETag is the hex MD5 of its bytes;
+for a multipart upload it is the MD5 of the concatenated part MD5s
+followed by "-<number of parts>", which we can reproduce as long as we
+know the part size the upload used (S3Manager's TransferConfig). ETags we
+can't reproduce (a different part size, or server-side encryption with
+KMS) compare as unknown rather than as different.
+
+Hashing means reading the whole file, so results are kept in a sidecar,
+content_hashes.json, keyed by path and only trusted while the file's mtime
+and size are unchanged.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+SAME = "same"
+DIFFERENT_SIZE = "different_size"
+DIFFERENT_CONTENT = "different_content"
+UNKNOWN = "unknown"
+
+
+@dataclass
+class FileHash:
+    mtime_ns: int
+    size: int
+    md5: str
+    etag: str
+    part_size: int  # the part size etag was computed for
+
+
+def hash_file(path: Path | str, part_size: int, multipart_threshold: int | None = None) -> tuple[str, str]:
+    """
+    (hex MD5, ETag) of the file at path, read once in chunks. The ETag is
+    what S3 reports for it uploaded with part_size parts; files under
+    multipart_threshold (default part_size) go up in one piece.
+    """
+    threshold = part_size if multipart_threshold is None else multipart_threshold
+    whole = hashlib.md5()
+    part_digests = []
+    part = hashlib.md5()
+    in_part = 0
+    with open(path, "rb") as file:
+        while chunk := file.read(min(CHUNK_SIZE, part_size - in_part)):
+            whole.update(chunk)
+            part.update(chunk)
+            in_part += len(chunk)
+            if in_part == part_size:
+                part_digests.append(part.digest())
+                part, in_part = hashlib.md5(), 0
+    size = os.path.getsize(path)
+    if size < threshold:
+        return whole.hexdigest(), whole.hexdigest()
+    if in_part:
+        part_digests.append(part.digest())
+    return whole.hexdigest(), f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def normalize_etag(etag: str | None) -> str:
+    return (etag or "").strip('"').lower()
+
+
+def is_single_part(etag: str) -> bool:
+    """Whether etag is the plain MD5 of an object uploaded in one piece."""
+    return len(etag) == 32 and "-" not in etag
+
+
+class HashCache:
+    CACHE_FILE_NAME: str = "content_hashes.json"
+
+    def __init__(self, path: str | None = CACHE_FILE_NAME):
+        """:param path: where hashes are saved; None keeps them in memory only"""
+        self.path = Path(path) if path is not None else None
+        self._hashes: dict[str, FileHash] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.hashed = 0  # files actually read, as opposed to answered from the cache
+        self.load()
+
+    def get(self, file_path: Path | str, part_size: int, multipart_threshold: int | None = None) -> FileHash:
+        """The hashes of file_path, from the cache if its mtime and size haven't changed."""
+        key = os.fspath(file_path)
+        stat = os.stat(key)
+        with self._lock:
+            cached = self._hashes.get(key)
+        if (cached is not None and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size
+                and cached.part_size == part_size):
+            return cached
+        md5, etag = hash_file(key, part_size, multipart_threshold)
+        file_hash = FileHash(mtime_ns=stat.st_mtime_ns, size=stat.st_size, md5=md5, etag=etag, part_size=part_size)
+        with self._lock:
+            self._hashes[key] = file_hash
+            self._dirty = True
+            self.hashed += 1
+        return file_hash
+
+    def compare(self, file_path: Path | str, size: int, etag: str | None, part_size: int,
+                multipart_threshold: int | None = None) -> str:
+        """
+        SAME, DIFFERENT_SIZE, DIFFERENT_CONTENT or UNKNOWN for the local
+        file_path against an S3 object of size and etag. Sizes are compared
+        first, so a file is only hashed when the sizes match. Unequal ETags
+        only count as DIFFERENT_CONTENT when both are single-part MD5s.
+        """
+        local_size = os.path.getsize(file_path)
+        if local_size != size:
+            return DIFFERENT_SIZE
+        etag = normalize_etag(etag)
+        if not etag:
+            return UNKNOWN
+        file_hash = self.get(file_path, part_size, multipart_threshold)
+        if etag == file_hash.etag or (is_single_part(etag) and etag == file_hash.md5):
+            return SAME
+        if is_single_part(etag) and is_single_part(file_hash.etag):
+            return DIFFERENT_CONTENT
+        # a multipart ETag depends on the part size, which the ETag doesn't record; objects uploaded
+        # before the threshold or part size last changed can't be shown to differ
+        return UNKNOWN
+
+    def prune(self) -> None:
+        """Forget files that no longer exist."""
+        with self._lock:
+            gone = [key for key in self._hashes if not os.path.exists(key)]
+            for key in gone:
+                del self._hashes[key]
+            self._dirty = self._dirty or bool(gone)
+
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with self.path.open("r", encoding="utf-8") as file:
+                hashes = {key: FileHash(**value) for key, value in json.load(file).items()}
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable hash cache {self.path}: {e}")
+            return
+        with self._lock:
+            self._hashes = hashes
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {key: asdict(value) for key, value in self._hashes.items()}
+            self._dirty = False
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with tmp_path.open("w", encoding="utf-8") as file:
+                json.dump(data, file)  # type: ignore
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save hash cache {self.path}: {e}")
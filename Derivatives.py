@@ -0,0 +1,195 @@
+"""
+Module: Derivatives.py
+
+Smaller copies of library images, so that showing or rating an image
+doesn't mean decoding the full-size original every time. Next to each
+theme directory's images is a .derived directory with one subdirectory per
+target size, e.g.
+
+    image_out/creative/.derived/1920x1080/20250219T171207.jpg
+    image_out/creative/.derived/320x320/20250219T171207.jpg
+
+Derivatives are named by the image's timestamp prefix, so they survive the
+image being renamed when it is rated. One is only used while it is at
+least as new as its image. ImageGenerator writes a screen-size derivative
+and a thumbnail for every image it generates; for the rest of the library,
+run the backfill:
+
+    python Derivatives.py image_out --size 1920x1080 --size 320x320
+"""
+import argparse
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from PIL import Image
+
+from ImageLoader import fit_size, load_for_display
+from LibraryIndex import PREFIX_LEN, is_image_name
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR_NAME = ".derived"
+DERIVED_EXTENSION = ".jpg"  # JPEG decodes fastest, and at reduced scale (see ImageLoader)
+DERIVED_QUALITY = 90
+DEFAULT_THUMBNAIL_SIZE = (320, 320)
+
+PREFIX_PATTERN = re.compile(r'\d{8}T\d{6}')
+
+
+def parse_size(text: str) -> tuple[int, int]:
+    """'1920x1080' -> (1920, 1080)"""
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def size_dir_name(size: tuple[int, int]) -> str:
+    return f"{size[0]}x{size[1]}"
+
+
+def derivative_path(image_path: Path | str, size: tuple[int, int]) -> Path:
+    """Where the derivative of image_path fitted to size lives, whether or not it exists."""
+    image_path = Path(image_path)
+    name = image_path.name
+    key = name[:PREFIX_LEN] if PREFIX_PATTERN.match(name) else image_path.stem
+    return image_path.parent / DERIVED_DIR_NAME / size_dir_name(size) / f"{key}{DERIVED_EXTENSION}"
+
+
+def is_fresh(derived_path: Path, image_path: Path | str) -> bool:
+    """True if derived_path exists and is no older than image_path."""
+    try:
+        return derived_path.stat().st_mtime >= os.stat(image_path).st_mtime
+    except OSError:
+        return False
+
+
+def derived_sizes(image_dir: Path | str) -> list[tuple[int, int]]:
+    """The sizes derivatives have been made for in image_dir, smallest first."""
+    sizes = []
+    try:
+        with os.scandir(Path(image_dir, DERIVED_DIR_NAME)) as entries:
+            for entry in entries:
+                try:
+                    sizes.append(parse_size(entry.name))
+                except ValueError:
+                    continue
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    return sorted(sizes, key=lambda size: size[0] * size[1])
+
+
+def find_derivative(image_path: Path | str, target_size: tuple[int, int]) -> Path | None:
+    """
+    The smallest fresh derivative of image_path that is at least target_size
+    in both dimensions, so scaling it to fit target_size loses nothing over
+    scaling the original; None if there isn't one.
+    """
+    image_path = Path(image_path)
+    for size in derived_sizes(image_path.parent):
+        if size[0] >= target_size[0] and size[1] >= target_size[1]:
+            candidate = derivative_path(image_path, size)
+            if is_fresh(candidate, image_path):
+                return candidate
+    return None
+
+
+def display_source(image_path: Path | str, target_size: tuple[int, int] | None) -> Path:
+    """What to decode to show image_path at target_size: a derivative if one fits, else the image itself."""
+    if target_size is None:
+        return Path(image_path)
+    return find_derivative(image_path, target_size) or Path(image_path)
+
+
+def write_derivatives(image_path: Path | str, sizes: list[tuple[int, int]],
+                      resample: Image.Resampling = Image.Resampling.LANCZOS) -> list[Path]:
+    """
+    Write a derivative of image_path for each of sizes, decoding the image
+    only once. Returns the paths written. Top-level so it can run in a
+    process pool.
+    """
+    image_path = Path(image_path)
+    sizes = sorted(set(sizes), key=lambda size: size[0] * size[1], reverse=True)
+    if not sizes:
+        return []
+    # Decode at the size of the box that contains all the others, but never scale up
+    box = (max(s[0] for s in sizes), max(s[1] for s in sizes))
+    with Image.open(image_path) as src:
+        fits = src.width <= box[0] and src.height <= box[1]
+    img = load_for_display(image_path, None if fits else box, resample)
+    written = []
+    for size in sizes:
+        fitted = fit_size(size[0], size[1], img.width, img.height)
+        derived = img if fitted == img.size or fitted[0] > img.width else img.resize(fitted, resample)
+        path = derivative_path(image_path, size)
+        part_path = path.with_name(path.name + ".part")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            derived.save(part_path, format="JPEG", quality=DERIVED_QUALITY)
+            os.replace(part_path, path)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        written.append(path)
+    return written
+
+
+def remove_derivatives(image_path: Path | str) -> None:
+    """Delete every derivative of image_path, e.g. when the image itself is deleted."""
+    image_path = Path(image_path)
+    for size in derived_sizes(image_path.parent):
+        derivative_path(image_path, size).unlink(missing_ok=True)
+
+
+def missing_derivatives(root_dir: Path | str,
+                        sizes: list[tuple[int, int]]) -> list[tuple[Path, list[tuple[int, int]]]]:
+    """(image, sizes it lacks a fresh derivative for) for every image in the theme directories under root_dir."""
+    missing = []
+    with os.scandir(root_dir) as themes:
+        theme_dirs = [entry.path for entry in themes if entry.is_dir() and not entry.name.startswith('.')]
+    for theme_dir in sorted(theme_dirs):
+        with os.scandir(theme_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not is_image_name(entry.name):
+                    continue
+                image_path = Path(entry.path)
+                needed = [size for size in sizes if not is_fresh(derivative_path(image_path, size), image_path)]
+                if needed:
+                    missing.append((image_path, needed))
+    return missing
+
+
+def backfill(root_dir: Path | str, sizes: list[tuple[int, int]], workers: int | None = None) -> int:
+    """Write the missing derivatives for the whole library on a process pool; returns the images done."""
+    missing = missing_derivatives(root_dir, sizes)
+    if not missing:
+        logger.info(f"All derivatives under {root_dir} are up to date")
+        return 0
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(write_derivatives, image_path, needed): image_path for image_path, needed in missing}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                logger.warning(f"Failed to make derivatives of {futures[future]}: {e}")
+    logger.info(f"Made derivatives for {done} of {len(missing)} images under {root_dir}")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build missing display and thumbnail derivatives.")
+    parser.add_argument("root_dir", nargs="?", default="image_out", help="the library, e.g. image_out")
+    parser.add_argument("--size", action="append", type=parse_size, dest="sizes",
+                        help="a target size such as 1920x1080; may be repeated")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use; defaults to one per core")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sizes = args.sizes or [(1920, 1080), DEFAULT_THUMBNAIL_SIZE]
+    backfill(args.root_dir, sizes, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Module: GenerationBuffer.py
+
+A look-ahead buffer of already-generated images. The app keeps up to
+prefetch_depth images generated, decoded and pre-scaled ahead of time so
+that when the display duration expires the swap is instant, rather than
+waiting out a full round of prompt embellishment and image generation.
+
+Entries are journaled to disk so images that were paid for but not yet
+shown survive a restart. Each entry is tagged with the theme that produced
+it; entries for a theme other than the active one are never handed out.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+from PIL import Image
+
+from RenderCache import PreparedImage, prepare_image
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BufferedImage:
+    image_path: str
+    prompt_path: str
+    theme_name: str
+    created: float
+
+
+class GenerationBuffer:
+    JOURNAL_FILE_NAME: str = "generation_buffer.json"
+
+    def __init__(self, journal_path: str = JOURNAL_FILE_NAME):
+        self.journal_path = Path(journal_path)
+        self._entries: deque[BufferedImage] = deque()
+        self._prepared: dict[str, Future] = {}
+        self._decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="BufferDecoder")
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        """Restore entries from the journal, dropping any whose image has since vanished."""
+        if not self.journal_path.exists():
+            return
+        try:
+            with self.journal_path.open("r", encoding="utf-8") as file:
+                raw_entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable generation buffer journal {self.journal_path}: {e}")
+            return
+        with self._lock:
+            self._entries = deque(
+                BufferedImage(**item) for item in raw_entries if Path(item["image_path"]).exists()
+            )
+        logger.info(f"Restored {len(self._entries)} buffered images from {self.journal_path}")
+
+    def save(self) -> None:
+        """Write the journal atomically so a crash never leaves it half written."""
+        with self._lock:
+            data = [asdict(entry) for entry in self._entries]
+        tmp_path = self.journal_path.with_name(self.journal_path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as file:
+            json.dump(data, file, indent=4)  # type: ignore
+        os.replace(tmp_path, self.journal_path)
+
+    def push(self, image_path: Path, prompt_path: Path, theme_name: str) -> BufferedImage:
+        entry = BufferedImage(image_path=str(image_path), prompt_path=str(prompt_path),
+                              theme_name=theme_name, created=time.time())
+        with self._lock:
+            self._entries.append(entry)
+        self.save()
+        return entry
+
+    def count(self, theme_name: str) -> int:
+        with self._lock:
+            return sum(1 for entry in self._entries if entry.theme_name == theme_name)
+
+    def image_paths(self) -> set[str]:
+        """Paths of every buffered image, which retention must not delete."""
+        with self._lock:
+            return {entry.image_path for entry in self._entries}
+
+    def flush_other_themes(self, theme_name: str) -> int:
+        """
+        Forget entries made for a theme other than theme_name. The files stay
+        in the library; they just won't be shown as "new" images.
+        :return: the number of entries dropped
+        """
+        with self._lock:
+            keep = deque(entry for entry in self._entries if entry.theme_name == theme_name)
+            dropped = [entry for entry in self._entries if entry.theme_name != theme_name]
+            self._entries = keep
+            for entry in dropped:
+                self._prepared.pop(entry.image_path, None)
+        if dropped:
+            logger.info(f"Flushed {len(dropped)} buffered images not in theme '{theme_name}'")
+            self.save()
+        return len(dropped)
+
+    def prepare(self, canvas_size: tuple[int, int], bkgd_rgb: tuple[int, int, int],
+                resample: Image.Resampling = Image.Resampling.LANCZOS) -> None:
+        """Decode and pre-scale, in the background, every entry not already prepared for this canvas."""
+        with self._lock:
+            for entry in self._entries:
+                future = self._prepared.get(entry.image_path)
+                if future is not None and not self._is_stale(future, canvas_size, bkgd_rgb):
+                    continue
+                self._prepared[entry.image_path] = self._decoder.submit(
+                    prepare_image, Path(entry.image_path), canvas_size, bkgd_rgb, resample)
+
+    def pop(self, theme_name: str) -> tuple[BufferedImage, PreparedImage | None] | None:
+        """
+        Take the oldest entry for theme_name. The PreparedImage is returned if
+        the background decode has finished; otherwise None and the caller
+        decodes it itself.
+        """
+        while True:
+            with self._lock:
+                entry = next((e for e in self._entries if e.theme_name == theme_name), None)
+                if entry is None:
+                    return None
+                self._entries.remove(entry)
+                future = self._prepared.pop(entry.image_path, None)
+            self.save()
+            if not Path(entry.image_path).exists():
+                logger.warning(f"Buffered image {entry.image_path} is gone; skipping it")
+                continue
+            prepared = future.result() if future is not None and future.done() else None
+            return entry, prepared
+
+    def shutdown(self) -> None:
+        self._decoder.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _is_stale(future: Future, canvas_size: tuple[int, int], bkgd_rgb: tuple[int, int, int]) -> bool:
+        if not future.done():
+            return False
+        prepared = future.result()
+        # a file that failed to decode will fail again; leave it for pop() to report
+        return prepared is not None and not prepared.matches(canvas_size, bkgd_rgb)
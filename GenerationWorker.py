@@ -0,0 +1,148 @@
+"""
+Module: GenerationWorker.py
+
+Runs image generation (prompt embellishment, the DALL·E request, the download
+and saving to disk) on a background thread so the Tk main loop stays
+responsive. Finished images and prompts are queued for upload to S3 in the
+UploadOutbox, which uploads them in the background. Jobs go in through
+submit(); finished results come back through a thread-safe queue that the
+Tk loop drains with poll() from an after() callback.
+"""
+import itertools
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from ImageGenerator import ImageGenerator
+from UploadOutbox import UploadOutbox
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GenerationJob:
+    job_id: int
+    screen_xy: tuple[int, int]
+    output_dir: str
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+
+@dataclass
+class GenerationResult:
+    job_id: int
+    image_path: Path | None = None
+    prompt_path: Path | None = None
+    theme_name: str | None = None
+    error: Exception | None = None
+
+
+class GenerationWorker:
+    """
+    A single background thread that generates images one job at a time.
+    The thread is a daemon so a job stuck in a network call can never keep
+    the app from exiting; shutdown() cancels whatever is queued or running.
+    """
+
+    def __init__(self, image_generator: ImageGenerator, upload_outbox: UploadOutbox | None = None):
+        self.image_generator = image_generator
+        self.upload_outbox = upload_outbox
+        self._jobs: queue.Queue[GenerationJob | None] = queue.Queue()
+        self._results: queue.Queue[GenerationResult] = queue.Queue()
+        self._job_ids = itertools.count(1)
+        self._active: dict[int, GenerationJob] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="GenerationWorker", daemon=True)
+        self._thread.start()
+
+    def submit(self, screen_xy: tuple[int, int], output_dir: str) -> GenerationJob:
+        """Queue a generation job; returns the job so the caller can cancel it."""
+        self.start()
+        job = GenerationJob(job_id=next(self._job_ids), screen_xy=screen_xy, output_dir=output_dir)
+        with self._lock:
+            self._active[job.job_id] = job
+        self._jobs.put(job)
+        logger.info(f"Queued generation job {job.job_id}")
+        return job
+
+    def poll(self) -> list[GenerationResult]:
+        """Non-blocking; returns every result that has finished since the last poll."""
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    @property
+    def num_pending(self) -> int:
+        """Jobs queued or running that have not been cancelled."""
+        with self._lock:
+            return sum(1 for job in self._active.values() if not job.cancelled)
+
+    def cancel_all(self) -> None:
+        with self._lock:
+            for job in self._active.values():
+                job.cancel()
+
+    def shutdown(self, timeout: float = 1.0) -> None:
+        """Cancel all jobs and stop the worker thread. Does not wait on a job stuck in the network."""
+        self.cancel_all()
+        self._jobs.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                if job.cancelled:
+                    logger.info(f"Generation job {job.job_id} cancelled before it started")
+                    continue
+                result = self._generate(job)
+                if job.cancelled:
+                    logger.info(f"Generation job {job.job_id} cancelled; discarding result")
+                    continue
+                self._results.put(result)
+            finally:
+                with self._lock:
+                    self._active.pop(job.job_id, None)
+
+    def _generate(self, job: GenerationJob) -> GenerationResult:
+        try:
+            image_path, prompt_path = self.image_generator.generate_image(job.screen_xy, job.output_dir)
+            theme_name = self.image_generator.prompt_generator.get_theme_name()
+        except Exception as e:
+            logger.error(e, stack_info=True, exc_info=True)
+            return GenerationResult(job_id=job.job_id, error=e)
+
+        logger.info(f"Generation job {job.job_id} wrote {image_path}")
+        if theme_name:
+            theme_name = theme_name.replace(".yaml", "")
+        if self.upload_outbox is not None and not job.cancelled:
+            self._upload_outputs(theme_name, image_path, prompt_path)
+        return GenerationResult(job_id=job.job_id, image_path=image_path, prompt_path=prompt_path,
+                                theme_name=theme_name)
+
+    def _upload_outputs(self, theme_name: str | None, image_path: Path, prompt_path: Path) -> None:
+        for path in (image_path, prompt_path):
+            s3_key = f"{theme_name}/{os.path.basename(path)}" if theme_name else os.path.basename(path)
+            logger.info(f"Queueing upload to S3 at {s3_key}")
+            self.upload_outbox.enqueue(path, s3_key)
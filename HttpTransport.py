@@ -0,0 +1,108 @@
+"""
+Module: HttpTransport.py
+
+One keep-alive HTTP connection pool for the whole app. The OpenAI clients
+in PromptGenerator and ImageGenerator are built on its httpx.Client, and
+image downloads go through it too, so connections (and their TLS sessions)
+to the same host are reused instead of being set up for every request.
+
+Connection setup is counted through httpx's trace extension, which is what
+stats() reports: requests sent, new TCP connections, TLS handshakes and the
+share of requests that reused an open connection.
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class HttpTransport:
+    def __init__(self, max_connections: int = 4, keepalive_expiry: float = 60.0,
+                 connect_timeout: float = 10.0, read_timeout: float = 60.0):
+        """
+        :param max_connections: pool size; connections beyond this wait for a free one
+        :param keepalive_expiry: seconds an idle connection is kept open
+        :param connect_timeout: seconds allowed to open a connection
+        :param read_timeout: default seconds allowed between bytes received; callers
+        usually pass their own per-request timeout
+        """
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._connections = 0
+        self._tls_handshakes = 0
+        self.client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=keepalive_expiry),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            follow_redirects=True,
+            event_hooks={"request": [self._on_request]})
+
+    @staticmethod
+    def from_config(config) -> "HttpTransport":
+        return HttpTransport(
+            max_connections=int(config.get("http_max_connections", 4)),
+            keepalive_expiry=float(config.get("http_keepalive_seconds", 60)),
+            connect_timeout=float(config.get("http_connect_timeout_seconds", 10)),
+            read_timeout=float(config.get("request_timeout_seconds", 60)))
+
+    def timeout(self, seconds: float) -> httpx.Timeout:
+        """A per-request timeout of seconds that keeps the pool's connect timeout."""
+        connect = self.client.timeout.connect
+        return httpx.Timeout(seconds, connect=min(connect, seconds) if connect is not None else seconds)
+
+    def get(self, url: str, timeout: float | None = None) -> httpx.Response:
+        """GET url, raising httpx.HTTPStatusError for an error response."""
+        response = self.client.get(url, timeout=self.timeout(timeout) if timeout is not None else
+                                   httpx.USE_CLIENT_DEFAULT)
+        response.raise_for_status()
+        return response
+
+    def download(self, url: str, dest_path: Path | str, timeout: float | None = None,
+                 chunk_size: int = 64 * 1024) -> int:
+        """
+        Stream url into dest_path chunk by chunk, never holding the whole body
+        in memory. On any error dest_path is removed. Returns the bytes written.
+        """
+        written = 0
+        try:
+            with self.client.stream("GET", url, timeout=self.timeout(timeout) if timeout is not None else
+                                    httpx.USE_CLIENT_DEFAULT) as response:
+                response.raise_for_status()
+                with open(dest_path, "wb") as file:
+                    for chunk in response.iter_bytes(chunk_size):
+                        file.write(chunk)
+                        written += len(chunk)
+        except BaseException:
+            Path(dest_path).unlink(missing_ok=True)
+            raise
+        return written
+
+    def close(self) -> None:
+        self.client.close()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            requests, connections, handshakes = self._requests, self._connections, self._tls_handshakes
+        return {
+            "requests": requests,
+            "connections": connections,
+            "tls_handshakes": handshakes,
+            "reuse_ratio": round(1.0 - connections / requests, 3) if requests else 0.0,
+        }
+
+    def _on_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self._requests += 1
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self._connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self._tls_handshakes += 1
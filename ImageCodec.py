@@ -0,0 +1,101 @@
+"""
+Module: ImageCodec.py
+
+How generated images are stored on disk (and so in S3). The image service
+returns PNGs of several MB each; storage_format in the config can have them
+re-encoded as WebP or JPEG instead, which are a fraction of the size:
+
+    "storage_format": "webp",   # png | webp | jpeg
+    "storage_quality": 90,      # 1-100, for webp and jpeg
+    "storage_effort": 4         # null for the encoder's default; png 0-9, webp 0-6, jpeg >0 optimizes
+
+With the default of png and no storage_effort, the service's bytes are kept
+exactly as they were downloaded. Encoding is done by ImageGenerator, which
+runs on the GenerationWorker thread, never on the Tk main loop.
+"""
+import logging
+import mimetypes
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# storage_format -> (Pillow format, file extension)
+STORAGE_FORMATS: dict[str, tuple[str, str]] = {
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+}
+DEFAULT_STORAGE_FORMAT = "png"
+
+mimetypes.add_type("image/webp", ".webp")  # missing from older mimetypes tables
+
+
+def content_type(path: Path | str) -> str:
+    """The MIME type for a stored file, e.g. 'image/webp'; 'application/octet-stream' if unknown."""
+    return mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+
+
+@dataclass(frozen=True)
+class StorageCodec:
+    format: str = DEFAULT_STORAGE_FORMAT
+    quality: int = 90
+    effort: int | None = None  # None leaves the encoder's default
+
+    def __post_init__(self):
+        if self.format not in STORAGE_FORMATS:
+            raise ValueError(f"Unknown storage_format '{self.format}'; expected one of {', '.join(STORAGE_FORMATS)}")
+
+    @staticmethod
+    def from_config(config) -> "StorageCodec":
+        effort = config.get("storage_effort")
+        return StorageCodec(
+            format=str(config.get("storage_format", DEFAULT_STORAGE_FORMAT)).lower(),
+            quality=min(max(int(config.get("storage_quality", 90)), 1), 100),
+            effort=int(effort) if effort is not None else None)
+
+    @property
+    def extension(self) -> str:
+        return STORAGE_FORMATS[self.format][1]
+
+    def save_options(self) -> dict:
+        """Keyword arguments for Image.save."""
+        if self.format == "png":
+            return {} if self.effort is None else {"compress_level": min(max(self.effort, 0), 9)}
+        if self.format == "webp":
+            options = {"quality": self.quality}
+            if self.effort is not None:
+                options["method"] = min(max(self.effort, 0), 6)
+            return options
+        return {"quality": self.quality, "optimize": bool(self.effort)}
+
+    def encode_image(self, img: Image.Image, dest_path: Path | str) -> None:
+        """Write img to dest_path in this codec's format."""
+        if self.format == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(dest_path, format=STORAGE_FORMATS[self.format][0], **self.save_options())
+
+    def encode(self, src_path: Path) -> Path:
+        """
+        Re-encode the image at src_path in this codec's format, next to it and
+        with this codec's extension, then remove src_path. Returns the new
+        path, or src_path itself when it is already stored as wanted.
+        """
+        if src_path.suffix.lower() == self.extension and self.effort is None and self.format == "png":
+            return src_path
+        dest_path = src_path.with_suffix(self.extension)
+        part_path = dest_path.with_name(dest_path.name + ".part")
+        try:
+            with Image.open(src_path) as img:
+                self.encode_image(img, part_path)
+            os.replace(part_path, dest_path)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        if dest_path != src_path:
+            src_path.unlink(missing_ok=True)
+        logger.debug(f"Stored {src_path.name} as {self.format}: {dest_path.stat().st_size} bytes")
+        return dest_path
@@ -4,16 +4,27 @@ Module: image_generator.py
 This module defines a class `ImageGenerator` that generates images using OpenAI's DALL·E model.
 It constructs prompts from the `PromptGenerator` and fetches images accordingly.
 """
+import base64
+import logging
 import os.path
 from datetime import datetime
-from io import BytesIO
 from pathlib import Path
 
-import requests
-from PIL import Image
 from openai import OpenAI
 
+from Derivatives import DEFAULT_THUMBNAIL_SIZE, parse_size, write_derivatives
+from HttpTransport import HttpTransport
+from ImageCodec import StorageCodec
+from ImageLoader import sniff_image_extension
 from PromptGenerator import PromptGenerator
+from PromptPool import PromptPool
+from Resilience import Resilience
+
+IMAGE_SERVICE = "openai.images"  # circuit breaker names
+DOWNLOAD_SERVICE = "image_download"
+PART_SUFFIX = ".part"  # an image still being written
+
+logger = logging.getLogger(__name__)
 
 class ImGenError(Exception):
     def __init__(self, message: str="An Error Occurred", prompt: str=None):
@@ -27,20 +38,32 @@ class ImageGenerator:
     It integrates a `PromptGenerator` to construct creative prompts and fetches images accordingly.
     """
 
-    def __init__(self, prompt_generator: PromptGenerator, api_key):
+    def __init__(self, prompt_generator: PromptGenerator, api_key, prompt_pool: PromptPool | None = None,
+                 resilience: Resilience | None = None, transport: HttpTransport | None = None):
         """
         Initializes the ImageGenerator with OpenAI API client and a PromptGenerator instance.
+        Given a PromptPool, pre-embellished prompts are used when one is available.
+        resilience and transport default to the prompt generator's, so both share
+        circuit breakers and one connection pool.
         """
-        self.client = OpenAI(api_key=api_key)
+        self.resilience = resilience or prompt_generator.resilience
+        self.transport = transport or prompt_generator.transport
+        # retries are done by self.resilience, per its policy
+        self.client = OpenAI(api_key=api_key, timeout=self.resilience.timeout, max_retries=0,
+                             http_client=self.transport.client)
         self.prompt_generator = prompt_generator
+        self.prompt_pool = prompt_pool
 
-    def get_image_from_service(self, prompt: str, port_xy: tuple[int, int]) -> Image:
+    def get_image_from_service(self, prompt: str, port_xy: tuple[int, int], dest_stem: Path) -> Path:
         """
-        Sends the prompt and fetches an image from OpenAI's DALL·E service.
+        Sends the prompt to OpenAI's DALL·E service and saves the image it
+        returns, byte for byte, without decoding it.
 
         :param prompt: The image prompt to send.
         :param port_xy: The size of the target viewport (width, height).
-        :return: A PIL Image object or None on error. Will raise an ImGenError if error.
+        :param dest_stem: Where to save the image, without an extension; the
+        extension is chosen from the image data.
+        :return: The Path to the saved image. Will raise an ImGenError if error.
         """
         # Define image size based on aspect ratio
         if port_xy[0] == port_xy[1]:
@@ -50,27 +73,48 @@ class ImageGenerator:
         else:
             img_siz = "1024x1792"
 
+        # b64_json returns the image in the response itself, saving a second round trip
+        response_format = self.prompt_generator.config_mgr.current.get("image_response_format", "b64_json")
+
         # https://cookbook.openai.com/examples/dalle/image_generations_edits_and_variations_with_dall-e
         try:
-            response = self.client.images.generate(
+            response = self.resilience.call(IMAGE_SERVICE, lambda timeout: self.client.images.generate(
                 model="dall-e-3",  # Choose between "dall-e-3" or "dall-e-2"
                 prompt=prompt,
                 size=img_siz,  # type: ignore
                 quality="standard",  # Options: "hd", "standard"
                 n=1,
-            )
-            image_url = response.data[0].url
+                response_format=response_format,  # type: ignore
+                timeout=timeout
+            ))
+            image_data = response.data[0]
         except Exception as e:
             raise  ImGenError(message="Error fetching image url", prompt=prompt) from e
 
-        # Download and convert the image
-        try:
-            response = requests.get(image_url)
-            img = Image.open(BytesIO(response.content))
-        except Exception as e:
-            raise  ImGenError(message=f"Error fetching from {image_url}", prompt=prompt) from e
-
-        return img
+        # Write to a temporary file next to the destination, then rename it into place
+        part_path = dest_stem.with_name(dest_stem.name + PART_SUFFIX)
+        if image_data.b64_json:
+            try:
+                with open(part_path, "wb") as f:
+                    f.write(base64.b64decode(image_data.b64_json))
+            except (IOError, ValueError) as e:
+                part_path.unlink(missing_ok=True)
+                raise ImGenError(message=f"Error writing image to file {part_path}", prompt=prompt) from e
+        else:
+            try:
+                self.resilience.call(DOWNLOAD_SERVICE,
+                                     lambda timeout: self.transport.download(image_data.url, part_path, timeout))
+            except Exception as e:
+                raise  ImGenError(message=f"Error fetching from {image_data.url}", prompt=prompt) from e
+
+        with open(part_path, "rb") as f:
+            extension = sniff_image_extension(f.read(16))
+        if extension is None:
+            part_path.unlink(missing_ok=True)
+            raise ImGenError(message="Image service returned something that isn't an image", prompt=prompt)
+        img_path = dest_stem.with_name(dest_stem.name + extension)
+        os.replace(part_path, img_path)
+        return img_path
 
     def generate_image(self, port_xy: tuple[int, int] = (1024, 1024),
                        output_dir: str = "image_out") -> [Path, Path]:
@@ -83,18 +127,19 @@ class ImageGenerator:
         file or raise an ImGenError on error; second part is the Path to
         the saved prompt.
         """
-        # Generate local prompt data
-        prompt_data: dict[str, str] = self.prompt_generator.generate_prompt()
-
-        # Embellish the prompt using ChatGPT
-        embellished_prompt = self.prompt_generator.embellish_prompt(
-            prompt_data[PromptGenerator.FULL_PROMPT],
-            prompt_data[PromptGenerator.SYSTEM_PROMPT])
+        pooled = self.prompt_pool.take() if self.prompt_pool is not None else None
+        if pooled is not None:
+            # Already embellished in a batch; record the theme as generate_prompt() would
+            embellished_prompt = pooled.prompt
+            self.prompt_generator.most_recent_theme_used = pooled.theme_name
+        else:
+            # Generate local prompt data
+            prompt_data: dict[str, str] = self.prompt_generator.generate_prompt()
 
-        # Fetch the generated image
-        img: Image = self.get_image_from_service(embellished_prompt, port_xy)
-        if img is None:
-            raise  ImGenError(message="Image generation failed")
+            # Embellish the prompt using ChatGPT
+            embellished_prompt = self.prompt_generator.embellish_prompt(
+                prompt_data[PromptGenerator.FULL_PROMPT],
+                prompt_data[PromptGenerator.SYSTEM_PROMPT])
 
         # theme_name is used to name a subdirectory of image_out where the images
         # and prompts will be saved; this should be the name of the theme that
@@ -108,14 +153,27 @@ class ImageGenerator:
 
         # Save image and prompt to disk, prefixing with timestamp
         formatted_date = datetime.now().strftime("%Y%m%dT%H%M%S")
-        img_path = Path(output_dir, f"{formatted_date}_output_image.png")
         prompt_path = Path(output_dir, f"{formatted_date}_prompt.txt")
 
-        # Save image as PNG
+        # Fetch the generated image, saved as the service encoded it; it is
+        # only decoded when it is displayed, at screen resolution
+        img_path = self.get_image_from_service(embellished_prompt, port_xy,
+                                               Path(output_dir, f"{formatted_date}_output_image"))
+
+        # Re-encode in the configured storage format (a no-op for the default, png)
+        codec = StorageCodec.from_config(self.prompt_generator.config_mgr.current)
         try:
-            img.save(img_path)
-        except IOError as e:
-            raise  ImGenError(message=f"Error writing image to file {img_path}") from e
+            img_path = codec.encode(img_path)
+        except Exception as e:
+            raise ImGenError(message=f"Error storing {img_path} as {codec.format}", prompt=embellished_prompt) from e
+
+        # Screen-size and thumbnail derivatives (non-critical; the backfill can make them later)
+        thumbnail_size = self.prompt_generator.config_mgr.current.get("thumbnail_size")
+        try:
+            write_derivatives(img_path, [port_xy, parse_size(thumbnail_size) if thumbnail_size
+                                         else DEFAULT_THUMBNAIL_SIZE])
+        except Exception as e:
+            logger.warning(f"Failed to make derivatives of {img_path}: {e}")
 
         # Save prompt as text file (non-critical, but useful)
         try:
@@ -0,0 +1,72 @@
+"""
+Module: ImageLoader.py
+
+Loads images from disk already scaled for the screen, taking the cheapest
+decode path Pillow offers:
+- JPEGs are decoded at a reduced scale with Image.draft (DCT scaling), so
+  the full-resolution pixels never exist in memory.
+- Anything still at least twice the target size is shrunk with
+  Image.reduce, a fast box filter for integer factors.
+- A final resample with a configurable filter gets the exact fitted size.
+"""
+from pathlib import Path
+
+from PIL import Image
+
+RESAMPLE_FILTERS: dict[str, Image.Resampling] = {
+    "nearest": Image.Resampling.NEAREST,
+    "bilinear": Image.Resampling.BILINEAR,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+DEFAULT_RESAMPLE_FILTER = "lanczos"
+
+
+def sniff_image_extension(header: bytes) -> str | None:
+    """The file extension for encoded image bytes, judged by their signature; None if unknown."""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return ".webp"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    return None
+
+
+def fit_size(screen_w: int, screen_h: int, img_w: int, img_h: int) -> tuple[int, int]:
+    """Scale (img_w, img_h) to fit within (screen_w, screen_h), preserving aspect ratio."""
+    scale = min(screen_w / img_w, screen_h / img_h)
+    return max(1, int(img_w * scale)), max(1, int(img_h * scale))
+
+
+def resample_filter(name: str | None) -> Image.Resampling:
+    """Map a config value such as "bicubic" to a Pillow filter; unknown names get LANCZOS."""
+    return RESAMPLE_FILTERS.get((name or DEFAULT_RESAMPLE_FILTER).lower(), Image.Resampling.LANCZOS)
+
+
+def load_for_display(path: Path | str, target_size: tuple[int, int] | None = None,
+                     resample: Image.Resampling = Image.Resampling.LANCZOS) -> Image.Image:
+    """
+    Open the image at path and return it as RGB, scaled to fit within
+    target_size while preserving its aspect ratio. With no target_size the
+    image is returned at full resolution. Raises the usual Pillow/OS errors
+    if the file cannot be read.
+    """
+    with Image.open(str(path)) as src:
+        if target_size is None:
+            return src.convert("RGB")
+
+        fitted = fit_size(target_size[0], target_size[1], src.width, src.height)
+        if src.format == "JPEG" and fitted[0] < src.width:
+            # Decodes at 1/2, 1/4 or 1/8 scale, never smaller than fitted.
+            src.draft("RGB", fitted)
+        img = src.convert("RGB")
+
+    factor = min(img.width // fitted[0], img.height // fitted[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != fitted:
+        img = img.resize(fitted, resample)
+    return img
@@ -1,7 +1,7 @@
 import argparse
+import json
 import logging
 import os
-import random
 import sys
 import time
 import tkinter as tk
@@ -12,24 +12,61 @@ from PIL import Image, ImageTk
 from dotenv import load_dotenv
 
 from ConfigMgr import ConfigMgr
-from ImageGenerator import ImageGenerator, ImGenError
+from Derivatives import display_source
+from GenerationBuffer import GenerationBuffer
+from GenerationWorker import GenerationWorker
+from HttpTransport import HttpTransport
+from ImageGenerator import IMAGE_SERVICE, ImageGenerator
+from ImageLoader import fit_size, load_for_display, resample_filter
+from LibraryIndex import LibraryIndex
+from LocalPrefetcher import LocalPrefetcher
 from PromptGenerator import PromptGenerator
+from PromptPool import PromptPool
 from RatingManager import RatingManager  # our previously defined rating manager
+from RenderCache import PreparedImage, RenderCache, compose_frame, prepare_image
+from Resilience import Resilience
+from RetentionMgr import RetentionMgr, RetentionPolicy
 from S3Manager import S3Manager
+from S3Manifest import S3Manifest
+from SelectionEngine import SelectionEngine
+from UploadOutbox import UploadOutbox
 
 
 class ImagineImage:
     CONFIG_FILE = Path(ConfigMgr.LOCAL_CONFIG_FILE_NAME)
     RATING_INSTRUCTIONS = "Use numbers 1-5 to rate, ←/→ to navigate, X to exit."
     UPDATE_INTERVAL = 250
+    GENERATING_TEXT = "Generating…"
 
     def __init__(self):
         self.config_mgr = ConfigMgr()
-        self.config = self.config_mgr.load_config()
+        self.config = self.config_mgr.snapshot()
         api_key = os.environ["OPEN_AI_SECRET"]
-        self.prompt_generator = PromptGenerator(config_mgr=self.config_mgr, api_key=api_key)
-        self.image_generator = ImageGenerator(prompt_generator=self.prompt_generator, api_key=api_key)
-        self.s3_manager = S3Manager()
+        self.resilience = Resilience.from_config(self.config)
+        self.transport = HttpTransport.from_config(self.config)
+        self.prompt_generator = PromptGenerator(config_mgr=self.config_mgr, api_key=api_key,
+                                                resilience=self.resilience, transport=self.transport)
+        self.prompt_pool = None
+        if int(self.config.get("prompt_pool_size", 0)) > 0:
+            self.prompt_pool = PromptPool(self.prompt_generator, batch_size=int(self.config["prompt_pool_size"]),
+                                          low_water=int(self.config.get("prompt_pool_low_water", 1)))
+        self.image_generator = ImageGenerator(prompt_generator=self.prompt_generator, api_key=api_key,
+                                              prompt_pool=self.prompt_pool)
+        self.s3_manager = S3Manager(S3Manager.transfer_config_from(self.config),
+                                    manifest=S3Manifest.from_config(self.config))
+        self.upload_outbox = UploadOutbox.from_config(self.s3_manager, self.config)
+        self.generation_worker = GenerationWorker(self.image_generator, self.upload_outbox)
+        self.generation_buffer = GenerationBuffer()
+        self.awaiting_image = False  # timer expired but no buffered image was ready yet
+        self.generation_paused_until = 0.0  # back off after a failed generation
+        self.local_prefetcher = LocalPrefetcher()
+        self.library_index = LibraryIndex(self.config["save_directory_path"])
+        self.library_index.build()
+        self.retention_mgr = RetentionMgr(self.library_index, RetentionPolicy.from_config(self.config))
+        self.config_mgr.subscribe(RetentionPolicy.CONFIG_KEYS,
+                                  lambda old, new: self.retention_mgr.set_policy(RetentionPolicy.from_config(new)))
+        self.selection_engine: SelectionEngine | None = None
+        self.selection_key = None  # the config values selection_engine was built from
 
         # Initialize TKInter root and create display widgets.
         self.tk_root = tk.Tk()
@@ -48,6 +85,7 @@ class ImagineImage:
         self.image_canvas.focus_set()
         self.current_tk_image = None
         self.image_id = None
+        self.render_cache = RenderCache()
 
         # Create an overlay text item on the canvas.
         # This text item can be updated later via itemconfig().
@@ -69,6 +107,7 @@ class ImagineImage:
 
         # Normal mode variables.
         self.current_image = None  # holds a PIL Image for normal mode
+        self.current_prepared: PreparedImage | None = None  # pre-scaled frame for current_image, if any
         self.last_image_time = None  # sentinel value; None == starting up
 
         # Rating mode variables.
@@ -79,30 +118,14 @@ class ImagineImage:
         self.tk_root.bind("<Key>", self.on_key)
 
     def parse_display_duration(self) -> int:
-        try:
-            duration_str: str = self.config["display_duration"]
-            parts = [int(p) for p in duration_str.split(":")]
-            while len(parts) < 3:
-                parts.insert(0, 0)
-            return parts[0] * 3600 + parts[1] * 60 + parts[2]
-        except ValueError:
-            return 3600
-
-    def delete_oldest_files(self, directory: str, min_files: int = 50):
-        dir_path = Path(directory)
-        if not dir_path.exists() or not dir_path.is_dir():
-            raise ValueError(f"Invalid directory: {directory}")
-
-        files = sorted(dir_path.glob("*"), key=lambda f: f.stat().st_mtime)
-        if len(files) <= min_files:
-            return
+        return self.config.display_seconds
 
-        for file in files[:len(files) - min_files]:
-            try:
-                file.unlink()
-                logger.info(f"Deleted: {file}")
-            except Exception as e:
-                logger.warn(f"Failed to delete {file}: {e}")
+    def enforce_retention(self):
+        """Prune the library to the configured limits, sparing the image on screen and buffered images."""
+        keep = self.generation_buffer.image_paths()
+        if self.current_prepared is not None:
+            keep.add(str(self.current_prepared.source_path))
+        self.retention_mgr.enforce(keep)
 
     def on_canvas_configure(self, event):
         """
@@ -115,8 +138,7 @@ class ImagineImage:
         self.image_canvas.itemconfig(self.info_text_id, width=event.width - 20)
 
     def scale_image_to_fit_screen(self, screen_w: int, screen_h: int, img_w: int, img_h: int) -> tuple[int, int]:
-        scale = min(screen_w / img_w, screen_h / img_h)
-        return int(img_w * scale), int(img_h * scale)
+        return fit_size(screen_w, screen_h, img_w, img_h)
 
     def extract_rating(self, filename: Path) -> float:
         """
@@ -125,41 +147,60 @@ class ImagineImage:
         match = re.search(r'r\[(\d+\.\d+)\]', str(filename))
         return float(match.group(1)) if match else 0.0
 
-    def get_random_image_from_disk(self) -> Image.Image | None:
-        # Assume images to be rated are stored in: save_directory_path/<theme_dir>
-        self.config = self.config_mgr.load_config()
-
-        theme_dir = self.config["active_theme"].replace(".yaml", "")
-        image_dir = Path(self.config["save_directory_path"]) / theme_dir
-        if not (image_dir.exists() and image_dir.is_dir()):
-            logger.info(f"{image_dir} not found.")
-            return None
-        images = list(image_dir.glob("*.png")) + list(image_dir.glob("*.jpg")) + list(image_dir.glob("*.jpeg"))
-        if not images:
-            logger.info(f"No images found in {str(image_dir)}")
-            return None
-
+    def current_selection_engine(self) -> SelectionEngine:
+        """
+        The selection engine for the active theme. It is updated in place as the
+        library changes, and only rebuilt when the theme or a selection setting changes.
+        """
+        theme_dir = self.active_theme_dir()
         min_rating: float = float(self.config.get("minimum_rating_filter", 0.0))
-        # if min_rating is less than 1.0, do not filter
-        if min_rating < 1.0:
-            return self.get_image_from_disk(random.choice(images))
-
-        # find images of the given rating or above
-        filtered_images = [img for img in images if self.extract_rating(img) >= min_rating]
-        if len(filtered_images) == 0:
-            logger.warning(f"No images found with min rating of >= {min_rating} in {str(image_dir)}")
-            return self.get_image_from_disk(random.choice(images))
+        rating_weights: dict = dict(self.config.get("rating_weights", {}))
+        no_repeat_window = int(self.config.get("no_repeat_window", 0))
+        key = (theme_dir, min_rating, json.dumps(rating_weights, sort_keys=True), no_repeat_window)
+        if key != self.selection_key:
+            if self.selection_engine is not None:
+                self.library_index.unsubscribe(self.selection_engine.on_library_change)
+            self.selection_engine = SelectionEngine(rating_weights, min_rating, no_repeat_window, theme=theme_dir)
+            self.selection_engine.sync(self.library_index.records(theme_dir))
+            self.library_index.subscribe(self.selection_engine.on_library_change)
+            self.selection_key = key
+        return self.selection_engine
+
+    def choose_random_image_path(self, record: bool = True) -> Path | None:
+        """
+        Draw the next image for the active theme; with record False it only
+        counts as shown once passed to current_selection_engine().record_shown().
+        """
+        # Images are stored in: save_directory_path/<theme_dir>; see LibraryIndex
+        self.config = self.config_mgr.current
+        image_path = self.current_selection_engine().draw(record)
+        if image_path is None:
+            logger.info(f"No images found for theme {self.active_theme_dir()} in {self.library_index.root_dir}")
+            return None
+        return Path(image_path)
 
-        return self.get_image_from_disk(random.choice(filtered_images))
+    def get_random_image_from_disk(self) -> Image.Image | None:
+        image_path = self.choose_random_image_path()
+        return self.get_image_from_disk(image_path, self.canvas_size()) if image_path is not None else None
 
-    def get_image_from_disk(self, path_to_image_file: Path) -> Image.Image | None:
+    def get_image_from_disk(self, path_to_image_file: Path,
+                            target_size: tuple[int, int] | None = None) -> Image.Image | None:
+        """
+        Load an image as RGB. Given a target_size (usually the canvas size) it is
+        downscaled while decoding, which is much cheaper than decoding at full
+        resolution and resizing afterwards, and a derivative is decoded instead
+        of the original when one is big enough; see Derivatives.
+        """
         try:
-            pil_img = Image.open(str(path_to_image_file))
-            return pil_img.convert("RGB")
+            return load_for_display(display_source(path_to_image_file, target_size), target_size,
+                                    self.resample_filter())
         except Exception as e:
             logger.warning(f"Failed to load {path_to_image_file}: {e}")
             return None
 
+    def resample_filter(self) -> Image.Resampling:
+        return resample_filter(self.config.get("resample_filter"))
+
     @staticmethod
     def hex_to_rgb(hex_color: str) -> tuple[int, int, int]:
         hex_color = hex_color.lstrip('#')
@@ -168,38 +209,43 @@ class ImagineImage:
         b = int(hex_color[4:6], 16)
         return r, g, b
 
-    def display_image_tk(self, pil_img: Image.Image, bkgd_hex_color: str = "#000000") -> None:
-        """
-        Resize the given PIL image to fit within the current window while preserving
-        its aspect ratio, center it on a background of the given color, and update the canvas.
-        """
-        if pil_img is None:
-            logger.warn("display_image_tk: Received None image")
-            return
-
+    def canvas_size(self) -> tuple[int, int]:
         # Update idle tasks and get canvas dimensions.
         self.tk_root.update_idletasks()
         canvas_width = self.image_canvas.winfo_width()
         canvas_height = self.image_canvas.winfo_height()
         if canvas_width <= 1 or canvas_height <= 1:
             canvas_width, canvas_height = 800, 600
+        return canvas_width, canvas_height
 
-        # Create a background using Pillow.
-        r, g, b = ImagineImage.hex_to_rgb(bkgd_hex_color)
-        background = Image.new("RGB", (canvas_width, canvas_height), (r, g, b))
+    def display_image_tk(self, pil_img: Image.Image, bkgd_hex_color: str = "#000000",
+                         prepared: PreparedImage | None = None) -> None:
+        """
+        Resize the given PIL image to fit within the current window while preserving
+        its aspect ratio, center it on a background of the given color, and update the canvas.
+        The frame is only rebuilt when the image, the canvas size or the background
+        color has changed since the last call; see RenderCache. If prepared holds a
+        frame already composed for this image and canvas, it is used as-is.
+        """
+        if pil_img is None:
+            logger.warn("display_image_tk: Received None image")
+            return
 
-        # Calculate the new image dimensions while preserving aspect ratio.
-        orig_w, orig_h = pil_img.size
-        new_w, new_h = self.scale_image_to_fit_screen(canvas_width, canvas_height, orig_w, orig_h)
-        resized = pil_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        canvas_width, canvas_height = self.canvas_size()
+        render_key = self.render_cache.make_key(pil_img, (canvas_width, canvas_height), bkgd_hex_color)
+        if self.current_tk_image is not None and self.render_cache.is_current(render_key):
+            return
 
-        # Center the resized image on the background.
-        x_offset = (canvas_width - new_w) // 2
-        y_offset = (canvas_height - new_h) // 2
-        background.paste(resized, (x_offset, y_offset))
+        # Build the frame: the image scaled to fit and centered on the background.
+        bkgd_rgb = ImagineImage.hex_to_rgb(bkgd_hex_color)
+        if (prepared is not None and prepared.image is pil_img
+                and prepared.matches((canvas_width, canvas_height), bkgd_rgb)):
+            frame = prepared.frame
+        else:
+            frame = compose_frame(pil_img, (canvas_width, canvas_height), bkgd_rgb, self.resample_filter())
 
-        # Convert the background image to a PhotoImage.
-        tk_image = ImageTk.PhotoImage(background)
+        # Convert the frame to a PhotoImage.
+        tk_image = ImageTk.PhotoImage(frame)
         self.current_tk_image = tk_image  # Save a reference to prevent garbage collection.
 
         # Update or create the image item on the canvas.
@@ -210,6 +256,8 @@ class ImagineImage:
 
         # Ensure the overlay text remains on top.
         self.image_canvas.tag_raise(self.info_text_id)
+        self.render_cache.remember(render_key, pil_img)
+        logger.debug(f"Rendered frame {canvas_width}x{canvas_height}; render stats: {self.render_cache.stats()}")
 
     def update_image(self):
         """
@@ -233,52 +281,144 @@ class ImagineImage:
                 self.tk_root.after(500, self.update_image)
                 return
 
+        if self.config["local_files_only"]:
+            self.local_prefetcher.ensure(lambda: self.choose_random_image_path(record=False), self.canvas_size(),
+                                         self.config.background_rgb, self.resample_filter())
+        else:
+            self.collect_generation_results()
+            self.maintain_generation_buffer()
+
         min_display_duration = self.parse_display_duration()
         now = time.time()
-        if now - self.last_image_time >= min_display_duration or self.current_image is None:
-            logger.info("Timer expired; getting new image.")
-            self.config = self.config_mgr.load_config()
-            self.delete_oldest_files(self.config["save_directory_path"], int(self.config["max_num_saved_files"]))
-
-            if self.config["local_files_only"]:
-                self.current_image = self.get_random_image_from_disk()
+        timer_expired = now - self.last_image_time >= min_display_duration or self.current_image is None
+        if timer_expired and not self.awaiting_image:
+            logger.info(f"Timer expired; getting new image. Render stats: {self.render_cache.stats()}; "
+                        f"service stats: {self.resilience.metrics()}; HTTP stats: {self.transport.stats()}; "
+                        f"upload outbox: {self.upload_outbox.metrics()}")
+            self.config = self.config_mgr.current
+            self.enforce_retention()
+
+            nothing_coming = (not self.generation_available()
+                              and self.generation_buffer.count(self.active_theme_dir()) == 0)
+            if self.config["local_files_only"] or nothing_coming:
+                self.take_local_image()
+                self.last_image_time = now
             else:
-                output_file_info = None
-                self.image_canvas.itemconfig(self.info_text_id, text="")
-                screen_xy = (self.tk_root.winfo_screenwidth(), self.tk_root.winfo_screenheight())
-                try:
-                    output_file_info: [Path, Path] = self.image_generator.generate_image(
-                        screen_xy, self.config["save_directory_path"]
-                    )
-                    image_path: Path = output_file_info[0]
-                    prompt_path: Path = output_file_info[1]
-                    logger.info(f"New image from disk at {str(image_path)}")
-                    if image_path is not None:
-                        theme_name = self.prompt_generator.get_theme_name().replace(".yaml", "")
-                        s3_key_img = f"{theme_name}/{os.path.basename(image_path)}"
-                        logger.info(f"Saving image to S3 at {s3_key_img}")
-                        self.s3_manager.upload_to_s3(image_path, s3_key_img)
-                        s3_key_prompt = f"{theme_name}/{os.path.basename(prompt_path)}"
-                        logger.info(f"Saving prompt to S3 at {s3_key_prompt}")
-                        self.s3_manager.upload_to_s3(prompt_path, s3_key_prompt)
-                        self.current_image = self.get_image_from_disk(image_path)
-                except ImGenError as e:
-                    logger.error(e, stack_info=True, exc_info=True)
-                    self.image_canvas.itemconfig(self.info_text_id, text=str(e))
-            self.last_image_time = now
+                self.awaiting_image = True
+
+        if self.awaiting_image:
+            self.take_from_generation_buffer()
 
         if self.current_image:
-            self.display_image_tk(self.current_image, self.config["background_color"])
+            self.refresh_current_prepared()
+            self.display_image_tk(self.current_image, self.config["background_color"], self.current_prepared)
         self.tk_root.after(ms=self.UPDATE_INTERVAL, func=self.update_image)
 
+    def refresh_current_prepared(self):
+        """
+        Prepared images are decoded at canvas resolution, so after a resize
+        (e.g. toggling fullscreen) reload the current one from its file rather
+        than stretching the smaller copy.
+        """
+        canvas_size = self.canvas_size()
+        bkgd_rgb = self.config.background_rgb
+        if self.current_prepared is None or self.current_prepared.matches(canvas_size, bkgd_rgb):
+            return
+        refreshed = prepare_image(self.current_prepared.source_path, canvas_size, bkgd_rgb, self.resample_filter())
+        if refreshed is not None:
+            self.current_image = refreshed.image
+            self.current_prepared = refreshed
+
+    def take_local_image(self):
+        """Swap in the prefetched local image, or load one here if it isn't ready."""
+        canvas_size = self.canvas_size()
+        bkgd_rgb = self.config.background_rgb
+        prepared = self.local_prefetcher.take(canvas_size, bkgd_rgb)
+        if prepared is None:
+            image_path = self.choose_random_image_path(record=False)
+            if image_path is not None:
+                prepared = prepare_image(image_path, canvas_size, bkgd_rgb, self.resample_filter())
+        if prepared is not None:
+            self.current_image = prepared.image
+            self.current_prepared = prepared
+            self.current_selection_engine().record_shown(str(prepared.source_path))
+        logger.info(f"Local prefetch metrics: {self.local_prefetcher.metrics()}")
+
+    def active_theme_dir(self) -> str:
+        return self.config["active_theme"].replace(".yaml", "")
+
+    def maintain_generation_buffer(self):
+        """
+        Keep prefetch_depth images for the active theme generated and pre-scaled
+        ahead of time, submitting jobs to the background worker as needed.
+        """
+        self.config = self.config_mgr.current
+        theme_name = self.active_theme_dir()
+        self.generation_buffer.flush_other_themes(theme_name)
+        self.generation_buffer.prepare(self.canvas_size(), self.config.background_rgb,
+                                       self.resample_filter())
+
+        if not self.generation_available():
+            return
+        depth = int(self.config.get("prefetch_depth", 1))
+        wanted = max(depth, 1 if self.awaiting_image else 0)
+        missing = wanted - self.generation_buffer.count(theme_name) - self.generation_worker.num_pending
+        screen_xy = (self.tk_root.winfo_screenwidth(), self.tk_root.winfo_screenheight())
+        for _ in range(missing):
+            self.generation_worker.submit(screen_xy, self.config["save_directory_path"])
+
+    def generation_available(self) -> bool:
+        """False after a failed generation, or while the image service's circuit breaker is open."""
+        return time.time() >= self.generation_paused_until and self.resilience.is_available(IMAGE_SERVICE)
+
+    def take_from_generation_buffer(self):
+        """
+        Swap in the next buffered image, if there is one. Otherwise the current
+        image stays up, with an overlay, until a generation job finishes.
+        """
+        popped = self.generation_buffer.pop(self.active_theme_dir())
+        if popped is None:
+            self.image_canvas.itemconfig(self.info_text_id, text=self.GENERATING_TEXT)
+            return
+
+        entry, prepared = popped
+        logger.info(f"New image from disk at {entry.image_path}")
+        if prepared is None:
+            # the background decode hasn't finished; do it here
+            prepared = prepare_image(Path(entry.image_path), self.canvas_size(),
+                                     self.config.background_rgb, self.resample_filter())
+        if prepared is not None:
+            self.current_image = prepared.image
+            self.current_prepared = prepared
+        self.image_canvas.itemconfig(self.info_text_id, text="")
+        self.awaiting_image = False
+        self.last_image_time = time.time()
+
+    def collect_generation_results(self):
+        """Move finished generation jobs from the worker into the buffer; called from the Tk loop."""
+        for result in self.generation_worker.poll():
+            if result.error is not None:
+                self.image_canvas.itemconfig(self.info_text_id, text=str(result.error))
+                # wait out a full display period rather than retrying every tick
+                self.generation_paused_until = time.time() + self.parse_display_duration()
+                if self.awaiting_image:
+                    # show something from the library rather than the same image again
+                    self.take_local_image()
+                    self.awaiting_image = False
+                    self.last_image_time = time.time()
+                continue
+            self.library_index.add_file(result.image_path)
+            self.library_index.add_file(result.prompt_path)
+            self.generation_buffer.push(result.image_path, result.prompt_path, result.theme_name or "")
+
     def enter_rating_mode(self):
         """Switch to rating mode: initialize RatingManager and display the first unrated image."""
         self.image_canvas.itemconfig(self.info_text_id, text="")
         self.rating_mode = True
         # Initialize RatingManager with our S3 manager.
-        self.rating_manager = RatingManager(self.s3_manager)
+        self.rating_manager = RatingManager(self.s3_manager, self.library_index, self.upload_outbox)
         # Assume images to rate are stored under: save_directory_path/<active_theme without .yaml>
-        self.config_mgr.load_config()
+        self.config = self.config_mgr.current
         theme_dir = self.config["active_theme"].replace(".yaml", "")
         logger.info(f"Beginning to rate images from {theme_dir}")
         image_dir = str(Path(self.config["save_directory_path"]) / theme_dir)
@@ -306,7 +446,7 @@ class ImagineImage:
 
         current_file = self.rating_manager.rating_list[self.rating_manager.current_index]
         logger.info(f"Updating rating display with {current_file}")
-        pil_img = self.get_image_from_disk(Path(current_file))
+        pil_img = self.get_image_from_disk(Path(current_file), self.canvas_size())
         self.display_image_tk(pil_img, self.config["background_color"])
 
         # Update the info label with filename and current rating (if any).
@@ -349,7 +489,7 @@ class ImagineImage:
         else:
             # Normal mode key handling.
             if key == 'q':
-                self.tk_root.quit()
+                self.quit()
             elif key == 'r':
                 self.enter_rating_mode()
             elif key == 't':
@@ -390,8 +530,35 @@ class ImagineImage:
             self.tk_root.geometry(
                 f"{self.window_width}x{self.window_height}+{self.window_position[0]}+{self.window_position[1]}")
 
+    def quit(self):
+        """Cancel any in-flight generation and leave the Tk main loop."""
+        logger.info("Quitting.")
+        self.generation_worker.shutdown()
+        self.upload_outbox.close()
+        self.s3_manager.manifest.save()
+        if self.prompt_pool is not None:
+            self.prompt_pool.shutdown()
+        self.generation_buffer.shutdown()
+        self.local_prefetcher.shutdown()
+        self.library_index.stop_watcher()
+        self.config_mgr.stop_watcher()
+        self.transport.close()
+        self.tk_root.quit()
+
     def main(self):
-        self.config = self.config_mgr.load_config()
+        self.config = self.config_mgr.snapshot()
+        self.config_mgr.start_watcher()
+        self.tk_root.protocol("WM_DELETE_WINDOW", self.quit)
+        self.generation_worker.start()
+        self.upload_outbox.start()
+        if not self.config["local_files_only"] and not self.s3_manager.manifest.is_fresh():
+            # list the bucket now rather than on the first rating
+            self.s3_manager.refresh_manifest_in_background()
+        if self.prompt_pool is not None:
+            self.prompt_pool.start()
+            if not self.config["local_files_only"]:
+                self.prompt_pool.request_refill()
+        self.library_index.start_watcher()
         # Start the normal mode image update loop.
         self.tk_root.after(100, self.update_image)
         self.tk_root.mainloop()
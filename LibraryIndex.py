@@ -0,0 +1,395 @@
+"""
+Module: LibraryIndex.py
+
+An in-memory index of the image library under save_directory_path, one
+entry per image in each theme subdirectory (e.g. image_out/creative).
+It is built once with a single os.scandir pass per theme directory and then
+kept current incrementally, either by the app telling it about files it
+writes or renames, or by a watcher that rescans only the directories whose
+modification time changed.
+
+Per theme the index keeps compact parallel arrays (name, timestamp prefix,
+rating, size, mtime) plus a rating-sorted list, so choosing a random image
+above a rating floor or listing unrated images is a lookup rather than a
+directory scan. Listeners registered with subscribe() hear about every
+image added or removed, so structures built on top of the index can be
+updated in place.
+"""
+import bisect
+import logging
+import os
+import random
+import re
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+try:  # optional; without it we fall back to polling directory mtimes
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+IMAGE_EXTENSIONS = {'.png', '.webp', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff'}
+PROMPT_EXTENSION = '.txt'
+PREFIX_LEN = 15  # e.g. "20250219T171207"
+UNRATED = -1.0
+
+RATING_PATTERN = re.compile(r' r\[(\d\.\d)\]')
+
+
+def parse_rating(filename: str) -> float:
+    """The rating in a filename such as '20250219T171207_output_image r[3.0].png', else UNRATED."""
+    match = RATING_PATTERN.search(filename)
+    return float(match.group(1)) if match else UNRATED
+
+
+def is_image_name(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+
+@dataclass(frozen=True)
+class LibraryRecord:
+    theme: str
+    prefix: str
+    rating: float  # UNRATED if the file has no rating marker
+    image_path: str
+    prompt_path: str | None
+    size: int
+    mtime: float
+
+
+class _ThemeEntries:
+    """
+    Parallel arrays for one theme directory. Removal swaps the last slot into
+    the hole, so adds and deletes are O(1) apart from the sorted rating list.
+    """
+    __slots__ = ("names", "prefixes", "ratings", "sizes", "mtimes", "slots", "by_rating", "prompts")
+
+    def __init__(self):
+        self.names: list[str] = []
+        self.prefixes: list[str] = []
+        self.ratings = array('d')
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.slots: dict[str, int] = {}
+        self.by_rating: list[tuple[float, str]] = []  # sorted (rating, name)
+        self.prompts: dict[str, str] = {}  # prefix -> prompt filename
+
+    def add(self, name: str, size: int, mtime: float) -> None:
+        if name in self.slots:
+            self.remove(name)
+        rating = parse_rating(name)
+        self.slots[name] = len(self.names)
+        self.names.append(name)
+        self.prefixes.append(name[:PREFIX_LEN])
+        self.ratings.append(rating)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        bisect.insort(self.by_rating, (rating, name))
+
+    def remove(self, name: str) -> bool:
+        slot = self.slots.pop(name, None)
+        if slot is None:
+            return False
+        rating = self.ratings[slot]
+        last = len(self.names) - 1
+        if slot != last:
+            for column in (self.names, self.prefixes, self.ratings, self.sizes, self.mtimes):
+                column[slot] = column[last]
+            self.slots[self.names[slot]] = slot
+        for column in (self.names, self.prefixes, self.ratings, self.sizes, self.mtimes):
+            column.pop()
+        idx = bisect.bisect_left(self.by_rating, (rating, name))
+        if idx < len(self.by_rating) and self.by_rating[idx] == (rating, name):
+            del self.by_rating[idx]
+        return True
+
+
+class LibraryIndex:
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._themes: dict[str, _ThemeEntries] = {}
+        self._dir_mtimes: dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._watcher: threading.Thread | None = None
+        self._observer = None
+        self._stop = threading.Event()
+        self._listeners: list[Callable[[str, str, float | None], None]] = []
+
+    def subscribe(self, listener: Callable[[str, str, float | None], None]) -> None:
+        """
+        listener(theme, image_path, rating) is called after an image is added
+        or re-indexed; rating is None when the image was removed.
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[str, str, float | None], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, events: list[tuple[str, str, float | None]]) -> None:
+        for theme, name, rating in events:
+            path = os.path.join(self.root_dir, theme, name)
+            for listener in list(self._listeners):
+                try:
+                    listener(theme, path, rating)
+                except Exception as e:
+                    logger.warning(f"Library index listener failed for {path}: {e}")
+
+    # ----------------------------
+    # Building and refreshing
+    # ----------------------------
+    def build(self) -> None:
+        """Index every theme directory under root_dir from scratch."""
+        with self._lock:
+            self._themes.clear()
+            self._dir_mtimes.clear()
+            for theme in self._list_theme_dirs():
+                self.refresh_theme(theme)
+        logger.info(f"Indexed {sum(len(t.names) for t in self._themes.values())} images "
+                    f"in {len(self._themes)} themes under {self.root_dir}")
+
+    def refresh_theme(self, theme: str) -> None:
+        """Rescan one theme directory with a single os.scandir pass and apply the differences."""
+        theme_dir = os.path.join(self.root_dir, theme)
+        images: dict[str, tuple[int, float]] = {}
+        prompts: dict[str, str] = {}
+        try:
+            dir_mtime_ns = os.stat(theme_dir).st_mtime_ns
+            with os.scandir(theme_dir) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    if is_image_name(entry.name):
+                        stat = entry.stat()
+                        images[entry.name] = (stat.st_size, stat.st_mtime)
+                    elif entry.name.endswith(PROMPT_EXTENSION):
+                        prompts[entry.name[:PREFIX_LEN]] = entry.name
+        except FileNotFoundError:
+            with self._lock:
+                entries = self._themes.pop(theme, None)
+                self._dir_mtimes.pop(theme_dir, None)
+            if entries is not None:
+                self._notify([(theme, name, None) for name in entries.names])
+            return
+
+        events = []
+        with self._lock:
+            entries = self._themes.setdefault(theme, _ThemeEntries())
+            for name in [n for n in entries.names if n not in images]:
+                entries.remove(name)
+                events.append((theme, name, None))
+            for name, (size, mtime) in images.items():
+                slot = entries.slots.get(name)
+                if slot is None or entries.sizes[slot] != size or entries.mtimes[slot] != mtime:
+                    entries.add(name, size, mtime)
+                    events.append((theme, name, parse_rating(name)))
+            entries.prompts = prompts
+            self._dir_mtimes[theme_dir] = dir_mtime_ns
+        self._notify(events)
+
+    def refresh_changed(self) -> None:
+        """
+        Poll: rescan only the theme directories whose mtime changed (adding,
+        removing or renaming a file updates its directory's mtime).
+        """
+        for theme in self._list_theme_dirs():
+            theme_dir = os.path.join(self.root_dir, theme)
+            try:
+                mtime_ns = os.stat(theme_dir).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if self._dir_mtimes.get(theme_dir) != mtime_ns:
+                self.refresh_theme(theme)
+        events = []
+        with self._lock:
+            for theme in [t for t in self._themes if not os.path.isdir(os.path.join(self.root_dir, t))]:
+                events.extend((theme, name, None) for name in self._themes.pop(theme).names)
+        self._notify(events)
+
+    def _list_theme_dirs(self) -> list[str]:
+        try:
+            with os.scandir(self.root_dir) as entries:
+                return [entry.name for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+    # ----------------------------
+    # Incremental updates from the app
+    # ----------------------------
+    def _split(self, path: str) -> tuple[str, str]:
+        theme_dir, name = os.path.split(os.fspath(path))
+        return os.path.basename(theme_dir), name
+
+    def _is_in_theme_dir(self, path) -> bool:
+        theme_dir = os.path.dirname(os.path.abspath(path))
+        return os.path.dirname(theme_dir) == os.path.abspath(self.root_dir)
+
+    def add_file(self, path) -> None:
+        """Tell the index about a file the app just wrote."""
+        if not self._is_in_theme_dir(path):
+            return
+        theme, name = self._split(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            entries = self._themes.setdefault(theme, _ThemeEntries())
+            if not is_image_name(name):
+                if name.endswith(PROMPT_EXTENSION):
+                    entries.prompts[name[:PREFIX_LEN]] = name
+                return
+            entries.add(name, stat.st_size, stat.st_mtime)
+        self._notify([(theme, name, parse_rating(name))])
+
+    def remove_file(self, path) -> None:
+        if not self._is_in_theme_dir(path):
+            return
+        theme, name = self._split(path)
+        with self._lock:
+            entries = self._themes.get(theme)
+            if entries is None:
+                return
+            removed = entries.remove(name)
+            if not removed and entries.prompts.get(name[:PREFIX_LEN]) == name:
+                del entries.prompts[name[:PREFIX_LEN]]
+        if removed:
+            self._notify([(theme, name, None)])
+
+    def rename_file(self, old_path, new_path) -> None:
+        self.remove_file(old_path)
+        self.add_file(new_path)
+
+    # ----------------------------
+    # Queries
+    # ----------------------------
+    def themes(self) -> list[str]:
+        with self._lock:
+            return list(self._themes)
+
+    def count(self, theme: str) -> int:
+        with self._lock:
+            entries = self._themes.get(theme)
+            return len(entries.names) if entries else 0
+
+    def random_image(self, theme: str, min_rating: float = 0.0) -> str | None:
+        """
+        A random image path for theme with a rating of at least min_rating;
+        O(log n). A min_rating below 1.0 means no filtering. If nothing meets
+        the floor, any image of the theme is returned, as before.
+        """
+        with self._lock:
+            entries = self._themes.get(theme)
+            if not entries or not entries.names:
+                return None
+            if min_rating >= 1.0:
+                start = bisect.bisect_left(entries.by_rating, (min_rating, ""))
+                if start < len(entries.by_rating):
+                    _, name = entries.by_rating[random.randrange(start, len(entries.by_rating))]
+                    return os.path.join(self.root_dir, theme, name)
+                logger.warning(f"No images found with min rating of >= {min_rating} in theme {theme}")
+            name = entries.names[random.randrange(len(entries.names))]
+            return os.path.join(self.root_dir, theme, name)
+
+    def unrated(self, theme: str) -> list[str]:
+        """Paths of every unrated image in theme, oldest prefix first."""
+        with self._lock:
+            entries = self._themes.get(theme)
+            if not entries:
+                return []
+            end = bisect.bisect_left(entries.by_rating, (0.0, ""))
+            names = sorted(name for _, name in entries.by_rating[:end])
+            return [os.path.join(self.root_dir, theme, name) for name in names]
+
+    def rated(self, theme: str, rating_range: tuple[float, float]) -> list[tuple[float, str]]:
+        """(rating, path) for images rated within rating_range, in ascending rating order."""
+        with self._lock:
+            entries = self._themes.get(theme)
+            if not entries:
+                return []
+            start = bisect.bisect_left(entries.by_rating, (max(rating_range[0], 0.0), ""))
+            end = bisect.bisect_left(entries.by_rating, (rating_range[1], chr(0x10FFFF)))
+            return [(rating, os.path.join(self.root_dir, theme, name))
+                    for rating, name in entries.by_rating[start:end]]
+
+    def record(self, path) -> LibraryRecord | None:
+        theme, name = self._split(path)
+        with self._lock:
+            entries = self._themes.get(theme)
+            slot = entries.slots.get(name) if entries else None
+            if slot is None:
+                return None
+            return self._record(theme, entries, slot)
+
+    def records(self, theme: str | None = None) -> list[LibraryRecord]:
+        with self._lock:
+            themes = [theme] if theme is not None else list(self._themes)
+            return [self._record(t, self._themes[t], slot)
+                    for t in themes if t in self._themes
+                    for slot in range(len(self._themes[t].names))]
+
+    def _record(self, theme: str, entries: _ThemeEntries, slot: int) -> LibraryRecord:
+        prefix = entries.prefixes[slot]
+        prompt_name = entries.prompts.get(prefix)
+        return LibraryRecord(
+            theme=theme, prefix=prefix, rating=entries.ratings[slot],
+            image_path=os.path.join(self.root_dir, theme, entries.names[slot]),
+            prompt_path=os.path.join(self.root_dir, theme, prompt_name) if prompt_name else None,
+            size=entries.sizes[slot], mtime=entries.mtimes[slot])
+
+    # ----------------------------
+    # Watching
+    # ----------------------------
+    def start_watcher(self, poll_interval: float = 5.0) -> None:
+        """
+        Keep the index current in the background. Uses watchdog if it is
+        installed; otherwise polls directory mtimes every poll_interval seconds.
+        """
+        if self._watcher is not None or self._observer is not None:
+            return
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_WatchdogHandler(self), self.root_dir, recursive=True)
+            self._observer.daemon = True
+            self._observer.start()
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._poll, args=(poll_interval,),
+                                         name="LibraryIndexWatcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        self._watcher = None
+
+    def _poll(self, poll_interval: float) -> None:
+        while not self._stop.wait(poll_interval):
+            try:
+                self.refresh_changed()
+            except Exception as e:
+                logger.warning(f"Library index refresh failed: {e}")
+
+
+class _WatchdogHandler(FileSystemEventHandler):
+    def __init__(self, index: LibraryIndex):
+        super().__init__()
+        self.index = index
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            self.index.refresh_changed()
+        elif event.event_type == "moved":
+            self.index.rename_file(event.src_path, event.dest_path)
+        elif event.event_type == "deleted":
+            self.index.remove_file(event.src_path)
+        elif event.event_type in ("created", "modified", "closed"):
+            self.index.add_file(event.src_path)
@@ -0,0 +1,112 @@
+"""
+Module: LocalPrefetcher.py
+
+In local_files_only mode the next image is chosen well before it is needed,
+then decoded and pre-scaled to the canvas on a worker thread. When the
+display timer expires the UI thread only has to swap in the ready frame.
+While there is nothing to choose from (an empty theme, say) choosing is
+retried with a growing delay rather than on every tick of the UI loop.
+"""
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from PIL import Image
+
+from RenderCache import PreparedImage, prepare_image
+
+logger = logging.getLogger(__name__)
+
+
+class LocalPrefetcher:
+    def __init__(self, retry_delay: float = 1.0, max_retry_delay: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param retry_delay: seconds before choosing again after nothing could be chosen;
+        doubled for each further attempt that finds nothing, up to max_retry_delay
+        """
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LocalPrefetcher")
+        self._future: Future | None = None
+        self._path: Path | None = None
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._clock = clock
+        self._empty_choices = 0  # consecutive attempts that found nothing to choose
+        self._retry_at = 0.0
+        # metrics
+        self.hits: int = 0
+        self.misses: int = 0
+        self.last_decode_seconds: float = 0.0
+        self.total_decode_seconds: float = 0.0
+        self.last_lead_seconds: float = 0.0
+        self.total_lead_seconds: float = 0.0
+
+    def ensure(self, choose_path: Callable[[], Path | None],
+               canvas_size: tuple[int, int], bkgd_rgb: tuple[int, int, int],
+               resample: Image.Resampling = Image.Resampling.LANCZOS) -> None:
+        """
+        Make sure a next image is being prepared for this canvas. choose_path is
+        only called when a new image is needed, and not again for a while after
+        it returns None; a finished frame for an old canvas size or background
+        is rebuilt from the same file.
+        """
+        if self._future is None:
+            if self._clock() < self._retry_at:
+                return
+            self._path = choose_path()
+            if self._path is None:
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** self._empty_choices)
+                self._empty_choices += 1
+                self._retry_at = self._clock() + delay
+                return
+            self._empty_choices, self._retry_at = 0, 0.0
+        elif not self._future.done():
+            return
+        else:
+            prepared = self._future.result()
+            if prepared is None or prepared.matches(canvas_size, bkgd_rgb):
+                return
+        self._future = self._executor.submit(prepare_image, self._path, canvas_size, bkgd_rgb, resample)
+
+    def take(self, canvas_size: tuple[int, int], bkgd_rgb: tuple[int, int, int]) -> PreparedImage | None:
+        """
+        Hand over the prefetched image if it is ready for this canvas; otherwise
+        None, and the caller should load an image itself. Either way the slot is
+        emptied so that the next ensure() picks a new image.
+        """
+        future, self._future, self._path = self._future, None, None
+        if future is None or not future.done():
+            if future is not None:
+                future.cancel()
+            self.misses += 1
+            return None
+        prepared = future.result()
+        if prepared is None or not prepared.matches(canvas_size, bkgd_rgb):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.last_decode_seconds = prepared.decode_seconds
+        self.total_decode_seconds += prepared.decode_seconds
+        self.last_lead_seconds = time.time() - prepared.ready_at
+        self.total_lead_seconds += self.last_lead_seconds
+        return prepared
+
+    def metrics(self) -> dict[str, float]:
+        """
+        decode_ms: time spent decoding and pre-scaling the prefetched image.
+        lead_s: how long before it was displayed the prefetched image was ready.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "last_decode_ms": round(self.last_decode_seconds * 1000, 1),
+            "avg_decode_ms": round(self.total_decode_seconds * 1000 / self.hits, 1) if self.hits else 0.0,
+            "last_lead_s": round(self.last_lead_seconds, 1),
+            "avg_lead_s": round(self.total_lead_seconds / self.hits, 1) if self.hits else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,29 +1,44 @@
+import json
+import logging
 import random
 
 from openai import OpenAI
 
 from ConfigMgr import ConfigMgr
+from HttpTransport import HttpTransport
+from Resilience import Resilience
 from SimplePromptGenerator import SimplePromptGenerator
-from Theme import Theme
+from Theme import CompiledTheme
 from ThemeMgr import ThemeMgr
 
+logger = logging.getLogger(__name__)
+
+CHAT_SERVICE = "openai.chat"  # circuit breaker name
+
 
 class PromptGenerator:
     FULL_PROMPT = 'full_prompt'
     SYSTEM_PROMPT = 'system_prompt'
 
-    def __init__(self, config_mgr: ConfigMgr, api_key: str = None) -> None:
+    def __init__(self, config_mgr: ConfigMgr, api_key: str = None, resilience: Resilience | None = None,
+                 transport: HttpTransport | None = None) -> None:
         """
         Initializes the PromptGenerator with configuration and OpenAI API client.
         :param config_mgr: ConfigMgr instance
         :param api_key: OpenAI API key; may be None--usually the case when running
         unit tests.
+        :param resilience: timeouts, retries and circuit breakers shared with ImageGenerator
+        :param transport: the HTTP connection pool shared with ImageGenerator
         """
         self.config_mgr = config_mgr
-        self.config = self.config_mgr.load_config()
+        self.config = self.config_mgr.current
         self.theme_mgr = ThemeMgr(self.config["themes_directory"])
+        self.resilience = resilience or Resilience.from_config(self.config)
+        self.transport = transport or HttpTransport.from_config(self.config)
         if api_key:
-            self.client = OpenAI(api_key=api_key)
+            # retries are done by self.resilience, per its policy
+            self.client = OpenAI(api_key=api_key, timeout=self.resilience.timeout, max_retries=0,
+                                 http_client=self.transport.client)
         else:
             self.client = None
         self.most_recent_theme_used: str | None = None
@@ -49,15 +64,17 @@ class PromptGenerator:
         """
         try:
 
-            # Send the user and system prompts to the AI model for enhancement
-            response = self.client.chat.completions.create(
+            # Send the user and system prompts to the AI model for enhancement;
+            # fails fast with CircuitOpenError while the service is known to be down
+            response = self.resilience.call(CHAT_SERVICE, lambda timeout: self.client.chat.completions.create(
                 model="gpt-4o-mini",  # Specifies the model to use
                 messages=[
                     {"role": "system", "content": system_prompt},  # System message for AI guidance
                     {"role": "user", "content": user_prompt}  # The original user-provided prompt
                 ],
-                temperature=1  # Controls randomness; 1 allows more creative variation
-            )
+                temperature=1,  # Controls randomness; 1 allows more creative variation
+                timeout=timeout
+            ))
 
             # Extract and clean up the generated response from the AI
             generated_prompt = response.choices[0].message.content.strip()
@@ -75,26 +92,31 @@ class PromptGenerator:
         Generate a themed prompt based on theme chosen in the config file.
         Returns: dictionary of prompt data; keys are "full_prompt", and "system_prompt"
         """
-        self.config = self.config_mgr.load_config()
+        self.config = self.config_mgr.snapshot()
         self.most_recent_theme_used = self.config["active_theme"]
-        theme_data: Theme = self.theme_mgr.get_theme(self.most_recent_theme_used)
+        return self.build_prompt(self.most_recent_theme_used, self.config["active_style"])
+
+    def build_prompt(self, theme_name: str, active_style: str) -> dict[str, str]:
+        """
+        Build a prompt for the given theme and style without touching
+        most_recent_theme_used; safe to call from a background thread.
+        Returns: dictionary of prompt data; keys are "full_prompt", and "system_prompt"
+        """
+        theme_data: CompiledTheme = self.theme_mgr.get_compiled_theme(theme_name)
 
         system_prompt: str = theme_data.system_prompt
-        user_prompt_template: str = theme_data.user_prompt
 
         # pick a base prompt out of the list
         original_prompt: str = random.choice(theme_data.prompts)
 
         # select style
-        active_style = self.config["active_style"]
         if active_style == "random" or active_style not in theme_data.styles:
-            available_styles = [s for s in theme_data.styles if s != "random"]
-            style_text: str = random.choice(available_styles)
+            style_text: str = random.choice(theme_data.style_keys)
         else:
             style_text: str = theme_data.styles[active_style]
 
         # apply user_prompt_template to the base prompt and styles
-        full_prompt: str = user_prompt_template.format(prompt=original_prompt)
+        full_prompt: str = theme_data.format_prompt(original_prompt)
         full_prompt += f" and use the following style: {style_text}"
 
         result = {
@@ -103,3 +125,40 @@ class PromptGenerator:
         }
 
         return result
+
+    def embellish_prompts(self, user_prompts: list[str], system_prompt: str) -> list[str]:
+        """
+        Enhances several prompts with a single chat completion, asking for a
+        JSON object holding one embellishment per prompt, in order.
+        Unlike embellish_prompt there is no fallback: on any failure the
+        result is shorter than user_prompts (possibly empty) and the caller
+        decides what to do.
+        """
+        if not user_prompts or self.client is None:
+            return []
+        numbered = "\n".join(f"{i + 1}. {p}" for i, p in enumerate(user_prompts))
+        instructions = (f"{system_prompt}\n\nYou will be given {len(user_prompts)} numbered prompts. "
+                        f"Handle each one independently, as if it were the only one. Reply with a JSON "
+                        f"object whose \"prompts\" key is a list of exactly {len(user_prompts)} strings, "
+                        f"the result for each prompt in the same order.")
+        try:
+            response = self.resilience.call(CHAT_SERVICE, lambda timeout: self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": instructions},
+                    {"role": "user", "content": numbered}
+                ],
+                temperature=1,
+                response_format={"type": "json_object"},
+                timeout=timeout
+            ))
+            prompts = json.loads(response.choices[0].message.content)["prompts"]
+        except Exception as e:
+            logger.warning(f"Failed to get {len(user_prompts)} prompts from AI: {e}")
+            return []
+        if not isinstance(prompts, list):
+            return []
+        results = [p.strip() for p in prompts[:len(user_prompts)] if isinstance(p, str) and p.strip()]
+        if len(results) != len(user_prompts):
+            logger.warning(f"Asked AI for {len(user_prompts)} prompts, got {len(results)} usable ones")
+        return results
@@ -0,0 +1,218 @@
+"""
+Module: PromptPool.py
+
+Keeps a supply of already-embellished prompts for each theme and style so
+that generating an image doesn't have to wait on a chat completion first.
+Prompts are embellished in batches, several per request (see
+PromptGenerator.embellish_prompts), on a background thread whenever a pool
+drops below its low-water mark. Each pool is kept on disk as
+prompt_pool/<theme>/<style>.json, tagged with a fingerprint of the theme's
+YAML file; if the theme file changes, the pool's entries are dropped.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from PromptGenerator import PromptGenerator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PooledPrompt:
+    prompt: str  # the embellished prompt, ready for the image service
+    base_prompt: str  # the themed prompt it was embellished from
+    theme_name: str  # as in the config, e.g. "creative.yaml"
+    style: str  # as in the config, e.g. "random"
+    created: float
+
+
+class PromptPool:
+    POOL_DIR_NAME: str = "prompt_pool"
+
+    def __init__(self, prompt_generator: PromptGenerator, pool_dir: str = POOL_DIR_NAME,
+                 batch_size: int = 6, low_water: int = 2):
+        """
+        :param batch_size: how many prompts a pool is filled up to, in one request
+        :param low_water: refill once a pool holds fewer than this many prompts
+        """
+        self.prompt_generator = prompt_generator
+        self.pool_dir = Path(pool_dir)
+        self.batch_size = max(batch_size, 1)
+        self.low_water = min(max(low_water, 1), self.batch_size)
+        # (theme_name, style) -> (theme fingerprint, prompts)
+        self._pools: dict[tuple[str, str], tuple[str, deque[PooledPrompt]]] = {}
+        self._lock = threading.Lock()
+        self._requests: deque[tuple[str, str]] = deque()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="PromptPoolRefill", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout: float = 1.0) -> None:
+        """Stop the refill thread; a batch request in flight is abandoned, not waited on."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    # ----------------------------
+    # Serving
+    # ----------------------------
+    def _current_theme_and_style(self) -> tuple[str, str]:
+        config = self.prompt_generator.config_mgr.current
+        return config["active_theme"], config["active_style"]
+
+    def count(self, theme_name: str, style: str) -> int:
+        fingerprint = self._prepare(theme_name, style)
+        with self._lock:
+            return len(self._pool(theme_name, style, fingerprint))
+
+    def take(self, theme_name: str | None = None, style: str | None = None) -> PooledPrompt | None:
+        """
+        The oldest pooled prompt for theme_name and style (by default the
+        configured ones), or None if the pool is empty. Never blocks on the
+        network; asks for a refill once the pool runs low.
+        """
+        if theme_name is None or style is None:
+            theme_name, style = self._current_theme_and_style()
+        try:
+            fingerprint = self._prepare(theme_name, style)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            prompts = self._pool(theme_name, style, fingerprint)
+            pooled = prompts.popleft() if prompts else None
+            remaining = len(prompts)
+        if pooled is not None:
+            self._save(theme_name, style)
+        if remaining < self.low_water:
+            self.request_refill(theme_name, style)
+        return pooled
+
+    def request_refill(self, theme_name: str | None = None, style: str | None = None) -> None:
+        if theme_name is None or style is None:
+            theme_name, style = self._current_theme_and_style()
+        with self._lock:
+            if (theme_name, style) not in self._requests:
+                self._requests.append((theme_name, style))
+        self._wakeup.set()
+
+    # ----------------------------
+    # Refilling
+    # ----------------------------
+    def refill(self, theme_name: str, style: str) -> int:
+        """Top the pool up to batch_size with one batch request; returns how many prompts were added."""
+        fingerprint = self._prepare(theme_name, style)
+        with self._lock:
+            needed = self.batch_size - len(self._pool(theme_name, style, fingerprint))
+        if needed <= 0:
+            return 0
+        prompt_data = [self.prompt_generator.build_prompt(theme_name, style) for _ in range(needed)]
+        embellished = self.prompt_generator.embellish_prompts(
+            [data[PromptGenerator.FULL_PROMPT] for data in prompt_data],
+            prompt_data[0][PromptGenerator.SYSTEM_PROMPT])
+        if not embellished:
+            return 0
+        now = time.time()
+        with self._lock:
+            stored_fingerprint, prompts = self._pools[(theme_name, style)]
+            if stored_fingerprint != fingerprint:
+                logger.info(f"Theme {theme_name} changed during a refill; discarding the batch")
+                return 0
+            prompts.extend(PooledPrompt(prompt=prompt, base_prompt=data[PromptGenerator.FULL_PROMPT],
+                                        theme_name=theme_name, style=style, created=now)
+                           for data, prompt in zip(prompt_data, embellished))
+        self._save(theme_name, style)
+        logger.info(f"Added {len(embellished)} prompts to the {theme_name}/{style} pool")
+        return len(embellished)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while not self._stop.is_set():
+                with self._lock:
+                    if not self._requests:
+                        break
+                    theme_name, style = self._requests.popleft()
+                try:
+                    self.refill(theme_name, style)
+                except Exception as e:
+                    logger.warning(f"Failed to refill the {theme_name}/{style} prompt pool: {e}")
+
+    # ----------------------------
+    # Storage
+    # ----------------------------
+    def _path(self, theme_name: str, style: str) -> Path:
+        safe_style = re.sub(r'[^\w.-]+', '_', style)
+        return self.pool_dir / theme_name.replace(".yaml", "") / f"{safe_style}.json"
+
+    def _prepare(self, theme_name: str, style: str) -> str:
+        """
+        The theme's current fingerprint, after loading the pool from disk if
+        this is its first use. Does its file I/O without holding _lock (the
+        fingerprint is only recomputed when the theme file changes).
+        """
+        fingerprint = self.prompt_generator.theme_mgr.theme_fingerprint(theme_name)
+        key = (theme_name, style)
+        with self._lock:
+            loaded = key in self._pools
+        if not loaded:
+            stored = self._read(theme_name, style)
+            with self._lock:
+                self._pools.setdefault(key, stored)
+        return fingerprint
+
+    def _pool(self, theme_name: str, style: str, fingerprint: str) -> deque[PooledPrompt]:
+        """
+        The prompts for theme_name and style, dropping them if the theme file
+        changed. Call _prepare() first, and this with _lock held.
+        """
+        key = (theme_name, style)
+        stored_fingerprint, prompts = self._pools[key]
+        if stored_fingerprint != fingerprint:
+            if prompts:
+                logger.info(f"Theme {theme_name} changed; dropping {len(prompts)} pooled prompts")
+            prompts = deque()
+            self._pools[key] = (fingerprint, prompts)
+        return prompts
+
+    def _read(self, theme_name: str, style: str) -> tuple[str, deque[PooledPrompt]]:
+        path = self._path(theme_name, style)
+        if not path.exists():
+            return "", deque()
+        try:
+            with path.open("r", encoding="utf-8") as file:
+                data = json.load(file)
+            return data["fingerprint"], deque(PooledPrompt(**entry) for entry in data["prompts"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable prompt pool {path}: {e}")
+            return "", deque()
+
+    def _save(self, theme_name: str, style: str) -> None:
+        path = self._path(theme_name, style)
+        with self._lock:
+            fingerprint, prompts = self._pools.get((theme_name, style), ("", deque()))
+            data = {"fingerprint": fingerprint, "prompts": [asdict(p) for p in prompts]}
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open("w", encoding="utf-8") as file:
+                json.dump(data, file, indent=4)  # type: ignore
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to save prompt pool {path}: {e}")
@@ -4,7 +4,9 @@ import random
 import enum
 import boto3
 
+from LibraryIndex import IMAGE_EXTENSIONS, LibraryIndex
 from S3Manager import S3Manager
+from UploadOutbox import UploadOutbox
 
 
 # ----------------------------
@@ -34,9 +36,8 @@ def is_image_file(file_path: str) -> bool:
     Returns True if the file_path points to an image file,
     determined by its file extension.
     """
-    image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff'}
     ext = os.path.splitext(file_path)[1].lower()
-    return ext in image_extensions
+    return ext in IMAGE_EXTENSIONS
 
 
 # ----------------------------
@@ -52,51 +53,81 @@ class SortEnum(enum.Enum):
 # RatingManager class
 # ----------------------------
 class RatingManager:
-    def __init__(self, s3_manager: S3Manager):
+    def __init__(self, s3_manager: S3Manager, library_index: LibraryIndex | None = None,
+                 upload_outbox: UploadOutbox | None = None):
+        """
+        :param s3_manager: used to mirror renames in S3
+        :param library_index: optional; when given, directories it covers are
+        queried from the index instead of being rescanned, and renames are
+        reported back to it.
+        :param upload_outbox: optional; when given, files missing from S3 are
+        queued there (and retried) instead of uploaded once, and uploads still
+        pending for renamed files are moved to their new names.
+        """
         self.s3_manager = s3_manager
+        self.library_index = library_index
+        self.upload_outbox = upload_outbox
         self.rating_list = []  # List of file paths (unrated files)
         self.current_index = 0
 
+    def _indexed_theme(self, dirpath: str) -> str | None:
+        """The index's theme name for dirpath, or None if the index doesn't cover it."""
+        if self.library_index is None:
+            return None
+        parent, theme = os.path.split(os.path.abspath(dirpath))
+        if parent != os.path.abspath(self.library_index.root_dir):
+            return None
+        return theme
+
     def find_all_rated_files(self, dirpath: str, rating_range: tuple[float, float], sort: SortEnum) -> list[str]:
         """
         Scan the directory for files that have a rating marker in their name.
         Optionally, filter files to those whose rating is within rating_range.
         The returned list is sorted based on the sort parameter.
         """
-        rated_files = []
-        rating_pattern = re.compile(r' r\[(\d\.\d)\]')
-        for filename in os.listdir(dirpath):
-            full_path = os.path.join(dirpath, filename)
-            if os.path.isfile(full_path):
-                match = rating_pattern.search(filename)
-                if match:
-                    rating_value = float(match.group(1))
-                    if rating_range[0] <= rating_value <= rating_range[1]:
-                        rated_files.append(full_path)
+        theme = self._indexed_theme(dirpath)
+        if theme is not None:
+            # the index only holds image files, already ordered by rating
+            rated = self.library_index.rated(theme, rating_range)
+        else:
+            rated = []
+            rating_pattern = re.compile(r' r\[(\d\.\d)\]')
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        match = rating_pattern.search(entry.name)
+                        if match:
+                            rating_value = float(match.group(1))
+                            if rating_range[0] <= rating_value <= rating_range[1]:
+                                rated.append((rating_value, os.path.join(dirpath, entry.name)))
 
         # Sorting as requested
         if sort == SortEnum.ASCENDING:
-            rated_files.sort(key=lambda fp: float(rating_pattern.search(os.path.basename(fp)).group(1)))
+            rated.sort(key=lambda item: item[0])
         elif sort == SortEnum.DESCENDING:
-            rated_files.sort(key=lambda fp: float(rating_pattern.search(os.path.basename(fp)).group(1)), reverse=True)
+            rated.sort(key=lambda item: item[0], reverse=True)
         elif sort == SortEnum.RANDOM:
-            random.shuffle(rated_files)
+            random.shuffle(rated)
         # If sort == SortEnum.NONE, leave unsorted
-        return rated_files
+        return [path for _, path in rated]
 
     def find_all_unrated_files(self, dirpath: str) -> list[str]:
         """
         Scan the directory and return a list of file paths that do not have a rating marker in their filename.
         Only include files that are recognized as image files.
         """
+        theme = self._indexed_theme(dirpath)
+        if theme is not None:
+            return self.library_index.unrated(theme)
+
         unrated_files = []
         rating_pattern = re.compile(r' r\[\d\.\d\]')
-        for filename in os.listdir(dirpath):
-            full_path = os.path.join(dirpath, filename)
-            # Check if it is a file and an image file
-            if os.path.isfile(full_path) and is_image_file(full_path):
-                if not rating_pattern.search(filename):
-                    unrated_files.append(full_path)
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                # Check if it is a file and an image file
+                if entry.is_file() and is_image_file(entry.name):
+                    if not rating_pattern.search(entry.name):
+                        unrated_files.append(os.path.join(dirpath, entry.name))
         return unrated_files
 
     def start_rating(self, directory_path: str) -> list[str]:
@@ -112,7 +143,9 @@ class RatingManager:
         """
         Insert (or update) the rating marker in the file's name (and its companion files, if any).
         The new marker ' r[n]' (n formatted to one decimal place) is placed immediately before the file extension.
-        After renaming the file(s) locally, the S3Manager is called to update the corresponding file(s) in S3.
+        After renaming the file(s) locally, the S3Manager is called to update the corresponding file(s) in S3,
+        all in one bulk rename; companions that aren't in S3 yet are uploaded (or queued in the upload
+        outbox) under their new names.
         """
         print(f"Rating {file_path} as {rating:.1f}")
         if not os.path.exists(file_path):
@@ -131,6 +164,7 @@ class RatingManager:
         prefix = original_filename[:15]
 
         # Process all companion files (files that start with the same date-time prefix)
+        cloud_renames: list[tuple[str, str]] = []  # (old key, new key)
         for fname in os.listdir(dir_path):
             if fname.startswith(prefix):
                 old_full_path = os.path.join(dir_path, fname)
@@ -139,21 +173,36 @@ class RatingManager:
                 # Only rename if needed
                 if new_fname != fname:
                     os.rename(old_full_path, new_full_path)
-                    # Update the file in S3: use the leaf_dir_name / filename (or key) as the identifier.
-                    try:
-                        if self.s3_manager.is_in_s3(s3_prefix, fname):
-                            self.s3_manager.change_name_in_cloud(s3_prefix=s3_prefix, cur_filename=fname, new_filename=new_fname)
-                        else:
-                            print(f"File '{new_fname}' was not found in the S3 bucket. Uploading now.")
-                            self.s3_manager.upload_to_s3(file_path=new_full_path, s3_key=f"{s3_prefix}/{new_fname}")
-                    except Exception as e:
-                        print(f"Warning: S3 update failed for '{fname}' -> '{new_fname}': {e}")
+                    if self.library_index is not None:
+                        self.library_index.rename_file(old_full_path, new_full_path)
+                    if self.upload_outbox is not None:
+                        self.upload_outbox.rekey(old_full_path, new_full_path, f"{s3_prefix}/{new_fname}")
+                    # The S3 key is the leaf_dir_name / filename
+                    cloud_renames.append((f"{s3_prefix}/{fname}", f"{s3_prefix}/{new_fname}"))
 
                     # If the rated file is in the rating list, update its entry with the new filename
                     if old_full_path in self.rating_list:
                         idx = self.rating_list.index(old_full_path)
                         self.rating_list[idx] = new_full_path
 
+        # Update the files in S3
+        try:
+            results = self.s3_manager.rename_many(cloud_renames)
+        except Exception as e:
+            print(f"Warning: S3 update failed for {cloud_renames}: {e}")
+            return
+        for result in results:
+            if result.missing:
+                new_fname = os.path.basename(result.new_key)
+                if self.upload_outbox is not None:
+                    print(f"File '{new_fname}' was not found in the S3 bucket. Queueing its upload.")
+                    self.upload_outbox.enqueue(os.path.join(dir_path, new_fname), result.new_key)
+                    continue
+                print(f"File '{new_fname}' was not found in the S3 bucket. Uploading now.")
+                self.s3_manager.upload_to_s3(file_path=os.path.join(dir_path, new_fname), s3_key=result.new_key)
+            elif not result.ok:
+                print(f"Warning: S3 update failed for '{result.key}' -> '{result.new_key}': {result.error}")
+
     def num_remaining_to_rate(self) -> int:
         """
         Return the number of files remaining in the rating list (from the current index onward).
@@ -0,0 +1,136 @@
+"""
+Module: RenderCache.py
+
+Helpers for building the frame shown on the canvas. The frame is the source
+image scaled to fit the canvas and centered on a background color. Building
+one is expensive on a Raspberry Pi (LANCZOS resize plus a full-canvas paste),
+so RenderCache remembers what was last rendered and lets the caller skip
+work when nothing has changed.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image
+
+from Derivatives import display_source
+from ImageLoader import fit_size, load_for_display
+
+logger = logging.getLogger(__name__)
+
+
+def compose_frame(pil_img: Image.Image, canvas_size: tuple[int, int],
+                  bkgd_rgb: tuple[int, int, int],
+                  resample: Image.Resampling = Image.Resampling.LANCZOS) -> Image.Image:
+    """
+    Resize the given PIL image to fit within canvas_size while preserving
+    its aspect ratio and center it on a background of the given color.
+    Safe to call from a worker thread; no Tk objects are touched.
+    """
+    canvas_width, canvas_height = canvas_size
+    orig_w, orig_h = pil_img.size
+    new_w, new_h = fit_size(canvas_width, canvas_height, orig_w, orig_h)
+
+    # Already a full frame? Nothing to do.
+    if (new_w, new_h) == (orig_w, orig_h) == (canvas_width, canvas_height):
+        return pil_img
+
+    if (orig_w <= canvas_width and orig_h <= canvas_height
+            and abs(orig_w - new_w) <= 1 and abs(orig_h - new_h) <= 1):
+        # already fitted, e.g. by ImageLoader.load_for_display (allowing for its rounding)
+        resized = pil_img
+        new_w, new_h = orig_w, orig_h
+    else:
+        resized = pil_img.resize((new_w, new_h), resample)
+
+    background = Image.new("RGB", (canvas_width, canvas_height), bkgd_rgb)
+    x_offset = (canvas_width - new_w) // 2
+    y_offset = (canvas_height - new_h) // 2
+    background.paste(resized, (x_offset, y_offset))
+    return background
+
+
+@dataclass(frozen=True)
+class RenderKey:
+    """What a rendered frame depends on."""
+    image_id: int
+    canvas_size: tuple[int, int]
+    bkgd_hex_color: str
+
+
+class RenderCache:
+    """
+    Remembers the key of the frame currently on the canvas so that the
+    periodic update tick can skip rebuilding an identical frame.
+
+    A reference to the rendered image is held so that its id() cannot be
+    recycled by a different image while it is still the cached key.
+    """
+
+    def __init__(self):
+        self._key: RenderKey | None = None
+        self._image: Image.Image | None = None
+        self.renders_performed: int = 0
+        self.renders_skipped: int = 0
+
+    @staticmethod
+    def make_key(pil_img: Image.Image, canvas_size: tuple[int, int], bkgd_hex_color: str) -> RenderKey:
+        return RenderKey(id(pil_img), canvas_size, bkgd_hex_color.lower())
+
+    def is_current(self, key: RenderKey) -> bool:
+        """True (and counted as a skip) if key matches what is on the canvas."""
+        if self._key is not None and self._key == key:
+            self.renders_skipped += 1
+            return True
+        return False
+
+    def remember(self, key: RenderKey, pil_img: Image.Image) -> None:
+        """Record that a frame for key was just rendered."""
+        self._key = key
+        self._image = pil_img
+        self.renders_performed += 1
+
+    def invalidate(self) -> None:
+        """Force the next render to rebuild the frame."""
+        self._key = None
+        self._image = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "renders_performed": self.renders_performed,
+            "renders_skipped": self.renders_skipped,
+        }
+
+
+@dataclass
+class PreparedImage:
+    """An image decoded from disk together with a frame pre-composed for a given canvas."""
+    source_path: Path
+    image: Image.Image
+    frame: Image.Image
+    canvas_size: tuple[int, int]
+    bkgd_rgb: tuple[int, int, int]
+    decode_seconds: float
+    ready_at: float
+
+    def matches(self, canvas_size: tuple[int, int], bkgd_rgb: tuple[int, int, int]) -> bool:
+        return self.canvas_size == canvas_size and self.bkgd_rgb == bkgd_rgb
+
+
+def prepare_image(path: Path, canvas_size: tuple[int, int], bkgd_rgb: tuple[int, int, int],
+                  resample: Image.Resampling = Image.Resampling.LANCZOS) -> PreparedImage | None:
+    """
+    Decode the image at path, downscaled on decode to fit canvas_size (from
+    a derivative when there is one big enough), and compose its frame. Meant
+    to be run on a worker thread; returns None if the file cannot be read.
+    """
+    start = time.perf_counter()
+    try:
+        image = load_for_display(display_source(path, canvas_size), canvas_size, resample)
+    except Exception as e:
+        logger.warning(f"Failed to load {path}: {e}")
+        return None
+    frame = compose_frame(image, canvas_size, bkgd_rgb, resample)
+    return PreparedImage(source_path=Path(path), image=image, frame=frame, canvas_size=canvas_size,
+                         bkgd_rgb=bkgd_rgb, decode_seconds=time.perf_counter() - start, ready_at=time.time())
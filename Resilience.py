@@ -0,0 +1,226 @@
+"""
+Module: Resilience.py
+
+Deadlines, retries and circuit breakers for calls to remote services
+(OpenAI chat and image generation, image downloads). is_retryable also
+knows boto3's errors, for S3 transfers.
+
+Resilience.call(name, fn) runs fn(timeout) where timeout is what is left of
+the call's overall deadline, capped at the per-attempt timeout. Errors that
+are worth retrying (timeouts, dropped connections, 429 and 5xx responses)
+are retried with jittered exponential backoff, as long as the deadline
+allows. Each name has its own CircuitBreaker: after failure_threshold
+consecutive failed calls it opens and further calls fail immediately with
+CircuitOpenError, so callers can fall back at once. After reset_timeout
+seconds a single trial call is let through; if it succeeds the breaker
+closes again.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable
+
+import httpx
+import openai
+import requests
+from botocore.exceptions import (ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError,
+                                 ReadTimeoutError)
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_in: float):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"{name} is unavailable; circuit open for another {retry_in:.0f}s")
+
+
+def is_retryable(e: Exception) -> bool:
+    """Timeouts, connection errors and 408/409/429/5xx responses; not bad requests or auth failures."""
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(e, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(e, (EndpointConnectionError, ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError)):
+        return True
+    if isinstance(e, ClientError):
+        return e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") in RETRYABLE_STATUS_CODES
+    return isinstance(e, (TimeoutError, ConnectionError))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        # metrics
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.short_circuits = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError unless a call may go ahead."""
+        with self._lock:
+            self.calls += 1
+            if self._state == OPEN:
+                waited = self._clock() - self._opened_at
+                if waited < self.reset_timeout or self._trial_in_flight:
+                    self.short_circuits += 1
+                    raise CircuitOpenError(self.name, max(self.reset_timeout - waited, 0.0))
+                self._trial_in_flight = True  # half-open: let this one call through
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.successes += 1
+            if self._state == OPEN:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self, service_fault: bool = True) -> None:
+        """
+        service_fault=False is for errors that say nothing about the service's
+        health (a rejected prompt, a bad API key); they don't count toward opening.
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if not service_fault:
+                return
+            self._consecutive_failures += 1
+            reopen = self._state == OPEN  # a failed trial call
+            if reopen or self._consecutive_failures >= self.failure_threshold:
+                if not reopen:
+                    self.times_opened += 1
+                    logger.warning(f"Circuit {self.name} opened after {self._consecutive_failures} failures")
+                self._state = OPEN
+                self._opened_at = self._clock()
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "short_circuits": self.short_circuits,
+            "times_opened": self.times_opened,
+        }
+
+
+class Resilience:
+    """One per app, shared by everything that calls a remote service."""
+
+    def __init__(self, timeout: float = 60.0, deadline: float = 180.0, attempts: int = 3,
+                 base_delay: float = 1.0, max_delay: float = 16.0, failure_threshold: int = 3,
+                 reset_timeout: float = 300.0, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param timeout: seconds allowed for a single attempt
+        :param deadline: seconds allowed for a call, retries and backoff included
+        :param attempts: tries per call, the first one included
+        """
+        self.timeout = timeout
+        self.deadline = deadline
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._sleep = sleep
+        self._clock = clock
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_config(config) -> "Resilience":
+        return Resilience(
+            timeout=float(config.get("request_timeout_seconds", 60)),
+            deadline=float(config.get("request_deadline_seconds", 180)),
+            attempts=int(config.get("request_attempts", 3)),
+            failure_threshold=int(config.get("circuit_breaker_threshold", 3)),
+            reset_timeout=float(config.get("circuit_breaker_reset_seconds", 300)))
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, self.failure_threshold, self.reset_timeout, self._clock)
+                self._breakers[name] = breaker
+            return breaker
+
+    def is_available(self, name: str) -> bool:
+        """False while the breaker for name is open, i.e. a call would fail immediately."""
+        return self.breaker(name).state != OPEN
+
+    def call(self, name: str, fn: Callable[[float], Any], timeout: float | None = None,
+             deadline: float | None = None) -> Any:
+        """
+        Call fn(timeout) with retries, guarded by the breaker for name. Raises
+        CircuitOpenError if the breaker is open, or the last error from fn.
+        """
+        breaker = self.breaker(name)
+        breaker.before_call()
+        timeout = self.timeout if timeout is None else timeout
+        give_up_at = self._clock() + (self.deadline if deadline is None else deadline)
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = give_up_at - self._clock()
+            try:
+                result = fn(max(min(timeout, remaining), 0.001))
+            except Exception as e:
+                retryable = is_retryable(e)
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                if not retryable or attempt >= self.attempts or self._clock() + delay >= give_up_at:
+                    breaker.record_failure(service_fault=retryable)
+                    raise
+                breaker.record_retry()
+                logger.info(f"{name} attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+                self._sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.metrics() for breaker in breakers}
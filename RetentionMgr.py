@@ -0,0 +1,206 @@
+"""
+Module: RetentionMgr.py
+
+Keeps the image library under save_directory_path within its limits:
+max_num_saved_files across all themes, an optional byte budget
+(max_saved_bytes) and optional per-theme quotas (theme_quotas). Images at
+or above protect_min_rating are never evicted.
+
+Instead of listing and sorting the save directory on every cycle, the
+manager listens to the LibraryIndex and keeps one min-heap of
+(mtime, name) per theme, so finding the oldest image is O(log n). Heap
+entries are invalidated lazily: an entry is only trusted if it still
+matches the image's current mtime. An evicted image is deleted together
+with its prompt file and derivatives.
+"""
+import heapq
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+from Derivatives import remove_derivatives
+from LibraryIndex import LibraryIndex, UNRATED
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    CONFIG_KEYS = ("max_num_saved_files", "max_saved_bytes", "theme_quotas", "protect_min_rating")
+
+    max_files: int
+    max_bytes: int = 0  # 0 means no byte budget
+    theme_quotas: dict[str, int] | None = None  # theme -> max images; missing means no quota
+    protect_min_rating: float = 0.0  # below 1.0 means nothing is protected
+
+    @staticmethod
+    def from_config(config: dict) -> "RetentionPolicy":
+        return RetentionPolicy(
+            max_files=int(config["max_num_saved_files"]),
+            max_bytes=int(config.get("max_saved_bytes", 0)),
+            theme_quotas={k: int(v) for k, v in (config.get("theme_quotas") or {}).items()},
+            protect_min_rating=float(config.get("protect_min_rating", 0.0)))
+
+
+class RetentionMgr:
+    def __init__(self, library_index: LibraryIndex, policy: RetentionPolicy):
+        self.library_index = library_index
+        self.policy = policy
+        self._heaps: dict[str, list[tuple[float, str]]] = {}  # theme -> (mtime, name); may hold stale entries
+        self._live: dict[tuple[str, str], tuple[float, int, bool]] = {}  # (theme, name) -> (mtime, size, protected)
+        self._theme_counts: dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        for record in library_index.records():
+            self._track(record.theme, os.path.basename(record.image_path), record.mtime, record.size, record.rating)
+        library_index.subscribe(self.on_library_change)
+
+    def close(self) -> None:
+        self.library_index.unsubscribe(self.on_library_change)
+
+    @property
+    def total_files(self) -> int:
+        return len(self._live)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def set_policy(self, policy: RetentionPolicy) -> None:
+        """Apply a new policy; images whose protection changed are re-tracked."""
+        if policy == self.policy:
+            return
+        with self._lock:
+            self.policy = policy
+            tracked = list(self._live.items())
+            self._heaps.clear()
+            self._live.clear()
+            self._theme_counts.clear()
+            self._total_bytes = 0
+        for (theme, name), _ in tracked:
+            record = self.library_index.record(os.path.join(self.library_index.root_dir, theme, name))
+            if record is not None:
+                self._track(theme, name, record.mtime, record.size, record.rating)
+
+    # ----------------------------
+    # Tracking
+    # ----------------------------
+    def on_library_change(self, theme: str, path: str, rating: float | None) -> None:
+        """A LibraryIndex listener; see LibraryIndex.subscribe."""
+        name = os.path.basename(path)
+        if rating is None:
+            self._untrack(theme, name)
+            return
+        record = self.library_index.record(path)
+        if record is not None:
+            self._track(theme, name, record.mtime, record.size, record.rating)
+
+    def _is_protected(self, rating: float) -> bool:
+        floor = self.policy.protect_min_rating
+        return floor >= 1.0 and rating != UNRATED and rating >= floor
+
+    def _track(self, theme: str, name: str, mtime: float, size: int, rating: float) -> None:
+        self._untrack(theme, name)
+        protected = self._is_protected(rating)
+        with self._lock:
+            self._live[(theme, name)] = (mtime, size, protected)
+            self._theme_counts[theme] = self._theme_counts.get(theme, 0) + 1
+            self._total_bytes += size
+            if not protected:
+                heapq.heappush(self._heaps.setdefault(theme, []), (mtime, name))
+
+    def _untrack(self, theme: str, name: str) -> None:
+        with self._lock:
+            entry = self._live.pop((theme, name), None)
+            if entry is None:
+                return
+            self._theme_counts[theme] -= 1
+            self._total_bytes -= entry[1]
+            # the heap entry is left behind and skipped when it surfaces
+
+    def _peek(self, theme: str) -> tuple[float, str] | None:
+        """The oldest evictable image of theme, dropping stale heap entries on the way."""
+        heap = self._heaps.get(theme)
+        while heap:
+            mtime, name = heap[0]
+            live = self._live.get((theme, name))
+            if live is not None and live[0] == mtime and not live[2]:
+                return mtime, name
+            heapq.heappop(heap)
+        return None
+
+    # ----------------------------
+    # Eviction
+    # ----------------------------
+    def _next_victim(self, keep: set[tuple[str, str]]) -> tuple[str, str] | None:
+        """Theme and name of the next image to evict, or None once every limit is met."""
+        policy = self.policy
+        with self._lock:
+            # a theme over its own quota goes first, regardless of age elsewhere
+            for theme, quota in (policy.theme_quotas or {}).items():
+                if self._theme_counts.get(theme, 0) > quota:
+                    victim = self._oldest({theme}, keep)
+                    if victim is not None:
+                        return victim
+            over_count = len(self._live) > policy.max_files
+            over_bytes = policy.max_bytes > 0 and self._total_bytes > policy.max_bytes
+            if not (over_count or over_bytes):
+                return None
+            return self._oldest(set(self._heaps), keep)
+
+    def _oldest(self, themes: set[str], keep: set[tuple[str, str]]) -> tuple[str, str] | None:
+        best = None
+        for theme in themes:
+            # images to keep are set aside and pushed back once a victim is found
+            skipped = []
+            top = self._peek(theme)
+            while top is not None and (theme, top[1]) in keep:
+                skipped.append(heapq.heappop(self._heaps[theme]))
+                top = self._peek(theme)
+            for entry in skipped:
+                heapq.heappush(self._heaps[theme], entry)
+            if top is not None and (best is None or top[0] < best[0]):
+                best = (top[0], theme, top[1])
+        return (best[1], best[2]) if best else None
+
+    def enforce(self, keep: set[str] | None = None) -> int:
+        """
+        Delete the oldest images (and their prompt files) until every limit
+        is met. keep holds paths that must not be deleted right now, such as
+        the image on screen. Returns the number of images deleted.
+        """
+        keep_keys = {(os.path.basename(os.path.dirname(os.fspath(p))), os.path.basename(os.fspath(p)))
+                     for p in (keep or ())}
+        deleted = 0
+        while (victim := self._next_victim(keep_keys)) is not None:
+            theme, name = victim
+            deleted += self._delete(theme, name)
+        if len(self._live) > self.policy.max_files:
+            logger.info(f"{len(self._live)} images kept although max_num_saved_files is {self.policy.max_files}; "
+                        f"the rest are protected or in use")
+        return deleted
+
+    def _delete(self, theme: str, name: str) -> bool:
+        """Delete an image and its prompt; returns whether the image itself is gone."""
+        image_path = os.path.join(self.library_index.root_dir, theme, name)
+        record = self.library_index.record(image_path)
+        image_deleted = True
+        for path in [image_path] + ([record.prompt_path] if record and record.prompt_path else []):
+            try:
+                os.remove(path)
+                logger.info(f"Deleted: {path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # still on disk, so the index keeps it
+                logger.warning(f"Failed to delete {path}: {e}")
+                image_deleted = image_deleted and path != image_path
+                continue
+            self.library_index.remove_file(path)
+        if image_deleted:
+            remove_derivatives(image_path)
+        # in case the index no longer knew the image and so did not notify us; one we failed to delete is
+        # dropped too, rather than picked again
+        self._untrack(theme, name)
+        return image_deleted
@@ -0,0 +1,212 @@
+"""
+Module: S3Inventory.py
+
+A persisted inventory of the bucket, kept per top-level prefix (one per
+theme, e.g. "creative/"), so that S3Sync doesn't have to page through the
+whole bucket on every run.
+
+Keys start with a timestamp, so new objects sort after everything already
+seen: an incremental refresh lists each prefix with StartAfter set to the
+last key seen there, which costs one request when nothing changed.
+Prefixes are listed concurrently. Renames by a rating (the marker sorts
+before the plain name) and deletes can't be seen that way; those made
+through our own S3Manager are applied as they happen (see
+S3Manager.subscribe), and every reconcile_interval seconds each prefix is
+listed in full to catch the rest.
+
+The whole inventory is held in memory, a few hundred bytes per object,
+and saved to s3_inventory.json.
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+
+from S3Manager import S3Manager
+
+logger = logging.getLogger(__name__)
+
+ROOT_PREFIX = ""  # objects outside any prefix, listed along with the prefixes themselves
+
+
+class S3Inventory:
+    INVENTORY_FILE_NAME: str = "s3_inventory.json"
+    VERSION = 2
+
+    def __init__(self, s3_manager: S3Manager, path: str | None = INVENTORY_FILE_NAME,
+                 reconcile_interval: float = 24 * 60 * 60, max_workers: int = 4,
+                 clock: Callable[[], float] = time.time):
+        """
+        :param path: where the inventory is saved; None keeps it in memory only
+        :param reconcile_interval: seconds after which a prefix is listed in full again
+        :param max_workers: how many prefixes are listed at once
+        """
+        self.s3_manager = s3_manager
+        self.path = Path(path) if path is not None else None
+        self.reconcile_interval = reconcile_interval
+        self.max_workers = max(max_workers, 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # prefix -> {"last_key": str, "reconciled_at": float, "objects": {key: [size, last_modified, etag]}}
+        self._prefixes: dict[str, dict] = {}
+        self.load()
+        s3_manager.subscribe(self.on_bucket_change)
+
+    # ----------------------------
+    # Refreshing
+    # ----------------------------
+    def refresh(self, full: bool = False) -> list[dict]:
+        """
+        Bring the inventory up to date and return it, as S3Manager.list_files
+        would. full=True lists every prefix in full, whatever its age.
+        """
+        prefixes, root_objects = self._list_prefixes()
+        now = self._clock()
+        with self._lock:
+            self._prefixes[ROOT_PREFIX] = {"last_key": "", "reconciled_at": now, "objects": root_objects}
+            for gone in set(self._prefixes) - set(prefixes) - {ROOT_PREFIX}:
+                del self._prefixes[gone]
+            states = {prefix: self._prefixes.get(prefix) for prefix in prefixes}
+
+        def refresh_prefix(prefix: str) -> tuple[str, dict]:
+            state = states[prefix]
+            if full or state is None or now - state["reconciled_at"] >= self.reconcile_interval:
+                return prefix, {"reconciled": True, "objects": self._list(prefix)}
+            return prefix, {"reconciled": False, "objects": self._list(prefix, start_after=state["last_key"])}
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(prefixes), 1))) as pool:
+            listings = list(pool.map(refresh_prefix, prefixes))
+
+        added = 0
+        with self._lock:
+            for prefix, listing in listings:
+                if listing["reconciled"]:
+                    state = {"last_key": "", "reconciled_at": now, "objects": listing["objects"]}
+                    self._prefixes[prefix] = state
+                else:
+                    state = self._prefixes.setdefault(prefix, {"last_key": "", "reconciled_at": now, "objects": {}})
+                    state["objects"].update(listing["objects"])
+                    added += len(listing["objects"])
+                state["last_key"] = max(state["objects"], default=state["last_key"])
+        logger.info(f"S3 inventory: {len(prefixes)} prefixes, {added} new objects found incrementally, "
+                    f"{sum(1 for _, listing in listings if listing['reconciled'])} prefixes reconciled")
+        self.save()
+        return self.files()
+
+    def _list_prefixes(self) -> tuple[list[str], dict[str, list]]:
+        """The bucket's top-level prefixes, and the objects outside them."""
+        paginator = self.s3_manager.s3.get_paginator('list_objects_v2')
+        prefixes, root_objects = [], {}
+        for page in paginator.paginate(Bucket=self.s3_manager.S3_BUCKET, Delimiter="/"):
+            prefixes.extend(common["Prefix"] for common in page.get("CommonPrefixes", []))
+            root_objects.update(self._entries(page))
+        return prefixes, root_objects
+
+    def _list(self, prefix: str, start_after: str = "") -> dict[str, list]:
+        paginator = self.s3_manager.s3.get_paginator('list_objects_v2')
+        kwargs = {"Bucket": self.s3_manager.S3_BUCKET, "Prefix": prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        objects = {}
+        for page in paginator.paginate(**kwargs):
+            objects.update(self._entries(page))
+        return objects
+
+    @staticmethod
+    def _entries(page: dict) -> dict[str, list]:
+        return {obj["Key"]: [obj["Size"], obj["LastModified"].timestamp(), obj.get("ETag", "").strip('"')]
+                for obj in page.get("Contents", [])}
+
+    # ----------------------------
+    # Reading
+    # ----------------------------
+    def files(self, prefix: str | None = None) -> list[dict]:
+        """Every object (or those under prefix) as S3Manager.list_files returns them, oldest first."""
+        with self._lock:
+            states = [self._prefixes.get(prefix, {"objects": {}})] if prefix is not None \
+                else list(self._prefixes.values())
+            files = [{"name": key, "size": size, "last_modified": datetime.fromtimestamp(modified, timezone.utc),
+                      "etag": etag}
+                     for state in states for key, (size, modified, etag) in state["objects"].items()]
+        files.sort(key=lambda file: file["last_modified"])
+        return files
+
+    def iter_files(self) -> Iterator[dict]:
+        """
+        Every object as files() returns them, but in key order, as S3 lists
+        them. Each prefix is copied and sorted as it is reached, so on top of
+        the inventory itself this holds the largest prefix's objects at once.
+        """
+        with self._lock:
+            prefixes = sorted(prefix for prefix in self._prefixes if prefix != ROOT_PREFIX)
+
+        def prefix_files(prefix: str) -> list[dict]:
+            return sorted(self.files(prefix), key=lambda file: file["name"])
+
+        def all_prefixes() -> Iterator[dict]:
+            for prefix in prefixes:
+                yield from prefix_files(prefix)
+
+        # objects outside any prefix sort among the prefixes
+        yield from heapq.merge(prefix_files(ROOT_PREFIX), all_prefixes(), key=lambda file: file["name"])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(state["objects"]) for state in self._prefixes.values())
+
+    # ----------------------------
+    # Changes we made ourselves
+    # ----------------------------
+    def on_bucket_change(self, old_key: str | None, new_key: str | None, size: int | None) -> None:
+        etag = ""  # unknown for what we uploaded, until the next full listing
+        with self._lock:
+            if old_key is not None:
+                old = self._state_for(old_key)["objects"].pop(old_key, None)
+                if old is not None:
+                    size = old[0] if size is None else size
+                    etag = old[2]  # a rename copies the object as it is
+            if new_key is not None:
+                self._state_for(new_key)["objects"][new_key] = [size or 0, self._clock(), etag]
+
+    def _state_for(self, key: str) -> dict:
+        """Call with _lock held."""
+        prefix = key[:key.index("/") + 1] if "/" in key else ROOT_PREFIX
+        # reconciled_at 0 makes a prefix we haven't listed yet get listed in full
+        return self._prefixes.setdefault(prefix, {"last_key": "", "reconciled_at": 0.0, "objects": {}})
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with self.path.open("r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") != self.VERSION:
+                return
+            prefixes = data["prefixes"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable S3 inventory {self.path}: {e}")
+            return
+        with self._lock:
+            self._prefixes = prefixes
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            data = json.dumps({"version": self.VERSION, "prefixes": self._prefixes})
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with tmp_path.open("w", encoding="utf-8") as file:
+                file.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save S3 inventory {self.path}: {e}")
@@ -1,8 +1,35 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 
+from ImageCodec import content_type
+from S3Manifest import ManifestEntry, S3Manifest
+
+
+DELETE_BATCH_SIZE = 1000  # the most keys one delete_objects request accepts
+MISSING_ERROR_CODES = {"NoSuchKey", "404", "NotFound"}
+
+
+@dataclass
+class OperationResult:
+    """The outcome of one key in a bulk operation; see S3Manager.rename_many and delete_many."""
+    key: str
+    ok: bool
+    new_key: str | None = None  # for renames
+    missing: bool = False  # the key wasn't in the bucket
+    error: str | None = None
+
+
+def _error_code(e: Exception) -> str | None:
+    return e.response.get("Error", {}).get("Code") if isinstance(e, ClientError) else None
+
 
 class S3Manager(object):
     """
@@ -13,30 +40,95 @@ class S3Manager(object):
     S3_BUCKET = "im-im-images"  # Change to your bucket name
     AWS_REGION = "us-east-1"  # Change to your AWS region
 
-    def __init__(self):
+    def __init__(self, transfer_config: TransferConfig | None = None, max_workers: int = 8,
+                 manifest: S3Manifest | None = None):
         """
         Initializes the S3Manager class by creating an S3 client.
         The client uses AWS credentials configured in the system.
+
+        :param transfer_config: how uploads and downloads are split into parts
+        and run in parallel; see transfer_config_from()
+        :param max_workers: how many copies rename_many runs at once
+        :param manifest: optional; when given, existence checks are answered
+        from it instead of with HEAD requests, see S3Manifest. While it is
+        stale they fall back to requests and the bucket is re-listed in the
+        background.
         """
         self.s3 = boto3.client("s3")  # Initialize an S3 client using boto3
+        self.transfer_config = transfer_config or S3Manager.transfer_config_from({})
+        self.max_workers = max(max_workers, 1)
+        self.manifest = manifest
+        self._refresh_thread: threading.Thread | None = None
+        self._refresh_lock = threading.Lock()
+        self._listeners: list[Callable[[str | None, str | None, int | None], None]] = []
 
-    def upload_to_s3(self, file_path, s3_key: str) -> None:
+    def subscribe(self, listener: Callable[[str | None, str | None, int | None], None]) -> None:
+        """
+        Call listener(old_key, new_key, size) after every change this manager
+        makes to the bucket: (None, key, size) for an upload, (old, new, size)
+        for a rename and (key, None, None) for a delete. size may be None.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, old_key: str | None, new_key: str | None, size: int | None = None) -> None:
+        for listener in self._listeners:
+            try:
+                listener(old_key, new_key, size)
+            except Exception as e:
+                print(f"❌ S3 change listener failed: {e}")
+
+    @staticmethod
+    def transfer_config_from(config) -> TransferConfig:
+        """Files over s3_multipart_threshold_mb go up in parts, s3_max_concurrency at a time."""
+        part_size = int(config.get("s3_multipart_threshold_mb", 8)) * 1024 * 1024
+        return TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                              max_concurrency=int(config.get("s3_max_concurrency", 4)), use_threads=True)
+
+    def put_file(self, file_path, s3_key: str, callback: Callable[[int], None] | None = None) -> None:
+        """
+        Upload file_path as s3_key, raising on failure. callback, if given, is
+        called with the number of bytes sent as each chunk goes out.
+        """
+        self.s3.upload_file(file_path, self.S3_BUCKET, s3_key, ExtraArgs={"ContentType": content_type(file_path)},
+                            Callback=callback, Config=self.transfer_config)
+        size = os.path.getsize(file_path)
+        if self.manifest is not None:
+            self.manifest.put(ManifestEntry(key=s3_key, size=size, etag="", last_modified=time.time()))
+        self._notify(None, s3_key, size)
+
+    def get_file(self, s3_key: str, local_file_path: str, callback: Callable[[int], None] | None = None) -> None:
+        """
+        Download s3_key to local_file_path, creating directories as needed and
+        raising on failure. callback is as for put_file.
+        """
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+        self.s3.download_file(
+            Bucket=self.S3_BUCKET,
+            Key=s3_key,
+            Filename=local_file_path,
+            Callback=callback,
+            Config=self.transfer_config
+        )
+
+    def upload_to_s3(self, file_path, s3_key: str) -> bool:
         """
         Uploads a given file to the specified S3 bucket.
 
         :param file_path: Path to the image file that needs to be uploaded.
         :param s3_key: S3 key to upload the file to, similar to a file path,
         e.g. "halloween/20250201T112210 output_image.png"
-        :return: None
+        :return: True if the file was uploaded
         """
         file_name = os.path.basename(file_path)  # Extract just the filename from the full path
 
         try:
-            self.s3.upload_file(file_path, self.S3_BUCKET, s3_key)
+            self.put_file(file_path, s3_key)
             print(f"✅ Uploaded {file_name} to S3 bucket: {self.S3_BUCKET + '/' + s3_key}")
+            return True
         except Exception as e:
             # Handle any errors that occur during the upload process
             print(f"❌ Upload of {file_name} to S3 failed: {e}")
+            return False
 
     def download_from_s3(self, s3_key: str, local_file_path: str) -> None:
         """
@@ -48,14 +140,7 @@ class S3Manager(object):
         :return: None
         """
         try:
-            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-
-            self.s3.download_file(
-                Bucket=self.S3_BUCKET,
-                Key=s3_key,
-                Filename=local_file_path
-            )
-
+            self.get_file(s3_key, local_file_path)
             print(f"✅ Downloaded {s3_key} to : {local_file_path}")
 
         except ClientError as e:
@@ -66,11 +151,11 @@ class S3Manager(object):
     def list_files(self, extension=None, ascending=True):
         """
         Gets a list of all files in the S3 bucket, optionally filtered by extension
-        and sorted by date.
+        and sorted by date. A full listing (no extension) also re-seeds the manifest.
 
         :param extension: File extension to filter by (e.g., '.jpg', '.png')
         :param ascending: Sort by date ascending if True, descending if False
-        :return: List of dictionaries containing file info (name, size, last_modified)
+        :return: List of dictionaries containing file info (name, size, last_modified, etag)
         """
         try:
             # Get list of objects in the bucket
@@ -78,11 +163,18 @@ class S3Manager(object):
             pages = paginator.paginate(Bucket=self.S3_BUCKET)
 
             files = []
+            entries = []
+            if self.manifest is not None and not extension:
+                self.manifest.start_listing()
             for page in pages:
                 if 'Contents' not in page:
                     continue
 
                 for obj in page['Contents']:
+                    if self.manifest is not None and not extension:
+                        entries.append(ManifestEntry(key=obj['Key'], size=obj['Size'],
+                                                     etag=obj.get('ETag', '').strip('"'),
+                                                     last_modified=obj['LastModified'].timestamp()))
                     # If extension is specified, filter files
                     if extension:
                         if not obj['Key'].lower().endswith(extension.lower()):
@@ -91,9 +183,13 @@ class S3Manager(object):
                     files.append({
                         'name': obj['Key'],
                         'size': obj['Size'],
-                        'last_modified': obj['LastModified']
+                        'last_modified': obj['LastModified'],
+                        'etag': obj.get('ETag', '').strip('"')
                     })
 
+            if self.manifest is not None and not extension:
+                self.manifest.seed(entries)
+
             # Sort files by last modified date
             files.sort(
                 key=lambda x: x['last_modified'],
@@ -106,15 +202,46 @@ class S3Manager(object):
             print(f"❌ Failed to list files from S3: {e}")
             return []
 
-    def is_in_s3(self, s3_prefix: str, filename: str) -> bool:
-        cur_key = f"{s3_prefix}/{filename}"
+    def refresh_manifest(self) -> None:
+        """Re-seed the manifest from a full listing of the bucket."""
+        self.list_files()
+
+    def refresh_manifest_in_background(self) -> threading.Thread:
+        """Start refresh_manifest on a thread of its own, unless one is already running; returns that thread."""
+        with self._refresh_lock:
+            if self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(target=self.refresh_manifest, name="S3ManifestRefresh",
+                                                        daemon=True)
+                self._refresh_thread.start()
+            return self._refresh_thread
+
+    def _manifest_is_usable(self) -> bool:
+        """
+        True if the manifest can answer for the bucket. A stale one can't;
+        the bucket is re-listed in the background meanwhile, so callers
+        (the Tk thread, when rating) never wait for the listing.
+        """
+        if self.manifest is None:
+            return False
+        if self.manifest.is_fresh():
+            return True
+        self.refresh_manifest_in_background()
+        return False
+
+    def exists(self, key: str) -> bool:
+        """Whether key is in the bucket: a manifest lookup if there is one, else a HEAD request."""
+        if self._manifest_is_usable():
+            return key in self.manifest
         try:
             # Attempt to get metadata to check if the object exists
-            self.s3.head_object(Bucket=self.S3_BUCKET, Key=cur_key)
+            self.s3.head_object(Bucket=self.S3_BUCKET, Key=key)
             return True
-        except self.s3.exceptions.ClientError as e:
+        except ClientError:
             return False
 
+    def is_in_s3(self, s3_prefix: str, filename: str) -> bool:
+        return self.exists(f"{s3_prefix}/{filename}")
+
     def delete_file(self, cur_key: str) -> bool:
         try:
             # Delete the original object
@@ -122,6 +249,9 @@ class S3Manager(object):
                 Bucket=self.S3_BUCKET,
                 Key=cur_key
             )
+            if self.manifest is not None:
+                self.manifest.discard(cur_key)
+            self._notify(cur_key, None)
             return True
         except self.s3.exceptions.ClientError as e:
             print(f"failed to delete file: {e}")
@@ -133,11 +263,8 @@ class S3Manager(object):
         keys to contain any pathing/prefixes, e.g. 'path/to/old_file.txt'.
         Raises an exception if the file does not exist in S3.
         """
-        try:
-            # Check if the object exists
-            self.s3.head_object(Bucket=self.S3_BUCKET, Key=old_key)
-        except self.s3.exceptions.ClientError as e:
-            raise Exception(f"S3 file with key '{old_key}' does not exist.") from e
+        if not self.exists(old_key):
+            raise Exception(f"S3 file with key '{old_key}' does not exist.")
 
         # Copy the object to a new key
         self.s3.copy_object(
@@ -151,6 +278,9 @@ class S3Manager(object):
             Bucket=self.S3_BUCKET,
             Key=old_key
         )
+        if self.manifest is not None:
+            self.manifest.rename(old_key, new_key)
+        self._notify(old_key, new_key)
 
     def change_name_in_cloud(self, s3_prefix: str, cur_filename: str, new_filename: str):
         """
@@ -162,14 +292,91 @@ class S3Manager(object):
         cur_key = f"{s3_prefix}/{cur_filename}".replace("//", "/")
         new_key = f"{s3_prefix}/{new_filename}".replace("//", "/")
         print(f"S3: changing name from {cur_key} to {new_key}r4")
-        try:
-            # Check if the object exists
-            self.s3.head_object(Bucket=self.S3_BUCKET, Key=cur_key)
-        except self.s3.exceptions.ClientError as e:
-            raise Exception(f"S3 file with key '{cur_key}' does not exist.") from e
+        if not self.exists(cur_key):
+            raise Exception(f"S3 file with key '{cur_key}' does not exist.")
 
         # Copy the object to the new key
         copy_source = {'Bucket': self.S3_BUCKET, 'Key': cur_key}
         self.s3.copy_object(Bucket=self.S3_BUCKET, CopySource=copy_source, Key=new_key)
         # Delete the old object
         self.s3.delete_object(Bucket=self.S3_BUCKET, Key=cur_key)
+        if self.manifest is not None:
+            self.manifest.rename(cur_key, new_key)
+        self._notify(cur_key, new_key)
+
+    def delete_many(self, keys: list[str]) -> list[OperationResult]:
+        """
+        Delete keys with delete_objects requests of up to 1000 keys each.
+        Returns a result per key; deleting a key that doesn't exist succeeds.
+        """
+        results = self._delete_objects(keys)
+        for result in results:
+            if result.ok:
+                if self.manifest is not None:
+                    self.manifest.discard(result.key)
+                self._notify(result.key, None)
+        return results
+
+    def _delete_objects(self, keys: list[str]) -> list[OperationResult]:
+        results = []
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start:start + DELETE_BATCH_SIZE]
+            try:
+                response = self.s3.delete_objects(
+                    Bucket=self.S3_BUCKET,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True})
+            except Exception as e:
+                results.extend(OperationResult(key=key, ok=False, error=str(e)) for key in batch)
+                continue
+            errors = {error["Key"]: f"{error.get('Code')}: {error.get('Message')}"
+                      for error in response.get("Errors", [])}
+            results.extend(OperationResult(key=key, ok=key not in errors, error=errors.get(key)) for key in batch)
+        return results
+
+    def _copy(self, old_key: str, new_key: str) -> OperationResult:
+        try:
+            self.s3.copy_object(Bucket=self.S3_BUCKET, CopySource={'Bucket': self.S3_BUCKET, 'Key': old_key},
+                                Key=new_key)
+            return OperationResult(key=old_key, ok=True, new_key=new_key)
+        except Exception as e:
+            return OperationResult(key=old_key, ok=False, new_key=new_key,
+                                   missing=_error_code(e) in MISSING_ERROR_CODES, error=str(e))
+
+    def rename_many(self, pairs: list[tuple[str, str]]) -> list[OperationResult]:
+        """
+        Rename each (old_key, new_key) in pairs: the copies run concurrently,
+        max_workers at a time, then the old keys of the successful copies are
+        deleted in bulk. Returns a result per pair, in order; a pair whose
+        old_key isn't in the bucket comes back with missing=True. No HEAD
+        requests are made; a missing key is detected by its failed copy, or
+        from the manifest without a request at all.
+        """
+        if not pairs:
+            return []
+        use_manifest = self._manifest_is_usable()
+
+        def rename_one(pair: tuple[str, str]) -> OperationResult:
+            if use_manifest and pair[0] not in self.manifest:
+                return OperationResult(key=pair[0], ok=False, new_key=pair[1], missing=True, error="not in manifest")
+            return self._copy(*pair)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pairs))) as pool:
+            results = list(pool.map(rename_one, pairs))
+        copied = [r for r in results if r.ok]
+        deletions = {result.key: result for result in self._delete_objects([r.key for r in copied])}
+        for result in copied:
+            entry = self.manifest.get(result.key) if self.manifest is not None else None
+            size = entry.size if entry is not None else None
+            if deletions[result.key].ok:
+                if self.manifest is not None:
+                    self.manifest.rename(result.key, result.new_key)
+                self._notify(result.key, result.new_key, size)
+            else:
+                result.ok = False
+                result.error = f"copied to {result.new_key}, but not deleted: {deletions[result.key].error}"
+                if entry is not None:
+                    self.manifest.put(ManifestEntry(key=result.new_key, size=entry.size, etag=entry.etag,
+                                                    last_modified=time.time()))
+                self._notify(None, result.new_key, size)
+        return results
+
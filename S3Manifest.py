@@ -0,0 +1,194 @@
+"""
+Module: S3Manifest.py
+
+A local copy of the bucket's key list, with each object's size, ETag and
+last-modified time, so that S3Manager can answer "is this key in S3?" from
+memory instead of with a HEAD request per file. It is seeded from one full
+listing, kept current by S3Manager on every upload, rename and delete it
+makes, and trusted for max_age seconds after the listing it was seeded
+from; after that, lookups go to S3 while the bucket is listed again in the
+background. Changes made to the bucket by anything else (another device,
+the console) are only seen after that re-listing, which is the staleness
+bound.
+
+The manifest is saved to s3_manifest.json so a restart within max_age
+doesn't need a listing either. Our own changes are saved save_delay
+seconds after they are made (a burst of them in one write), so a crash
+loses at most the last few seconds of them rather than the whole session.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ManifestEntry:
+    key: str
+    size: int
+    etag: str  # empty when not known, e.g. right after an upload
+    last_modified: float  # seconds since the epoch
+
+
+class S3Manifest:
+    MANIFEST_FILE_NAME: str = "s3_manifest.json"
+
+    def __init__(self, path: str | None = MANIFEST_FILE_NAME, max_age: float = 3600.0,
+                 clock: Callable[[], float] = time.time, save_delay: float = 5.0):
+        """
+        :param path: where the manifest is saved; None keeps it in memory only
+        :param max_age: seconds the manifest is trusted after the listing it was seeded from
+        :param save_delay: seconds after a change before it is saved; 0 saves every change at once
+        """
+        self.path = Path(path) if path is not None else None
+        self.max_age = max_age
+        self.save_delay = save_delay
+        self._clock = clock
+        self._entries: dict[str, ManifestEntry] = {}
+        self._seeded_at: float | None = None
+        self._dirty = False
+        self._save_timer: threading.Timer | None = None
+        self._since_listing: dict[str, ManifestEntry | None] | None = None  # see start_listing
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one write to the file at a time: the timer's, or quit's
+        self.load()
+
+    @staticmethod
+    def from_config(config) -> "S3Manifest":
+        return S3Manifest(max_age=float(config.get("s3_manifest_max_age_seconds", 3600)))
+
+    def _changed(self) -> None:
+        """Mark the manifest dirty and schedule a save; call with _lock held."""
+        self._dirty = True
+        if self.path is None or self._save_timer is not None or self.save_delay <= 0:
+            return
+        self._save_timer = threading.Timer(self.save_delay, self.save)
+        self._save_timer.name = "S3ManifestSave"
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def is_fresh(self) -> bool:
+        with self._lock:
+            return self._seeded_at is not None and self._clock() - self._seeded_at < self.max_age
+
+    def start_listing(self) -> None:
+        """
+        Note that a full listing has begun: changes made from now until the
+        seed() with its result are applied on top of it, as the listing may
+        have been taken before they were made.
+        """
+        with self._lock:
+            self._since_listing = {}
+
+    def seed(self, entries: Iterable[ManifestEntry]) -> None:
+        """Replace everything with the result of a full listing."""
+        with self._lock:
+            self._entries = {entry.key: entry for entry in entries}
+            for key, entry in (self._since_listing or {}).items():
+                if entry is None:
+                    self._entries.pop(key, None)
+                else:
+                    self._entries[key] = entry
+            self._since_listing = None
+            self._seeded_at = self._clock()
+            self._dirty = True
+        self.save()
+
+    def invalidate(self) -> None:
+        """Force a re-listing before the manifest is trusted again."""
+        with self._lock:
+            self._seeded_at = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> ManifestEntry | None:
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, entry: ManifestEntry) -> None:
+        with self._lock:
+            self._entries[entry.key] = entry
+            self._record(entry.key, entry)
+            self._changed()
+        self._save_now()
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return
+            self._record(key, None)
+            self._changed()
+        self._save_now()
+
+    def rename(self, old_key: str, new_key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(old_key, None)
+            if entry is None:
+                return
+            entry.key = new_key
+            self._entries[new_key] = entry
+            self._record(old_key, None)
+            self._record(new_key, entry)
+            self._changed()
+        self._save_now()
+
+    def _record(self, key: str, entry: ManifestEntry | None) -> None:
+        """Remember a change for the listing in progress, if any; call with _lock held."""
+        if self._since_listing is not None:
+            self._since_listing[key] = entry
+
+    def _save_now(self) -> None:
+        if self.save_delay <= 0:
+            self.save()
+
+    # ----------------------------
+    # Persistence
+    # ----------------------------
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with self.path.open("r", encoding="utf-8") as file:
+                data = json.load(file)
+            entries = {entry["key"]: ManifestEntry(**entry) for entry in data["entries"]}
+            seeded_at = float(data["seeded_at"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable S3 manifest {self.path}: {e}")
+            return
+        with self._lock:
+            self._entries = entries
+            self._seeded_at = seeded_at
+            self._dirty = False
+
+    def save(self) -> None:
+        """Write the manifest out if it changed since it was last saved or loaded."""
+        if self.path is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()  # a no-op when save is the timer firing
+                    self._save_timer = None
+                if not self._dirty or self._seeded_at is None:
+                    return
+                data = {"seeded_at": self._seeded_at, "entries": [asdict(entry) for entry in self._entries.values()]}
+                self._dirty = False
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            try:
+                with tmp_path.open("w", encoding="utf-8") as file:
+                    json.dump(data, file)  # type: ignore
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Failed to save S3 manifest {self.path}: {e}")
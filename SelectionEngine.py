@@ -0,0 +1,260 @@
+"""
+Module: SelectionEngine.py
+
+Chooses which library image to show next. Each image gets a weight from
+its rating (see DEFAULT_RATING_WEIGHTS), held in a Fenwick tree so that a
+weighted random draw, adding or removing an image and re-rating it are all
+O(log n). A no-repeat window keeps an image from being shown again until
+no_repeat_window others have been; the window is persisted so it survives
+restarts. Images are identified by theme and timestamp prefix rather than
+full path, so re-rating (which renames the file) keeps its place.
+"""
+import json
+import logging
+import math
+import os
+import random
+import threading
+from collections import deque
+from pathlib import Path
+
+from LibraryIndex import LibraryRecord, PREFIX_LEN, UNRATED
+
+logger = logging.getLogger(__name__)
+
+# Relative likelihood of an image being shown, by whole-number rating.
+DEFAULT_RATING_WEIGHTS: dict[str, float] = {
+    "unrated": 1.0, "0": 0.25, "1": 0.5, "2": 1.0, "3": 2.0, "4": 4.0, "5": 8.0,
+}
+WEIGHT_SCALE = 1000  # weights are stored as integers so the tree never drifts
+
+
+def image_identity(path: str) -> str:
+    """'image_out/creative/20250219T171207_output_image r[3.0].png' -> 'creative/20250219T171207'"""
+    theme_dir, name = os.path.split(os.fspath(path))
+    return f"{os.path.basename(theme_dir)}/{name[:PREFIX_LEN]}"
+
+
+class FenwickTree:
+    """A binary indexed tree of non-negative integers that can grow."""
+
+    def __init__(self):
+        self._tree: list[int] = [0]  # 1-based
+        self._values: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @property
+    def total(self) -> int:
+        return self.prefix_sum(len(self._values))
+
+    def value(self, idx: int) -> int:
+        return self._values[idx]
+
+    def prefix_sum(self, count: int) -> int:
+        """Sum of the first count values."""
+        total = 0
+        while count > 0:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+    def append(self, value: int) -> int:
+        i = len(self._values) + 1
+        self._values.append(value)
+        self._tree.append(value + self.prefix_sum(i - 1) - self.prefix_sum(i - (i & -i)))
+        return i - 1
+
+    def set(self, idx: int, value: int) -> None:
+        delta = value - self._values[idx]
+        if delta == 0:
+            return
+        self._values[idx] = value
+        i = idx + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def find(self, target: int) -> int:
+        """The index whose cumulative range contains target, for 0 <= target < total."""
+        pos, remaining = 0, target
+        step = 1 << (len(self._values).bit_length() - 1) if self._values else 0
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= remaining:
+                pos = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return pos
+
+
+class SelectionEngine:
+    HISTORY_FILE_NAME: str = "selection_history.json"
+
+    def __init__(self, rating_weights: dict[str, float] | None = None, min_rating: float = 0.0,
+                 no_repeat_window: int = 0, history_path: str | None = HISTORY_FILE_NAME,
+                 theme: str | None = None):
+        """
+        :param rating_weights: weight by whole-number rating, plus "unrated"
+        :param min_rating: as minimum_rating_filter; below 1.0 means no filtering
+        :param no_repeat_window: how many other images must be shown before one repeats
+        :param history_path: where the no-repeat window is persisted; None to not persist
+        :param theme: if given, library changes for other themes are ignored
+        """
+        self.theme = theme
+        self.rating_weights = {**DEFAULT_RATING_WEIGHTS, **(rating_weights or {})}
+        self.min_rating = min_rating
+        self.history_path = Path(history_path) if history_path else None
+        self._tree = FenwickTree()
+        self._paths: list[str | None] = []
+        self._ratings: list[float] = []
+        self._slot_of: dict[str, int] = {}
+        self._free: list[int] = []
+        self._recent: deque[str] = deque(maxlen=max(no_repeat_window, 0))
+        self._lock = threading.Lock()
+        self._load_history()
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def weight_for(self, rating: float) -> int:
+        if self.min_rating >= 1.0 and rating < self.min_rating:
+            return 0
+        key = "unrated" if rating == UNRATED else str(min(int(math.floor(rating)), 5))
+        return max(int(round(float(self.rating_weights.get(key, 1.0)) * WEIGHT_SCALE)), 0)
+
+    # ----------------------------
+    # In-place updates
+    # ----------------------------
+    def add(self, path: str, rating: float) -> None:
+        """Add an image, or update the path and rating of one already known."""
+        with self._lock:
+            self._add(os.fspath(path), rating)
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self._remove(os.fspath(path))
+
+    def _add(self, path: str, rating: float) -> None:
+        identity = image_identity(path)
+        weight = 0 if identity in self._recent else self.weight_for(rating)
+        slot = self._slot_of.get(identity)
+        if slot is None and self._free:
+            slot = self._free.pop()
+        if slot is None:
+            slot = self._tree.append(weight)
+            self._paths.append(path)
+            self._ratings.append(rating)
+        else:
+            self._paths[slot] = path
+            self._ratings[slot] = rating
+            self._tree.set(slot, weight)
+        self._slot_of[identity] = slot
+
+    def _remove(self, path: str) -> None:
+        slot = self._slot_of.get(image_identity(path))
+        if slot is None or self._paths[slot] != path:
+            return  # unknown, or already replaced by a renamed file
+        del self._slot_of[image_identity(path)]
+        self._tree.set(slot, 0)
+        self._paths[slot] = None
+        self._free.append(slot)
+
+    def on_library_change(self, theme: str, path: str, rating: float | None) -> None:
+        """A LibraryIndex listener; see LibraryIndex.subscribe."""
+        if self.theme is not None and theme != self.theme:
+            return
+        if rating is None:
+            self.remove(path)
+        else:
+            self.add(path, rating)
+
+    def sync(self, records: list[LibraryRecord]) -> None:
+        """Seed from (or reconcile with) a list of library records."""
+        wanted = {os.fspath(record.image_path): record.rating for record in records}
+        with self._lock:
+            for path in [p for p in self._paths if p is not None and p not in wanted]:
+                self._remove(path)
+            for path, rating in wanted.items():
+                self._add(path, rating)
+
+    # ----------------------------
+    # Drawing
+    # ----------------------------
+    def draw(self, record: bool = True) -> str | None:
+        """
+        Choose an image, weighted by rating and skipping the no-repeat window,
+        and record it as shown unless record is False; an image chosen ahead
+        of time is recorded with record_shown() once it is on screen. If the
+        window or the rating floor excludes everything, the oldest entries in
+        the window are released first, then any image is eligible, as
+        minimum_rating_filter always behaved.
+        """
+        with self._lock:
+            if not self._slot_of:
+                return None
+            while self._tree.total == 0 and self._recent:
+                self._release(self._recent.popleft())
+            if self._tree.total > 0:
+                slot = self._tree.find(random.randrange(self._tree.total))
+                path = self._paths[slot]
+            else:
+                logger.warning(f"No images found with min rating of >= {self.min_rating}")
+                path = self._paths[random.choice(list(self._slot_of.values()))]
+            if record:
+                self._mark_shown(image_identity(path))
+        if record:
+            self._save_history()
+        return path
+
+    def record_shown(self, path: str) -> None:
+        """Add an image drawn with record=False to the no-repeat window, now that it is being shown."""
+        identity = image_identity(os.fspath(path))
+        with self._lock:
+            if identity not in self._slot_of:
+                return  # e.g. chosen before a theme change
+            self._mark_shown(identity)
+        self._save_history()
+
+    def _mark_shown(self, identity: str) -> None:
+        if self._recent.maxlen == 0:
+            return
+        if identity in self._recent:
+            self._recent.remove(identity)
+        elif len(self._recent) == self._recent.maxlen:
+            self._release(self._recent.popleft())
+        self._recent.append(identity)
+        slot = self._slot_of.get(identity)
+        if slot is not None:
+            self._tree.set(slot, 0)
+
+    def _release(self, identity: str) -> None:
+        slot = self._slot_of.get(identity)
+        if slot is not None:
+            self._tree.set(slot, self.weight_for(self._ratings[slot]))
+
+    # ----------------------------
+    # Persistence of the no-repeat window
+    # ----------------------------
+    def _load_history(self) -> None:
+        if self.history_path is None or not self.history_path.exists() or self._recent.maxlen == 0:
+            return
+        try:
+            with self.history_path.open("r", encoding="utf-8") as file:
+                self._recent.extend(json.load(file))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable selection history {self.history_path}: {e}")
+
+    def _save_history(self) -> None:
+        if self.history_path is None or self._recent.maxlen == 0:
+            return
+        with self._lock:
+            recent = list(self._recent)
+        tmp_path = self.history_path.with_name(self.history_path.name + ".tmp")
+        try:
+            with tmp_path.open("w", encoding="utf-8") as file:
+                json.dump(recent, file, indent=4)  # type: ignore
+            os.replace(tmp_path, self.history_path)
+        except OSError as e:
+            logger.warning(f"Failed to save selection history {self.history_path}: {e}")
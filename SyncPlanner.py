@@ -0,0 +1,536 @@
+"""
+Module: SyncPlanner.py
+
+Plans and carries out a sync between image_out and the S3 bucket without
+holding either side in memory.
+
+SyncPlanner merge-joins two streams of files, each sorted by name (S3
+lists keys in that order; S3Sync.iter_local_files walks the disk in it),
+on the approximating key (see S3Sync.create_approximating_key) and yields
+SyncActions as it goes. Names that share a join key are always adjacent in
+name order, so only one group of files per side is held at a time, plus a
+bounded window of unmatched files used to spot local renames (below).
+That bound is the planner's own: S3Sync feeds it from S3Inventory, which
+keeps every object in the bucket in memory and sorts one prefix's worth
+at a time, so a whole S3Sync run still needs memory in proportion to the
+bucket. Where that matters, plan() can be fed straight from a
+list_objects_v2 paginator, which returns keys in the order it needs.
+
+SyncExecutor consumes the actions as they come, in batches: transfers go
+to a TransferEngine, S3 renames and deletes to S3Manager's bulk
+operations. Within a flush, transfers run before renames, so a truncated
+file is fetched again before it is renamed.
+
+A plan can also be written out as JSONL (write_plan), narrowed down
+(filter_actions) and applied later (apply_plan). Applying it records in a
+checkpoint file how many of its actions are done after each batch, so an
+interrupted run picks up where it stopped; repeating the actions of the
+batch that was cut short is harmless.
+"""
+import itertools
+import json
+import logging
+import os
+import re
+from collections import Counter, OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from ContentHash import DIFFERENT_CONTENT, DIFFERENT_SIZE, SAME, HashCache
+from S3Manager import S3Manager
+from TransferEngine import DOWNLOAD as TRANSFER_DOWNLOAD, UPLOAD as TRANSFER_UPLOAD, TransferEngine, TransferTask
+
+logger = logging.getLogger(__name__)
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+RENAME_REMOTE = "rename-remote"
+RENAME_LOCAL = "rename-local"
+DELETE_DUPE = "delete-dupe"
+ACTION_KINDS = (UPLOAD, DOWNLOAD, RENAME_REMOTE, RENAME_LOCAL, DELETE_DUPE)
+# which way an action carries changes: "up" changes the bucket, "down" changes image_out
+DIRECTIONS = {UPLOAD: "up", RENAME_REMOTE: "up", DELETE_DUPE: "up", DOWNLOAD: "down", RENAME_LOCAL: "down"}
+
+RATING_PATTERN = re.compile(r' r\[(\d+\.\d+)\]')
+# files whose identical content says nothing about them being the same file
+UNPAIRED_EXTENSIONS = {".txt"}
+
+
+@dataclass
+class SyncAction:
+    kind: str  # one of ACTION_KINDS
+    name: str  # the file as it is now: its local name for uploads and local renames, else its S3 key
+    new_name: str = ""  # renames: the name it gets; transfers: its name on the other side
+    size: int = 0
+    reason: str = ""
+
+
+def join_key(name: str) -> tuple[str, str]:
+    """
+    The approximating key split as (directory and timestamp prefix,
+    extension). Unlike the approximating key itself, the first part is a
+    prefix of the name, so these keys come out in order for names that do.
+    """
+    directory_length = name.rfind("/") + 1
+    filename = name[directory_length:]
+    return name[:directory_length + 15], os.path.splitext(filename)[1]
+
+
+def is_syncable_name(name: str) -> bool:
+    """Names that follow our '<theme>/<timestamp> ...' convention; anything else is left alone."""
+    directory, _, filename = name.rpartition("/")
+    return len(name) >= 17 and len(directory) >= 2 and len(filename) >= 15
+
+
+def has_rating(name: str) -> bool:
+    return RATING_PATTERN.search(name) is not None
+
+
+def rating_of(name: str) -> float | None:
+    match = RATING_PATTERN.search(name)
+    return float(match.group(1)) if match else None
+
+
+def _grouped(files: Iterable[dict], side: str) -> Iterator[tuple[tuple[str, str], list[dict]]]:
+    """
+    (join key, files) for a name-sorted stream, in join key order. Only the
+    files sharing the current key prefix are held, to order them by extension.
+    """
+    last_name = None
+    prefix, pending = None, []
+
+    def flush() -> Iterator[tuple[tuple[str, str], list[dict]]]:
+        by_extension: dict[str, list[dict]] = {}
+        for item in pending:
+            by_extension.setdefault(join_key(item['name'])[1], []).append(item)
+        for extension in sorted(by_extension):
+            yield (prefix, extension), by_extension[extension]
+
+    for item in files:
+        name = item['name']
+        if last_name is not None and name < last_name:
+            raise ValueError(f"{side} files are not sorted by name: '{name}' came after '{last_name}'")
+        last_name = name
+        item_prefix = join_key(name)[0]
+        if item_prefix != prefix:
+            yield from flush()
+            prefix, pending = item_prefix, []
+        pending.append(item)
+    if pending:
+        yield from flush()
+
+
+def _pairing_key(item: dict) -> tuple[str, str, int] | None:
+    """
+    What a local rename leaves unchanged, and so what a local-only file and
+    an S3-only object must share to be paired as one renamed file: the theme
+    directory, the extension and the size. None for files never paired:
+    prompt files, since two of them can hold the same text, empty files, and
+    objects without an ETag to compare content with.
+    """
+    name = item['name']
+    extension = join_key(name)[1]
+    if extension.lower() in UNPAIRED_EXTENSIONS or item['size'] == 0 or ('etag' in item and not item['etag']):
+        return None
+    return os.path.dirname(name), extension, item['size']
+
+
+class _HeldFiles:
+    """
+    SyncPlanner's window of unmatched files, oldest first, with those that
+    could still be paired indexed by side and _pairing_key, so looking for a
+    counterpart only compares files that could be one.
+    """
+
+    def __init__(self):
+        self._held: OrderedDict[int, tuple[SyncAction, str, tuple | None]] = OrderedDict()
+        self._by_key: dict[tuple, dict[int, dict]] = {}
+
+    def __len__(self) -> int:
+        return len(self._held)
+
+    def add(self, action: SyncAction, item: dict, side: str, key: tuple | None) -> None:
+        token = id(item)
+        self._held[token] = (action, side, key)
+        if key is not None:
+            self._by_key.setdefault((side, *key), {})[token] = item
+
+    def candidates(self, side: str, key: tuple | None) -> list[tuple[int, dict]]:
+        """(token, item) for the held files on side with the pairing key, oldest first."""
+        return list(self._by_key.get((side, *key), {}).items()) if key is not None else []
+
+    def remove(self, token: int) -> SyncAction:
+        action, side, key = self._held.pop(token)
+        if key is not None:
+            bucket = self._by_key[(side, *key)]
+            del bucket[token]
+            if not bucket:
+                del self._by_key[(side, *key)]
+        return action
+
+    def pop_oldest(self) -> SyncAction:
+        return self.remove(next(iter(self._held)))
+
+    def actions(self) -> list[SyncAction]:
+        return [action for action, _, _ in self._held.values()]
+
+
+class SyncPlanner:
+    def __init__(self, s3_manager: S3Manager, hashes: HashCache | None = None, root_dir: str = "image_out",
+                 move_window: int = 1000):
+        """
+        :param hashes: cache of local file hashes; by default one kept in memory
+        :param move_window: how many unmatched files are held back while looking for
+        a counterpart with the same content, i.e. a local file renamed beyond what the
+        approximating key tolerates; 0 turns that off
+        """
+        self.s3_manager = s3_manager
+        self.hashes = hashes if hashes is not None else HashCache(path=None)
+        self.root_dir = root_dir
+        self.move_window = max(move_window, 0)
+        self.stats: Counter = Counter()
+
+    def plan(self, s3_files: Iterable[dict], local_files: Iterable[dict]) -> Iterator[SyncAction]:
+        """
+        Actions that bring the two sides together. Both streams hold dicts with
+        'name' and 'size' (S3 ones also 'etag') and must be sorted by name.
+        """
+        s3_groups = _grouped((item for item in s3_files if not item['name'].endswith('/')), "S3")
+        local_groups = _grouped(local_files, "local")
+        unmatched = _HeldFiles()
+        s3_key, s3_items = next(s3_groups, (None, None))
+        local_key, local_items = next(local_groups, (None, None))
+        while s3_key is not None or local_key is not None:
+            if local_key is None or (s3_key is not None and s3_key < local_key):
+                yield from self._only_in_s3(s3_items, unmatched)
+                s3_key, s3_items = next(s3_groups, (None, None))
+            elif s3_key is None or local_key < s3_key:
+                yield from self._only_local(local_items, unmatched)
+                local_key, local_items = next(local_groups, (None, None))
+            else:
+                yield from self._in_both(local_items, s3_items)
+                s3_key, s3_items = next(s3_groups, (None, None))
+                local_key, local_items = next(local_groups, (None, None))
+            while len(unmatched) > self.move_window:
+                yield unmatched.pop_oldest()
+        yield from unmatched.actions()
+        self.hashes.save()
+
+    # ----------------------------
+    # One side only
+    # ----------------------------
+    def _only_in_s3(self, s3_items: list[dict], unmatched: _HeldFiles) -> Iterator[SyncAction]:
+        s3_item, deletes = self._keep_one_in_s3(s3_items)
+        yield from deletes
+        if s3_item is None:
+            return
+        yield from self._hold_or_match(
+            SyncAction(DOWNLOAD, s3_item['name'], s3_item['name'], s3_item['size'], "only in S3"),
+            s3_item, "s3", unmatched)
+
+    def _only_local(self, local_items: list[dict], unmatched: _HeldFiles) -> Iterator[SyncAction]:
+        local_item = self._pick(local_items, "local")
+        if not is_syncable_name(local_item['name']):
+            self.stats["skipped"] += 1
+            return
+        yield from self._hold_or_match(
+            SyncAction(UPLOAD, local_item['name'], local_item['name'], local_item['size'], "only local"),
+            local_item, "local", unmatched)
+
+    def _hold_or_match(self, action: SyncAction, item: dict, side: str,
+                       unmatched: _HeldFiles) -> Iterator[SyncAction]:
+        """
+        Pair item with a held-back file from the other side that has the same
+        content, which makes the two a rename in S3; otherwise hold it back.
+        """
+        if self.move_window:
+            key = _pairing_key(item)
+            for token, other in unmatched.candidates("s3" if side == "local" else "local", key):
+                local_item, s3_item = (item, other) if side == "local" else (other, item)
+                if self._is_moved(local_item, s3_item):
+                    unmatched.remove(token)
+                    self.stats["moved"] += 1
+                    yield SyncAction(RENAME_REMOTE, s3_item['name'], local_item['name'], s3_item['size'],
+                                     "same content as a renamed local file")
+                    return
+            unmatched.add(action, item, side, key)
+        else:
+            yield action
+
+    def _is_moved(self, local_item: dict, s3_item: dict) -> bool:
+        """
+        Whether a local-only file is an S3-only object renamed locally: the
+        same _pairing_key and the same bytes. A wrong pairing renames the S3
+        object away, so it is never downloaded.
+        """
+        key = _pairing_key(local_item)
+        if key is None or key != _pairing_key(s3_item) or not s3_item.get('etag'):
+            return False
+        return self.content_verdict(local_item, s3_item) == SAME
+
+    # ----------------------------
+    # Both sides
+    # ----------------------------
+    def _in_both(self, local_items: list[dict], s3_items: list[dict]) -> Iterator[SyncAction]:
+        s3_item, deletes = self._keep_one_in_s3(s3_items)
+        yield from deletes
+        if s3_item is None:
+            return
+        local_item = self._pick(local_items, "local")
+        local_name, s3_name = local_item['name'], s3_item['name']
+
+        verdict = self.content_verdict(local_item, s3_item)
+        if verdict == DIFFERENT_SIZE and local_item['size'] < s3_item['size']:
+            yield SyncAction(DOWNLOAD, s3_name, local_name, s3_item['size'],
+                             f"local file truncated ({local_item['size']} of {s3_item['size']} bytes)")
+        elif verdict == DIFFERENT_SIZE:
+            yield SyncAction(UPLOAD, local_name, s3_name, local_item['size'],
+                             f"S3 object truncated ({s3_item['size']} of {local_item['size']} bytes)")
+        elif verdict == DIFFERENT_CONTENT:
+            self.stats["content differs"] += 1
+            logger.warning(f"S3 and local content differ; leaving both as they are: {local_name} / {s3_name}")
+
+        if local_name == s3_name:
+            self.stats["in sync"] += 1
+        elif has_rating(local_name):
+            yield SyncAction(RENAME_REMOTE, s3_name, local_name, s3_item['size'], "rated locally")
+        elif has_rating(s3_name):
+            yield SyncAction(RENAME_LOCAL, local_name, s3_name, local_item['size'], "rated in S3")
+        else:
+            self.stats["name mismatch"] += 1
+            logger.debug(f"S3 and local names don't match: {local_name} / {s3_name}")
+
+    def _keep_one_in_s3(self, s3_items: list[dict]) -> tuple[dict | None, list[SyncAction]]:
+        """
+        (the object to keep, deletes for the rest). Ideally there is one
+        object per approximating key, but an interrupted copy-then-delete
+        rename leaves two; the rated one is kept. With no rated one we can't
+        tell, so nothing is kept or deleted.
+        """
+        if len(s3_items) == 1:
+            return s3_items[0], []
+        rated = [item for item in s3_items if has_rating(item['name'])]
+        if not rated:
+            self.stats["unresolved dupes"] += 1
+            logger.warning(f"Not sure which S3 dupe to keep: {[item['name'] for item in s3_items]}")
+            return None, []
+        keep = rated[0]
+        return keep, [SyncAction(DELETE_DUPE, item['name'], "", item['size'], f"dupe of {keep['name']}")
+                      for item in s3_items if item is not keep]
+
+    def _pick(self, local_items: list[dict], side: str) -> dict:
+        if len(local_items) > 1:
+            self.stats[f"{side} dupes"] += 1
+            logger.warning(f"Several {side} files share a key: {[item['name'] for item in local_items]}")
+        rated = [item for item in local_items if has_rating(item['name'])]
+        return (rated or local_items)[0]
+
+    def content_verdict(self, local_item: dict, s3_item: dict) -> str:
+        """How the two compare by content, whatever their names; see HashCache.compare."""
+        config = self.s3_manager.transfer_config
+        return self.hashes.compare(os.path.join(self.root_dir, local_item['name']), s3_item['size'],
+                                   s3_item.get('etag'), config.multipart_chunksize, config.multipart_threshold)
+
+
+@dataclass
+class SyncResult:
+    done: Counter = field(default_factory=Counter)
+    failed: list[tuple[SyncAction, str]] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        done = ", ".join(f"{count} {kind}" for kind, count in sorted(self.done.items())) or "nothing"
+        return f"done: {done}; {len(self.failed)} failed"
+
+
+class SyncExecutor:
+    def __init__(self, s3_manager: S3Manager, engine: TransferEngine | None = None, root_dir: str = "image_out",
+                 batch_size: int = 500):
+        """
+        :param batch_size: actions of one kind gathered before everything pending is carried out
+        """
+        self.s3_manager = s3_manager
+        self.engine = engine or TransferEngine(s3_manager)
+        self.root_dir = root_dir
+        self.batch_size = max(batch_size, 1)
+
+    def run(self, actions: Iterable[SyncAction], on_flush: Callable[[int], None] | None = None) -> SyncResult:
+        """
+        :param on_flush: called after each batch with how many actions have been
+        taken from actions so far, all of which have then been carried out (or failed)
+        """
+        result = SyncResult()
+        pending: dict[str, list[SyncAction]] = {kind: [] for kind in ACTION_KINDS}
+        taken = 0
+        for action in actions:
+            taken += 1
+            pending[action.kind].append(action)
+            if len(pending[action.kind]) >= self.batch_size:
+                self._flush(pending, result)
+                if on_flush is not None:
+                    on_flush(taken)
+        self._flush(pending, result)
+        if on_flush is not None:
+            on_flush(taken)
+        return result
+
+    def _flush(self, pending: dict[str, list[SyncAction]], result: SyncResult) -> None:
+        """Carry out everything pending: transfers first, then renames, then deletes."""
+        transfers = pending[UPLOAD] + pending[DOWNLOAD]
+        if transfers:
+            self._transfer(transfers, result)
+        if pending[RENAME_REMOTE]:
+            self._rename_remote(pending[RENAME_REMOTE], result)
+        for action in pending[RENAME_LOCAL]:
+            self._rename_local(action, result)
+        if pending[DELETE_DUPE]:
+            self._delete(pending[DELETE_DUPE], result)
+        for batch in pending.values():
+            batch.clear()
+
+    def _transfer(self, actions: list[SyncAction], result: SyncResult) -> None:
+        tasks = {}
+        for action in actions:
+            if action.kind == UPLOAD:
+                task = TransferTask(TRANSFER_UPLOAD, action.new_name, os.path.join(self.root_dir, action.name),
+                                    action.size)
+            else:
+                task = TransferTask(TRANSFER_DOWNLOAD, action.name, os.path.join(self.root_dir, action.new_name),
+                                    action.size)
+            tasks[id(task)] = (task, action)
+        summary = self.engine.run([task for task, _ in tasks.values()])
+        failed = {id(task): error for task, error in summary.failed}
+        for token, (_, action) in tasks.items():
+            self._record(action, failed.get(token), result)
+
+    def _rename_remote(self, actions: list[SyncAction], result: SyncResult) -> None:
+        results = self.s3_manager.rename_many([(action.name, action.new_name) for action in actions])
+        by_key = {outcome.key: outcome for outcome in results}
+        for action in actions:
+            outcome = by_key.get(action.name)
+            if outcome is not None and outcome.missing and self.s3_manager.exists(action.new_name):
+                self._record(action, None, result)  # renamed by a run that was cut short
+                continue
+            self._record(action, None if outcome is not None and outcome.ok else
+                         (outcome.error if outcome is not None else "no result"), result)
+
+    def _rename_local(self, action: SyncAction, result: SyncResult) -> None:
+        old_path = os.path.join(self.root_dir, action.name)
+        new_path = os.path.join(self.root_dir, action.new_name)
+        if not os.path.exists(old_path) and os.path.exists(new_path):
+            self._record(action, None, result)  # renamed by a run that was cut short
+            return
+        try:
+            os.rename(old_path, new_path)
+            self._record(action, None, result)
+        except OSError as e:
+            self._record(action, str(e), result)
+
+    def _delete(self, actions: list[SyncAction], result: SyncResult) -> None:
+        by_key = {outcome.key: outcome for outcome in self.s3_manager.delete_many([a.name for a in actions])}
+        for action in actions:
+            outcome = by_key.get(action.name)
+            self._record(action, None if outcome is not None and outcome.ok else
+                         (outcome.error if outcome is not None else "no result"), result)
+
+    @staticmethod
+    def _record(action: SyncAction, error: str | None, result: SyncResult) -> None:
+        if error is None:
+            result.done[action.kind] += 1
+            target = f" -> {action.new_name}" if action.new_name and action.new_name != action.name else ""
+            logger.info(f"{action.kind} {action.name}{target}")
+        else:
+            result.failed.append((action, error))
+            logger.warning(f"Failed to {action.kind} {action.name}: {error}")
+
+
+# ----------------------------
+# Plans on disk
+# ----------------------------
+def filter_actions(actions: Iterable[SyncAction], theme: str = "", direction: str = "",
+                   min_rating: float | None = None) -> Iterator[SyncAction]:
+    """
+    :param theme: only files in this theme's directory
+    :param direction: "up" for changes to the bucket, "down" for changes to image_out; empty for both
+    :param min_rating: only files rated at least this, on either side of a rename
+    """
+    for action in actions:
+        if theme and not action.name.startswith(f"{theme}/"):
+            continue
+        if direction and DIRECTIONS[action.kind] != direction:
+            continue
+        if min_rating is not None:
+            ratings = [rating for rating in (rating_of(action.name), rating_of(action.new_name)) if rating is not None]
+            if not ratings or max(ratings) < min_rating:
+                continue
+        yield action
+
+
+def write_plan(actions: Iterable[SyncAction], path: str | Path) -> Counter:
+    """
+    Write actions to path, one JSON object per line, replacing any earlier
+    plan there along with its checkpoint. Returns how many of each kind.
+    """
+    path = Path(path)
+    checkpoint_path(path).unlink(missing_ok=True)
+    counts: Counter = Counter()
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as file:
+        for action in actions:
+            file.write(json.dumps(asdict(action)) + "\n")
+            counts[action.kind] += 1
+    os.replace(tmp_path, path)
+    return counts
+
+
+def read_plan(path: str | Path, skip: int = 0) -> Iterator[SyncAction]:
+    """The actions in a plan written by write_plan, one line at a time, after the first skip of them."""
+    with Path(path).open("r", encoding="utf-8") as file:
+        for line in itertools.islice(file, skip, None):
+            yield SyncAction(**json.loads(line))
+
+
+def checkpoint_path(plan_path: str | Path) -> Path:
+    plan_path = Path(plan_path)
+    return plan_path.with_name(plan_path.name + ".checkpoint")
+
+
+def plan_progress(plan_path: str | Path) -> int:
+    """How many of the plan's actions a previous apply_plan got through; 0 if none, or for another plan."""
+    plan_path = Path(plan_path)
+    try:
+        with checkpoint_path(plan_path).open("r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+        if checkpoint["plan_size"] != plan_path.stat().st_size:
+            return 0
+        return int(checkpoint["done"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return 0
+
+
+def _save_progress(plan_path: Path, done: int) -> None:
+    path = checkpoint_path(plan_path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as file:
+        json.dump({"plan_size": plan_path.stat().st_size, "done": done}, file)  # type: ignore
+    os.replace(tmp_path, path)
+
+
+def apply_plan(plan_path: str | Path, executor: SyncExecutor, max_count: int = 0) -> tuple[SyncResult, bool]:
+    """
+    Carry out the plan at plan_path from where the last run left off,
+    checkpointing after each batch.
+
+    :param max_count: actions to carry out in this run at most; 0 for the rest of the plan
+    :return: the result, and whether the plan has now been carried out in full
+    """
+    plan_path = Path(plan_path)
+    done = plan_progress(plan_path)
+    if done:
+        logger.info(f"Resuming {plan_path} after {done} actions")
+    actions = read_plan(plan_path, skip=done)
+    if max_count > 0:
+        actions = itertools.islice(actions, max_count)
+    result = executor.run(actions, lambda count: _save_progress(plan_path, done + count))
+    finished = next(read_plan(plan_path, skip=plan_progress(plan_path)), None) is None
+    return result, finished
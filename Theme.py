@@ -1,5 +1,7 @@
 from dataclasses import dataclass
-from typing import List, Dict
+from string import Formatter
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Tuple
 
 
 @dataclass
@@ -15,3 +17,47 @@ class Theme:
     user_prompt: str
     prompts: List[str]
     styles: Dict[str, str]
+
+
+@dataclass(frozen=True, slots=True)
+class ThemeInfo:
+    """What a theme picker needs to list a theme, without its prompts."""
+    disk_name: str
+    display_name: str
+    description: str
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledTheme:
+    """
+    A Theme prepared for prompt generation: prompts as a tuple, the style
+    names that can be chosen at random (everything but "random"), and a
+    user_prompt template already checked to take only {prompt}.
+    """
+    disk_name: str
+    display_name: str
+    description: str
+    system_prompt: str
+    user_prompt: str
+    prompts: Tuple[str, ...]
+    styles: Mapping[str, str]
+    style_keys: Tuple[str, ...]
+
+    @staticmethod
+    def from_theme(theme: Theme) -> "CompiledTheme":
+        fields = {name for _, name, _, _ in Formatter().parse(theme.user_prompt) if name is not None}
+        if fields - {"prompt"}:
+            raise ValueError(f"Theme '{theme.disk_name}': user_prompt may only use {{prompt}}, "
+                             f"found {sorted(fields - {'prompt'})}")
+        if not theme.prompts:
+            raise ValueError(f"Theme '{theme.disk_name}' has no prompts")
+        style_keys = tuple(s for s in theme.styles if s != "random")
+        if not style_keys:
+            raise ValueError(f"Theme '{theme.disk_name}' has no styles to choose from")
+        return CompiledTheme(
+            disk_name=theme.disk_name, display_name=theme.display_name, description=theme.description,
+            system_prompt=theme.system_prompt, user_prompt=theme.user_prompt,
+            prompts=tuple(theme.prompts), styles=MappingProxyType(dict(theme.styles)), style_keys=style_keys)
+
+    def format_prompt(self, prompt: str) -> str:
+        return self.user_prompt.format(prompt=prompt)
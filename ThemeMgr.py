@@ -1,8 +1,23 @@
+import argparse
+import hashlib
+import logging
+import marshal
 import os
+import threading
 from typing import List
 
-import yaml
-from Theme import Theme
+from Theme import CompiledTheme, Theme, ThemeInfo
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FILE_NAME = "themes.bundle"
+BUNDLE_FORMAT_VERSION = 1
+
+
+def _yaml():
+    """PyYAML, imported on first use: with an up-to-date bundle it is never needed at startup."""
+    import yaml
+    return yaml
 
 
 class ThemeMgr:
@@ -16,6 +31,14 @@ class ThemeMgr:
         Ensures the themes directory exists and creates a default theme if "default.yaml" is missing.
         """
         self.themes_dir = themes_dir
+        # disk_name -> ((mtime_ns, size), value); an entry is used only while the file is unchanged
+        self._compiled: dict[str, tuple[tuple[int, int], CompiledTheme]] = {}
+        self._infos: dict[str, tuple[tuple[int, int], ThemeInfo]] = {}
+        self._fingerprints: dict[str, tuple[tuple[int, int], str]] = {}
+        self._lock = threading.Lock()
+        # Precompiled themes, see build_bundle(); disk_name -> {"sha256": ..., "data": {...}}
+        self.bundle_path = os.path.join(self.themes_dir, BUNDLE_FILE_NAME)
+        self._bundle: dict[str, dict] | None = None  # loaded lazily
         os.makedirs(self.themes_dir, exist_ok=True)
 
         default_theme_path = os.path.join(self.themes_dir, "default.yaml")
@@ -37,6 +60,128 @@ class ThemeMgr:
         """
         return [f[:-5] for f in os.listdir(self.themes_dir) if f.endswith(".yaml")]
 
+    def get_theme_list_info(self) -> List[ThemeInfo]:
+        """
+        Returns display metadata for every theme, sorted by display name. Only
+        the top-level keys are read, so the prompt lists aren't parsed.
+        """
+        infos = []
+        for f in os.listdir(self.themes_dir):
+            if not f.endswith(".yaml"):
+                continue
+            theme_path = os.path.join(self.themes_dir, f)
+            signature = self._signature(theme_path)
+            if signature is None:
+                continue
+            with self._lock:
+                cached = self._infos.get(f)
+            if cached is None or cached[0] != signature:
+                cached = (signature, self._theme_info(f, theme_path))
+                with self._lock:
+                    self._infos[f] = cached
+            infos.append(cached[1])
+        return sorted(infos, key=lambda info: info.display_name.lower())
+
+    def _theme_info(self, disk_name: str, theme_path: str) -> ThemeInfo:
+        with open(theme_path, "rb") as file:
+            raw = file.read()
+        data = self._bundled_data(disk_name, raw)
+        if data is not None:
+            wanted = {"display_name": data.get("display_name"), "description": data.get("description")}
+        else:
+            wanted = self._read_display_fields(raw.decode("utf-8"))
+        return ThemeInfo(disk_name=disk_name,
+                         display_name=(wanted["display_name"] or disk_name[:-5]).strip(),
+                         description=(wanted["description"] or "").strip())
+
+    @staticmethod
+    def _read_display_fields(text: str) -> dict[str, str | None]:
+        """Walk the YAML event stream, stopping as soon as both display fields are seen."""
+        yaml = _yaml()
+        wanted = {"display_name": None, "description": None}
+        depth = 0
+        key = None  # the top-level key whose value comes next
+        for event in yaml.parse(text, Loader=yaml.SafeLoader):
+            if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                depth += 1
+                if depth == 2:
+                    key = None  # a nested value such as prompts; skip it
+            elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                depth -= 1
+            elif isinstance(event, yaml.ScalarEvent) and depth == 1:
+                if key is None:
+                    key = event.value
+                else:
+                    if key in wanted:
+                        wanted[key] = event.value
+                    key = None
+                    if all(v is not None for v in wanted.values()):
+                        break
+        return wanted
+
+    def get_compiled_theme(self, disk_name: str) -> CompiledTheme:
+        """
+        Returns the CompiledTheme for a theme file, parsing it only if it changed
+        since it was last compiled. Raises ValueError if the theme is unusable.
+        """
+        if not disk_name.endswith(".yaml"):
+            disk_name += ".yaml"
+        theme_path = os.path.join(self.themes_dir, disk_name)
+        signature = self._signature(theme_path)
+        if signature is None:
+            raise FileNotFoundError(f"Theme '{disk_name}' not found.")
+        with self._lock:
+            cached = self._compiled.get(disk_name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        compiled = CompiledTheme.from_theme(self.get_theme(disk_name))
+        with self._lock:
+            self._compiled[disk_name] = (signature, compiled)
+        return compiled
+
+    @staticmethod
+    def _signature(theme_path: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(theme_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def theme_fingerprint(self, disk_name: str) -> str:
+        """
+        A SHA-256 of the theme file's contents, for caches built from a theme.
+        The file is only read and hashed again once its mtime or size changes.
+        """
+        if not disk_name.endswith(".yaml"):
+            disk_name += ".yaml"
+        theme_path = os.path.join(self.themes_dir, disk_name)
+        signature = self._signature(theme_path)
+        if signature is None:
+            raise FileNotFoundError(f"Theme '{disk_name}' not found.")
+        with self._lock:
+            cached = self._fingerprints.get(disk_name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(theme_path, "rb") as file:
+            fingerprint = hashlib.sha256(file.read()).hexdigest()
+        with self._lock:
+            self._fingerprints[disk_name] = (signature, fingerprint)
+        return fingerprint
+
+    def invalidate(self, disk_name: str | None = None) -> None:
+        """Forget cached themes: one, or all if disk_name is None."""
+        with self._lock:
+            if disk_name is None:
+                self._compiled.clear()
+                self._infos.clear()
+                self._fingerprints.clear()
+            else:
+                if not disk_name.endswith(".yaml"):
+                    disk_name += ".yaml"
+                self._compiled.pop(disk_name, None)
+                self._infos.pop(disk_name, None)
+                self._fingerprints.pop(disk_name, None)
+
     def get_theme(self, disk_name: str) -> Theme:
         """
         Loads and returns a Theme object from a YAML file in the themes directory.
@@ -47,17 +192,110 @@ class ThemeMgr:
         if not os.path.exists(theme_path):
             raise FileNotFoundError(f"Theme '{disk_name}' not found.")
 
-        with open(theme_path, "r", encoding="utf-8") as file:
-            data = yaml.safe_load(file)
+        with open(theme_path, "rb") as file:
+            raw = file.read()
+        data = self._bundled_data(disk_name, raw)
+        if data is None:
+            data = _yaml().safe_load(raw.decode("utf-8"))
+            self._update_bundle(disk_name, raw, data)
         return Theme(**data)
 
+    # ----------------------------
+    # Precompiled bundle
+    # ----------------------------
+    def build_bundle(self) -> str:
+        """
+        Compile every theme YAML file into one marshal file, recording a
+        SHA-256 of each source so stale entries are detected at load time.
+        :return: the bundle's path
+        :raises OSError, ValueError: if the bundle couldn't be written, e.g. a
+        theme holds a value marshal can't store, such as a YAML date
+        """
+        yaml = _yaml()
+        entries = {}
+        for f in sorted(os.listdir(self.themes_dir)):
+            if not f.endswith(".yaml"):
+                continue
+            with open(os.path.join(self.themes_dir, f), "rb") as file:
+                raw = file.read()
+            data = yaml.safe_load(raw.decode("utf-8"))
+            Theme(**data)  # fail the build rather than at runtime
+            entries[f] = {"sha256": hashlib.sha256(raw).hexdigest(), "data": data}
+        self._save_bundle(entries)
+        with self._lock:
+            self._bundle = entries
+        logger.info(f"Wrote {len(entries)} themes to {self.bundle_path}")
+        return self.bundle_path
+
+    def _load_bundle(self) -> dict[str, dict]:
+        with self._lock:
+            if self._bundle is not None:
+                return self._bundle
+        entries = {}
+        try:
+            with open(self.bundle_path, "rb") as file:
+                bundle = marshal.load(file)
+            if isinstance(bundle, dict) and bundle.get("version") == BUNDLE_FORMAT_VERSION:
+                entries = bundle["themes"]
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable theme bundle {self.bundle_path}: {e}")
+        with self._lock:
+            if self._bundle is None:
+                self._bundle = entries
+            return self._bundle
+
+    def _bundled_data(self, disk_name: str, raw: bytes) -> dict | None:
+        """
+        The bundled copy of a theme if it was built from exactly these bytes.
+        A malformed entry counts as absent, like an unreadable bundle.
+        """
+        try:
+            entry = self._load_bundle().get(disk_name)
+            if entry is None or entry["sha256"] != hashlib.sha256(raw).hexdigest():
+                return None
+            data = entry["data"]
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring malformed entry for {disk_name} in theme bundle {self.bundle_path}: {e!r}")
+            return None
+        return data if isinstance(data, dict) else None
+
+    def _update_bundle(self, disk_name: str, raw: bytes, data: dict) -> None:
+        """After a YAML fallback, refresh that theme's entry in an existing bundle."""
+        if not os.path.exists(self.bundle_path):
+            return  # bundles are opt-in; see build_bundle()
+        with self._lock:
+            entries = dict(self._bundle or {})
+            entries[disk_name] = {"sha256": hashlib.sha256(raw).hexdigest(), "data": data}
+            self._bundle = entries
+        try:
+            self._save_bundle(entries)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to write theme bundle {self.bundle_path}: {e}")
+
+    def _save_bundle(self, entries: dict[str, dict]) -> None:
+        """Write the bundle atomically; raises OSError or ValueError, leaving no temporary file behind."""
+        tmp_path = self.bundle_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                marshal.dump({"version": BUNDLE_FORMAT_VERSION, "themes": entries}, file)
+            os.replace(tmp_path, self.bundle_path)
+        except (OSError, ValueError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
     def write_theme(self, the_theme: Theme) -> None:
         """
         Saves the given Theme object to a YAML file in the themes directory.
         """
         theme_path = os.path.join(self.themes_dir, the_theme.disk_name)
         with open(theme_path, "w", encoding="utf-8") as file:
-            yaml.safe_dump(the_theme.__dict__, file)
+            _yaml().safe_dump(the_theme.__dict__, file)
+        self.invalidate(the_theme.disk_name)
 
     def delete_theme(self, disk_name: str) -> None:
         """
@@ -69,5 +307,14 @@ class ThemeMgr:
         theme_path = os.path.join(self.themes_dir, f"{disk_name}")
         if os.path.exists(theme_path):
             os.remove(theme_path)
+            self.invalidate(disk_name)
         else:
             raise FileNotFoundError(f"Theme '{disk_name}' not found.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile theme YAML files into a bundle for fast startup.")
+    parser.add_argument("themes_dir", nargs="?", default="themes", help="Directory of theme .yaml files")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(ThemeMgr(args.themes_dir).build_bundle())
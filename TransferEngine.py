@@ -0,0 +1,198 @@
+"""
+Module: TransferEngine.py
+
+Runs a batch of S3 uploads and downloads for S3Sync on a bounded pool of
+worker threads, all through one S3Manager (and so one boto3 client). A
+transfer that fails with a retryable error (see Resilience.is_retryable)
+is retried with jittered exponential backoff. Progress is shown weighted
+by bytes rather than by file count, and run() ends with a summary of
+throughput, failures and retries.
+
+An optional bandwidth cap, shared by all workers, is enforced with a token
+bucket fed from boto3's per-chunk progress callbacks, so a catch-up sync
+can run without saturating the Pi's Wi-Fi while the display is running.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+
+from Resilience import is_retryable
+from S3Manager import S3Manager
+from imim_utils import print_progress_bar
+
+logger = logging.getLogger(__name__)
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+
+
+@dataclass
+class TransferTask:
+    direction: str  # UPLOAD or DOWNLOAD
+    key: str
+    local_path: str
+    size: int = 0  # bytes; looked up for uploads if not given
+
+
+@dataclass
+class TransferSummary:
+    files_done: int = 0
+    bytes_done: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+    failed: list[tuple[TransferTask, str]] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second."""
+        return self.bytes_done / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.files_done} files, {self.bytes_done / 1e6:.1f} MB in {self.seconds:.1f}s "
+                f"({self.throughput / 1e6:.2f} MB/s); {len(self.failed)} failed, {self.retries} retries")
+
+
+class TokenBucket:
+    """
+    Limits a byte rate across threads. consume() may take more than the
+    bucket holds; the caller then sleeps off the debt, so chunk sizes don't
+    matter.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        :param rate: bytes per second
+        :param burst: bytes that may go out at once after an idle spell; defaults to one second's worth
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+
+
+class ByteProgress:
+    """A progress bar over bytes, safe to update from many threads; redrawn at most every interval seconds."""
+
+    def __init__(self, total_bytes: int, total_files: int, enabled: bool = True, interval: float = 0.25):
+        self.total_bytes = max(total_bytes, 1)
+        self.total_files = total_files
+        self.enabled = enabled
+        self.interval = interval
+        self.bytes_done = 0
+        self.files_done = 0
+        self._started = time.monotonic()
+        self._drawn_at = 0.0
+        self._lock = threading.Lock()
+
+    def advance(self, num_bytes: int, files: int = 0) -> None:
+        with self._lock:
+            self.bytes_done += num_bytes
+            self.files_done += files
+            now = time.monotonic()
+            if not self.enabled or (now - self._drawn_at < self.interval and self.files_done < self.total_files):
+                return
+            self._drawn_at = now
+            rate = self.bytes_done / max(now - self._started, 1e-6)
+            print_progress_bar(min(self.bytes_done, self.total_bytes), self.total_bytes, prefix='Progress:',
+                               suffix=f'{self.bytes_done / 1e6:.1f}/{self.total_bytes / 1e6:.1f} MB '
+                                      f'{rate / 1e6:.2f} MB/s {self.files_done}/{self.total_files} files',
+                               length=50)
+
+
+class TransferEngine:
+    def __init__(self, s3_manager: S3Manager, workers: int = 4, attempts: int = 3, base_delay: float = 1.0,
+                 max_delay: float = 30.0, bytes_per_second: float = 0, show_progress: bool = True,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        :param workers: transfers run at once
+        :param attempts: tries per file, the first one included
+        :param bytes_per_second: a cap on the combined rate of all transfers; 0 for none
+        """
+        self.s3_manager = s3_manager
+        self.workers = max(workers, 1)
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = TokenBucket(bytes_per_second) if bytes_per_second > 0 else None
+        self.show_progress = show_progress
+        self._sleep = sleep
+
+    def run(self, tasks: Iterable[TransferTask]) -> TransferSummary:
+        tasks = list(tasks)
+        summary = TransferSummary()
+        if not tasks:
+            return summary
+        for task in tasks:
+            if task.direction == UPLOAD and not task.size:
+                try:
+                    task.size = os.path.getsize(task.local_path)
+                except OSError:
+                    pass
+        progress = ByteProgress(sum(task.size for task in tasks), len(tasks), self.show_progress)
+        lock = threading.Lock()
+        started = time.monotonic()
+
+        def run_one(task: TransferTask) -> None:
+            error, retries, sent = self._transfer(task, progress)
+            with lock:
+                summary.retries += retries
+                if error is None:
+                    summary.files_done += 1
+                    summary.bytes_done += sent
+                else:
+                    summary.failed.append((task, error))
+            progress.advance(0, files=1)
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(tasks))) as pool:
+            list(pool.map(run_one, tasks))
+        summary.seconds = time.monotonic() - started
+        for task, error in summary.failed:
+            logger.warning(f"Failed to {task.direction} {task.key}: {error}")
+        logger.info(f"Transfers: {summary}")
+        return summary
+
+    def _transfer(self, task: TransferTask, progress: ByteProgress) -> tuple[str | None, int, int]:
+        """(error or None, retries, bytes transferred) for one task."""
+        for attempt in range(1, self.attempts + 1):
+            sent = 0
+
+            def callback(num_bytes: int) -> None:
+                nonlocal sent
+                if self.limiter is not None:
+                    self.limiter.consume(num_bytes)
+                sent += num_bytes
+                progress.advance(num_bytes)
+
+            try:
+                if task.direction == UPLOAD:
+                    self.s3_manager.put_file(task.local_path, task.key, callback)
+                else:
+                    self.s3_manager.get_file(task.key, task.local_path, callback)
+                return None, attempt - 1, sent
+            except Exception as e:
+                progress.advance(-sent)  # the retry sends them again
+                if not is_retryable(e) or attempt >= self.attempts:
+                    return str(e), attempt - 1, 0
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                logger.info(f"{task.direction} of {task.key} failed ({e}); retrying in {delay:.1f}s")
+                self._sleep(delay)
+        return "no attempts made", 0, 0
@@ -0,0 +1,221 @@
+"""
+Module: UploadOutbox.py
+
+A durable queue of files waiting to be uploaded to S3. Each upload is first
+recorded in a small SQLite journal (upload_outbox.sqlite3) and only removed
+from it once S3Manager reports success, so uploads interrupted by a network
+outage, a crash or a restart are picked up again the next time the app
+runs. A few worker threads drain the journal; a failed upload is retried
+later with jittered exponential backoff.
+
+metrics() reports the queue depth and the age of the oldest pending upload,
+which is the number to watch: it grows while S3 is unreachable.
+"""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from S3Manager import S3Manager
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    s3_key TEXT NOT NULL UNIQUE,
+    local_path TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT
+)
+"""
+
+
+class UploadOutbox:
+    OUTBOX_FILE_NAME: str = "upload_outbox.sqlite3"
+
+    def __init__(self, s3_manager: S3Manager, db_path: str = OUTBOX_FILE_NAME, workers: int = 2,
+                 base_delay: float = 5.0, max_delay: float = 900.0):
+        """
+        :param workers: how many uploads may run at once
+        :param base_delay: seconds to wait before the first retry; doubled for each further one
+        :param max_delay: the longest wait between retries
+        """
+        self.s3_manager = s3_manager
+        self.db_path = Path(db_path)
+        self.workers = max(workers, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+        self._in_flight: set[int] = set()
+        self._closed = False  # the database is closed; uploads still running leave the journal as it is
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        # metrics
+        self.uploaded = 0
+        self.failures = 0
+
+    @staticmethod
+    def from_config(s3_manager: S3Manager, config) -> "UploadOutbox":
+        return UploadOutbox(s3_manager, workers=int(config.get("upload_workers", 2)))
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"UploadOutbox-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self, timeout: float = 1.0) -> None:
+        """Stop the workers. Uploads still running are abandoned; they stay in the journal."""
+        self._stop.set()
+        with self._lock:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def close(self, timeout: float = 1.0) -> None:
+        """
+        Stop the workers and close the journal. An upload still running after
+        shutdown() gave up waiting for it keeps its row, so it is tried again
+        on the next start.
+        """
+        self.shutdown(timeout)
+        with self._lock:
+            self._closed = True
+            self._db.close()
+
+    # ----------------------------
+    # Queueing
+    # ----------------------------
+    def enqueue(self, local_path: Path | str, s3_key: str) -> None:
+        """Record that local_path should be uploaded as s3_key; returns at once."""
+        now = time.time()
+        with self._lock:
+            # a newer file for the same key replaces the older one
+            self._db.execute(
+                "INSERT INTO uploads (s3_key, local_path, created, next_attempt_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(s3_key) DO UPDATE SET local_path = excluded.local_path, attempts = 0, "
+                "next_attempt_at = excluded.next_attempt_at, last_error = NULL",
+                (s3_key, os.fspath(local_path), now, now))
+            self._wakeup.notify()
+
+    def rekey(self, old_path: Path | str, new_path: Path | str, new_s3_key: str) -> bool:
+        """
+        Point a pending upload of old_path, which has just been renamed, at
+        new_path and new_s3_key, so the rename doesn't make the upload look
+        like one of a deleted file. Returns whether one was pending.
+        """
+        with self._lock:
+            if self._closed:
+                return False
+            # a pending upload already under new_s3_key is superseded by this one
+            cursor = self._db.execute("UPDATE OR REPLACE uploads SET local_path = ?, s3_key = ? WHERE local_path = ?",
+                                      (os.fspath(new_path), new_s3_key, os.fspath(old_path)))
+            return cursor.rowcount > 0
+
+    def pending(self) -> list[tuple[str, str]]:
+        """(local_path, s3_key) for every upload not yet done, oldest first."""
+        with self._lock:
+            return self._db.execute("SELECT local_path, s3_key FROM uploads ORDER BY created, id").fetchall()
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            depth, oldest = self._db.execute("SELECT COUNT(*), MIN(created) FROM uploads").fetchone()
+            in_flight = len(self._in_flight)
+        return {
+            "pending": depth,
+            "in_flight": in_flight,
+            "oldest_pending_seconds": round(time.time() - oldest, 1) if oldest is not None else 0.0,
+            "uploaded": self.uploaded,
+            "failures": self.failures,
+        }
+
+    # ----------------------------
+    # Draining
+    # ----------------------------
+    def _claim(self) -> tuple[int, str, str, int] | float | None:
+        """
+        The next due upload, marked in flight; else the seconds until the next
+        one is due, or None if there are none. Call with _lock held.
+        """
+        if self._closed:
+            return None
+        in_flight = ",".join(str(i) for i in self._in_flight) or "-1"
+        row = self._db.execute(
+            f"SELECT id, local_path, s3_key, attempts, next_attempt_at FROM uploads "
+            f"WHERE id NOT IN ({in_flight}) ORDER BY next_attempt_at, id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        upload_id, local_path, s3_key, attempts, next_attempt_at = row
+        wait = next_attempt_at - time.time()
+        if wait > 0:
+            return wait
+        self._in_flight.add(upload_id)
+        return upload_id, local_path, s3_key, attempts
+
+    def process_due(self) -> int:
+        """Upload everything that is due, on the calling thread; returns how many uploads were tried."""
+        tried = 0
+        while True:
+            with self._lock:
+                claimed = self._claim()
+            if not isinstance(claimed, tuple):
+                return tried
+            self._upload(*claimed)
+            tried += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                claimed = self._claim()
+                if not isinstance(claimed, tuple):
+                    self._wakeup.wait(timeout=min(claimed, 60.0) if claimed is not None else 60.0)
+                    continue
+            self._upload(*claimed)
+
+    def _upload(self, upload_id: int, local_path: str, s3_key: str, attempts: int) -> None:
+        try:
+            if not os.path.exists(local_path):
+                # e.g. deleted by RetentionMgr before it could be uploaded
+                logger.warning(f"Dropping upload of {local_path} to {s3_key}; the file no longer exists")
+                self._finish(upload_id, local_path, uploaded=False)
+                return
+            if self.s3_manager.upload_to_s3(local_path, s3_key):
+                self._finish(upload_id, local_path, uploaded=True)
+                return
+            error = "upload failed"
+        except Exception as e:
+            error = str(e)
+        delay = random.uniform(0.5, 1.0) * min(self.max_delay, self.base_delay * 2 ** attempts)
+        logger.info(f"Upload of {s3_key} failed (attempt {attempts + 1}); retrying in {delay:.0f}s")
+        with self._lock:
+            self.failures += 1
+            if self._closed:
+                return
+            self._db.execute("UPDATE uploads SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                             (attempts + 1, time.time() + delay, error, upload_id))
+            self._in_flight.discard(upload_id)
+
+    def _finish(self, upload_id: int, local_path: str, uploaded: bool) -> None:
+        with self._lock:
+            if uploaded:
+                self.uploaded += 1
+            if self._closed:
+                return
+            # unless the key was queued again, with a different file, in the meantime
+            self._db.execute("DELETE FROM uploads WHERE id = ? AND local_path = ?", (upload_id, local_path))
+            self._in_flight.discard(upload_id)
@@ -0,0 +1,81 @@
+"""
+Benchmark: full decode + LANCZOS resize (the old get_image_from_disk /
+display_image_tk path) versus ImageLoader.load_for_display, which uses
+draft/reduce to downscale while decoding.
+
+Run from the repo root:
+    python benchmarks/bench_image_loader.py [--repeat N]
+
+Sample images are synthesized at the sizes DALL·E 3 returns, saved as both
+PNG and JPEG, plus a large JPEG like those sometimes synced down from S3.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ImageLoader import fit_size, load_for_display  # noqa: E402
+
+SOURCE_SIZES = [(1024, 1024), (1792, 1024), (1024, 1792), (4096, 2340)]
+TARGET_SIZES = [(800, 480), (1920, 1080)]
+
+
+def make_sample(size: tuple[int, int]) -> Image.Image:
+    """A gradient with noise on top, so it compresses roughly like a real picture."""
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 40)
+    return Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def old_path(path: Path, target: tuple[int, int]) -> Image.Image:
+    img = Image.open(str(path)).convert("RGB")
+    fitted = fit_size(target[0], target[1], img.width, img.height)
+    return img.resize(fitted, Image.Resampling.LANCZOS)
+
+
+def new_path(path: Path, target: tuple[int, int]) -> Image.Image:
+    return load_for_display(path, target, Image.Resampling.LANCZOS)
+
+
+def time_ms(fn, path: Path, target: tuple[int, int], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path, target)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare image decode paths for screen-sized targets")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case; the median is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = []
+        for size in SOURCE_SIZES:
+            img = make_sample(size)
+            for ext in ("png", "jpg"):
+                if size == SOURCE_SIZES[-1] and ext == "png":
+                    continue
+                path = Path(tmp_dir, f"sample_{size[0]}x{size[1]}.{ext}")
+                img.save(path)
+                files.append((size, path))
+
+        print(f"{'source':>16} {'fmt':>4} {'target':>10} {'old ms':>9} {'new ms':>9} {'speedup':>8}")
+        for size, path in files:
+            for target in TARGET_SIZES:
+                old_ms = time_ms(old_path, path, target, args.repeat)
+                new_ms = time_ms(new_path, path, target, args.repeat)
+                print(f"{size[0]:>7}x{size[1]:<8} {path.suffix[1:]:>4} {target[0]:>4}x{target[1]:<5} "
+                      f"{old_ms:>9.1f} {new_ms:>9.1f} {old_ms / new_ms:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: encode time and stored size of generated images in each storage
+format (see ImageCodec), at a few quality and effort settings.
+
+Samples are the PNGs under the given directory (by default image_out); if
+there are none, a few synthetic 1792x1024 images are used instead, which
+compress less predictably than real DALL·E output.
+
+Run from the repo root:
+    python benchmarks/bench_storage_codecs.py [image_dir] [--limit N]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_DIR)
+
+from ImageCodec import StorageCodec  # noqa: E402
+
+CODECS = [
+    StorageCodec("png"),
+    StorageCodec("png", effort=9),
+    StorageCodec("webp", quality=80, effort=4),
+    StorageCodec("webp", quality=90, effort=4),
+    StorageCodec("webp", quality=90, effort=6),
+    StorageCodec("jpeg", quality=85),
+    StorageCodec("jpeg", quality=90, effort=1),
+]
+
+
+def sample_images(image_dir: str, limit: int) -> list[Image.Image]:
+    paths = []
+    for root, _, files in os.walk(image_dir):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".png"))
+    images = []
+    for path in sorted(paths)[:limit]:
+        with Image.open(path) as img:
+            images.append(img.convert("RGB"))
+    if images:
+        return images
+    for seed in range(min(limit, 3)):
+        img = Image.effect_noise((1792, 1024), 40 + 20 * seed).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        for i in range(0, 1792, 64):
+            draw.ellipse((i, (i * 7 + seed * 90) % 1024, i + 300, (i * 7 + seed * 90) % 1024 + 200),
+                         fill=((i * 3) % 256, (i + seed * 80) % 256, 200))
+        images.append(img.filter(ImageFilter.GaussianBlur(2)))
+    return images
+
+
+def label(codec: StorageCodec) -> str:
+    effort = "default" if codec.effort is None else codec.effort
+    quality = f" q{codec.quality}" if codec.format != "png" else ""
+    return f"{codec.format}{quality} effort={effort}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", nargs="?", default=os.path.join(REPO_DIR, "image_out"))
+    parser.add_argument("--limit", type=int, default=10, help="at most this many sample images")
+    args = parser.parse_args()
+
+    images = sample_images(args.image_dir, args.limit)
+    print(f"{len(images)} sample images")
+    baseline = None
+    for codec in CODECS:
+        times, sizes = [], []
+        for img in images:
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            codec.encode_image(img, buffer)
+            times.append(time.perf_counter() - start)
+            sizes.append(buffer.tell())
+        mean_size = statistics.mean(sizes)
+        baseline = baseline or mean_size
+        print(f"{label(codec):<26} median encode {statistics.median(times) * 1000:8.1f} ms   "
+              f"mean size {mean_size / 1024:8.0f} KiB   {mean_size / baseline:6.1%} of png")
+
+
+if __name__ == "__main__":
+    main()
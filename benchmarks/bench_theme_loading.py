@@ -0,0 +1,68 @@
+"""
+Benchmark: cold-start cost of loading every shipped theme from YAML versus
+from the precompiled bundle written by ThemeMgr.build_bundle().
+
+Each sample runs in a fresh interpreter, so the time includes importing
+PyYAML when it is needed, as it would be on a cold boot under systemd.
+
+Run from the repo root:
+    python benchmarks/bench_theme_loading.py [--repeat N]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+LOAD_ALL_THEMES = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repo!r})
+from ThemeMgr import ThemeMgr
+mgr = ThemeMgr({themes!r})
+for name in mgr.get_theme_list():
+    mgr.get_compiled_theme(name)
+mgr.get_theme_list_info()
+print(time.perf_counter() - start)
+print('yaml' in sys.modules)
+"""
+
+
+def sample(themes_dir: str) -> tuple[float, bool]:
+    out = subprocess.run([sys.executable, "-c", LOAD_ALL_THEMES.format(repo=REPO_DIR, themes=themes_dir)],
+                         check=True, capture_output=True, text=True).stdout.split()
+    return float(out[0]), out[1] == "True"
+
+
+def report(label: str, times: list[float], imported_yaml: bool) -> None:
+    print(f"{label:<8} median {statistics.median(times) * 1000:7.2f} ms   "
+          f"min {min(times) * 1000:7.2f} ms   imported yaml: {imported_yaml}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        themes_dir = os.path.join(tmp, "themes")
+        shutil.copytree(os.path.join(REPO_DIR, "themes"), themes_dir,
+                        ignore=shutil.ignore_patterns("themes.bundle*"))
+        print(f"{len(os.listdir(themes_dir))} theme files, {args.repeat} cold starts each")
+
+        yaml_runs = [sample(themes_dir) for _ in range(args.repeat)]
+        report("yaml", [t for t, _ in yaml_runs], yaml_runs[-1][1])
+
+        sys.path.insert(0, REPO_DIR)
+        from ThemeMgr import ThemeMgr
+        ThemeMgr(themes_dir).build_bundle()
+        bundle_runs = [sample(themes_dir) for _ in range(args.repeat)]
+        report("bundle", [t for t, _ in bundle_runs], bundle_runs[-1][1])
+
+
+if __name__ == "__main__":
+    main()
@@ -75,3 +75,27 @@ def test_generate_random_prompt(config_mgr):
         styles.add(style_part)
     print(f"{len(styles)} distinct styles found")
     assert len(styles) == 3  # 4 styles in file minus "random" style
+
+
+class FakeCompletions:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        message = type("Message", (), {"content": self.content})
+        choice = type("Choice", (), {"message": message})
+        return type("Response", (), {"choices": [choice]})
+
+
+def test_embellish_prompts_in_one_request(config_mgr):
+    """Several prompts are embellished with a single chat completion"""
+    prompt_generator = PromptGenerator(config_mgr)
+    completions = FakeCompletions(json.dumps({"prompts": ["one ", "two"]}))
+    prompt_generator.client = type("Client", (), {"chat": type("Chat", (), {"completions": completions})})
+    assert prompt_generator.embellish_prompts(["a", "b"], "system") == ["one", "two"]
+    assert completions.calls == 1
+
+    completions.content = "not json"
+    assert prompt_generator.embellish_prompts(["a", "b"], "system") == []
@@ -128,3 +128,70 @@ class TestConfigMgr:
             'local_files_only'
         }
         assert set(config.keys()) == required_keys
+
+    def test_snapshot_is_parsed_and_immutable(self, config_mgr, sample_config):
+        """Snapshots read like the config dict and carry pre-parsed fields"""
+        sample_config["display_duration"] = "01:02:03"
+        config_mgr.save_config(sample_config)
+        snapshot = config_mgr.current
+        assert snapshot["background_color"] == "#aabbcc"
+        assert snapshot.background_rgb == (0xaa, 0xbb, 0xcc)
+        assert snapshot.display_seconds == 3723
+        with pytest.raises(TypeError):
+            snapshot["active_style"] = "other"  # type: ignore
+        with pytest.raises(AttributeError):
+            snapshot.display_seconds = 5
+        # load_config hands out a copy that can be edited and saved
+        config = config_mgr.load_config()
+        config["active_style"] = "other"
+        assert config_mgr.current["active_style"] == "random"
+
+    def test_snapshot_nested_values_are_immutable(self, config_mgr, sample_config):
+        """Objects and arrays inside a snapshot can't be changed in place either"""
+        sample_config["rating_weights"] = {"5": 8.0}
+        sample_config["theme_quotas"] = {"creative": 10}
+        sample_config["extra_list"] = [1, {"a": [2]}]
+        config_mgr.save_config(sample_config)
+        snapshot = config_mgr.current
+        with pytest.raises(TypeError):
+            snapshot["rating_weights"]["5"] = 100.0  # type: ignore
+        with pytest.raises(TypeError):
+            snapshot["extra_list"][1]["a"] = []  # type: ignore
+        assert snapshot["extra_list"][1]["a"] == (2,)
+        # and come back as plain JSON values for editing
+        config = snapshot.to_dict()
+        config["theme_quotas"]["creative"] = 5
+        assert config["extra_list"] == [1, {"a": [2]}]
+        assert config_mgr.current["theme_quotas"]["creative"] == 10
+        # saving the same values back isn't a change
+        version = config_mgr.current.version
+        config_mgr.save_config(snapshot.to_dict())
+        assert config_mgr.current.version == version
+
+    def test_no_write_back_unless_factory_keys_added(self, config_mgr):
+        """Reading an up-to-date config file must not rewrite it"""
+        full = config_mgr.read_factory_config()
+        config_mgr.config_file_path.write_text(json.dumps(full), encoding="utf-8")
+        before = config_mgr.config_file_path.stat().st_mtime_ns
+        config_mgr.load_config()
+        assert config_mgr.config_file_path.stat().st_mtime_ns == before
+
+        del full["local_files_only"]
+        config_mgr.config_file_path.write_text(json.dumps(full), encoding="utf-8")
+        config = config_mgr.load_config()
+        assert "local_files_only" in json.loads(config_mgr.config_file_path.read_text(encoding="utf-8"))
+        assert config["local_files_only"] is False
+
+    def test_subscribers_hear_about_their_keys(self, config_mgr, sample_config):
+        """Subscribers are only called when a key they care about changes"""
+        config_mgr.save_config(sample_config)
+        style_changes, theme_changes = [], []
+        config_mgr.subscribe(["active_style"], lambda old, new: style_changes.append(new["active_style"]))
+        config_mgr.subscribe(["active_theme"], lambda old, new: theme_changes.append(new["active_theme"]))
+
+        config_mgr.save_config(dict(sample_config))  # same values: nothing published
+        assert config_mgr.current.version == 1
+        config_mgr.save_config({**sample_config, "active_style": "realistic"})
+        assert style_changes == ["realistic"]
+        assert theme_changes == []
+        assert config_mgr.current.version == 2
@@ -0,0 +1,69 @@
+import hashlib
+import os
+
+from ContentHash import DIFFERENT_CONTENT, DIFFERENT_SIZE, SAME, UNKNOWN, HashCache, hash_file
+
+PART = 1024
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_hash_file_matches_single_part_and_multipart_etags(tmp_path):
+    small = write(tmp_path / "small.png", b"x" * 100)
+    md5, etag = hash_file(small, PART)
+    assert md5 == etag == hashlib.md5(b"x" * 100).hexdigest()
+
+    data = os.urandom(PART * 2 + 10)
+    big = write(tmp_path / "big.png", data)
+    md5, etag = hash_file(big, PART)
+    parts = [data[:PART], data[PART:2 * PART], data[2 * PART:]]
+    expected = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts)).hexdigest()
+    assert md5 == hashlib.md5(data).hexdigest()
+    assert etag == f"{expected}-3"
+
+
+def test_hashes_are_cached_until_the_file_changes(tmp_path):
+    path = write(tmp_path / "a.png", b"first")
+    cache = HashCache(path=str(tmp_path / "hashes.json"))
+    cache.get(path, PART)
+    cache.get(path, PART)
+    assert cache.hashed == 1
+    cache.save()
+
+    reloaded = HashCache(path=str(tmp_path / "hashes.json"))
+    reloaded.get(path, PART)
+    assert reloaded.hashed == 0
+
+    path.write_bytes(b"second!")
+    assert reloaded.get(path, PART).md5 == hashlib.md5(b"second!").hexdigest()
+    assert reloaded.hashed == 1
+
+
+def test_compare(tmp_path):
+    path = write(tmp_path / "a.png", b"content")
+    md5 = hashlib.md5(b"content").hexdigest()
+    cache = HashCache(path=None)
+    assert cache.compare(path, 7, f'"{md5}"', PART) == SAME
+    assert cache.compare(path, 9, md5, PART) == DIFFERENT_SIZE
+    assert cache.compare(path, 7, hashlib.md5(b"CONTENT").hexdigest(), PART) == DIFFERENT_CONTENT
+    assert cache.compare(path, 7, "", PART) == UNKNOWN
+    assert cache.compare(path, 7, md5 + "-2", PART) == UNKNOWN  # uploaded in parts of another size
+
+
+def test_compare_is_unknown_when_part_layouts_differ(tmp_path):
+    data = os.urandom(PART * 2)
+    path = write(tmp_path / "big.png", data)
+    cache = HashCache(path=None)
+    other_md5 = hashlib.md5(b"something else").hexdigest()
+    # uploaded in one piece, before the multipart threshold was lowered to PART
+    assert cache.compare(path, len(data), other_md5, PART) == UNKNOWN
+    assert cache.compare(path, len(data), hashlib.md5(data).hexdigest(), PART) == SAME
+    # uploaded in parts, but our file goes up in one piece
+    assert cache.compare(path, len(data), other_md5 + "-2", PART, multipart_threshold=PART * 4) == UNKNOWN
+    # uploaded in as many parts of a different size
+    assert cache.compare(path, len(data), other_md5 + "-2", PART) == UNKNOWN
+
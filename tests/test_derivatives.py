@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+
+from PIL import Image
+
+from Derivatives import (DERIVED_DIR_NAME, backfill, derivative_path, display_source, find_derivative,
+                         missing_derivatives, parse_size, remove_derivatives, write_derivatives)
+from LibraryIndex import LibraryIndex
+from RenderCache import prepare_image
+from S3Sync import iter_local_files
+
+
+def make_image(path: Path, size=(1792, 1024)) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", size, (10, 200, 30)).save(path)
+    return path
+
+
+def test_parse_size():
+    assert parse_size("1920x1080") == (1920, 1080)
+
+
+def test_derivatives_are_keyed_by_timestamp_prefix(tmp_path):
+    unrated = tmp_path / "creative" / "20250219T171207_output_image.png"
+    rated = tmp_path / "creative" / "20250219T171207_output_image r[3.0].png"
+    assert derivative_path(unrated, (320, 320)) == derivative_path(rated, (320, 320))
+    assert derivative_path(unrated, (320, 320)) == \
+           tmp_path / "creative" / DERIVED_DIR_NAME / "320x320" / "20250219T171207.jpg"
+
+
+def test_write_and_find_derivatives(tmp_path):
+    image = make_image(tmp_path / "creative" / "20250219T171207_output_image.png")
+    written = write_derivatives(image, [(1920, 1080), (320, 320)])
+    assert len(written) == 2
+    with Image.open(derivative_path(image, (1920, 1080))) as img:
+        assert img.size == (1792, 1024)  # never scaled up
+    with Image.open(derivative_path(image, (320, 320))) as img:
+        assert img.size == (320, 182)
+
+    assert find_derivative(image, (800, 600)) == derivative_path(image, (1920, 1080))
+    assert find_derivative(image, (200, 100)) == derivative_path(image, (320, 320))
+    assert find_derivative(image, (2560, 1440)) is None
+    assert display_source(image, (2560, 1440)) == image
+    assert display_source(image, None) == image
+
+
+def test_stale_derivative_is_ignored(tmp_path):
+    image = make_image(tmp_path / "creative" / "20250219T171207_output_image.png")
+    write_derivatives(image, [(320, 320)])
+    derived = derivative_path(image, (320, 320))
+    os.utime(derived, (1, 1))
+    assert find_derivative(image, (100, 100)) is None
+
+
+def test_prepare_image_uses_the_derivative(tmp_path):
+    image = make_image(tmp_path / "creative" / "20250219T171207_output_image.png")
+    write_derivatives(image, [(320, 320)])
+    with Image.open(derivative_path(image, (320, 320))) as img:
+        img.paste((255, 0, 0), (0, 0, img.width, img.height))
+        img.save(derivative_path(image, (320, 320)))
+    prepared = prepare_image(image, (160, 160), (0, 0, 0))
+    assert prepared.image.getpixel((0, 0))[0] > 200
+    assert prepared.source_path == image
+
+
+def test_backfill_and_remove(tmp_path):
+    images = [make_image(tmp_path / theme / f"2025021{i}T171207_output_image.png", (400, 300))
+              for i, theme in enumerate(["creative", "creative", "halloween"])]
+    sizes = [(200, 200), (64, 64)]
+    assert len(missing_derivatives(tmp_path, sizes)) == 3
+    assert backfill(tmp_path, sizes, workers=2) == 3
+    assert missing_derivatives(tmp_path, sizes) == []
+    remove_derivatives(images[0])
+    assert [path for path, _ in missing_derivatives(tmp_path, sizes)] == [images[0]]
+
+
+def test_derivatives_are_not_library_files(tmp_path):
+    image = make_image(tmp_path / "creative" / "20250219T171207_output_image.png", (400, 300))
+    written = write_derivatives(image, [(200, 200)])
+    index = LibraryIndex(str(tmp_path))
+    index.build()
+    index.add_file(written[0])
+    assert index.count("creative") == 1
+    assert [f["name"] for f in iter_local_files(str(tmp_path))] == [f"creative/{image.name}"]
@@ -0,0 +1,71 @@
+import time
+
+from PIL import Image
+
+from GenerationBuffer import GenerationBuffer
+
+
+def make_image(path, size=(64, 32)):
+    Image.new("RGB", size, (200, 10, 10)).save(path)
+    return path
+
+
+def test_entries_survive_restart(tmp_path):
+    journal = tmp_path / "buffer.json"
+    img = make_image(tmp_path / "20250219T171207_output_image.png")
+    buffer = GenerationBuffer(str(journal))
+    buffer.push(img, tmp_path / "20250219T171207_prompt.txt", "creative")
+    buffer.shutdown()
+
+    restored = GenerationBuffer(str(journal))
+    assert restored.count("creative") == 1
+    entry, _ = restored.pop("creative")
+    assert entry.image_path == str(img)
+    restored.shutdown()
+
+    assert GenerationBuffer(str(journal)).count("creative") == 0
+
+
+def test_only_active_theme_is_handed_out(tmp_path):
+    buffer = GenerationBuffer(str(tmp_path / "buffer.json"))
+    halloween = make_image(tmp_path / "20250219T000000_output_image.png")
+    creative = make_image(tmp_path / "20250219T000001_output_image.png")
+    buffer.push(halloween, tmp_path / "a.txt", "halloween")
+    buffer.push(creative, tmp_path / "b.txt", "creative")
+
+    entry, _ = buffer.pop("creative")
+    assert entry.image_path == str(creative)
+    assert buffer.pop("creative") is None
+
+    assert buffer.flush_other_themes("creative") == 1
+    assert buffer.count("halloween") == 0
+    buffer.shutdown()
+
+
+def test_missing_files_are_skipped(tmp_path):
+    buffer = GenerationBuffer(str(tmp_path / "buffer.json"))
+    gone = make_image(tmp_path / "20250219T000000_output_image.png")
+    kept = make_image(tmp_path / "20250219T000001_output_image.png")
+    buffer.push(gone, tmp_path / "a.txt", "creative")
+    buffer.push(kept, tmp_path / "b.txt", "creative")
+    gone.unlink()
+
+    entry, _ = buffer.pop("creative")
+    assert entry.image_path == str(kept)
+    buffer.shutdown()
+
+
+def test_entries_are_prepared_for_the_canvas(tmp_path):
+    buffer = GenerationBuffer(str(tmp_path / "buffer.json"))
+    img = make_image(tmp_path / "20250219T171207_output_image.png")
+    buffer.push(img, tmp_path / "p.txt", "creative")
+    buffer.prepare((320, 240), (0, 0, 0))
+
+    deadline = time.time() + 5
+    while time.time() < deadline and not buffer._prepared[str(img)].done():
+        time.sleep(0.01)
+    entry, prepared = buffer.pop("creative")
+    assert prepared is not None
+    assert prepared.frame.size == (320, 240)
+    assert prepared.matches((320, 240), (0, 0, 0))
+    buffer.shutdown()
@@ -0,0 +1,82 @@
+import threading
+import time
+from pathlib import Path
+
+from GenerationWorker import GenerationWorker
+
+
+class DummyPromptGenerator:
+    def get_theme_name(self):
+        return "creative.yaml"
+
+
+class DummyImageGenerator:
+    def __init__(self, gate: threading.Event = None, fail: bool = False):
+        self.prompt_generator = DummyPromptGenerator()
+        self.gate = gate
+        self.fail = fail
+        self.calls = 0
+
+    def generate_image(self, port_xy, output_dir):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        if self.fail:
+            raise RuntimeError("boom")
+        return Path(output_dir, "20250219T171207_output_image.png"), Path(output_dir, "20250219T171207_prompt.txt")
+
+
+class DummyOutbox:
+    def __init__(self):
+        self.uploads = []
+
+    def enqueue(self, local_path, s3_key: str):
+        self.uploads.append(s3_key)
+
+
+def wait_for_results(worker, count=1, timeout=5.0):
+    results = []
+    deadline = time.time() + timeout
+    while len(results) < count and time.time() < deadline:
+        results.extend(worker.poll())
+        time.sleep(0.01)
+    return results
+
+
+def test_result_and_uploads_come_back_through_poll():
+    outbox = DummyOutbox()
+    worker = GenerationWorker(DummyImageGenerator(), outbox)
+    worker.submit((1920, 1080), "image_out")
+    results = wait_for_results(worker)
+    worker.shutdown()
+
+    assert len(results) == 1
+    assert results[0].error is None
+    assert results[0].theme_name == "creative"
+    assert results[0].image_path.name == "20250219T171207_output_image.png"
+    assert outbox.uploads == ["creative/20250219T171207_output_image.png", "creative/20250219T171207_prompt.txt"]
+
+
+def test_errors_are_reported_not_raised():
+    worker = GenerationWorker(DummyImageGenerator(fail=True))
+    worker.submit((1920, 1080), "image_out")
+    results = wait_for_results(worker)
+    worker.shutdown()
+    assert isinstance(results[0].error, RuntimeError)
+
+
+def test_cancelled_jobs_produce_no_results():
+    gate = threading.Event()
+    generator = DummyImageGenerator(gate=gate)
+    worker = GenerationWorker(generator)
+    running = worker.submit((1920, 1080), "image_out")
+    queued = worker.submit((1920, 1080), "image_out")
+    assert worker.num_pending == 2
+
+    worker.cancel_all()
+    assert running.cancelled and queued.cancelled
+    assert worker.num_pending == 0
+    gate.set()
+    assert wait_for_results(worker, timeout=0.5) == []
+    worker.shutdown()
+    assert generator.calls <= 1
@@ -0,0 +1,55 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from HttpTransport import HttpTransport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        status = 404 if self.path == "/missing" else 200
+        body = b"hello"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_connections_are_reused(server):
+    transport = HttpTransport(max_connections=2)
+    try:
+        for _ in range(4):
+            assert transport.get(f"{server}/image.png", timeout=5).content == b"hello"
+        stats = transport.stats()
+        assert stats["requests"] == 4
+        assert stats["connections"] == 1
+        assert stats["tls_handshakes"] == 0
+        assert stats["reuse_ratio"] == 0.75
+    finally:
+        transport.close()
+
+
+def test_error_status_raises(server):
+    transport = HttpTransport()
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            transport.get(f"{server}/missing", timeout=5)
+    finally:
+        transport.close()
@@ -0,0 +1,65 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from ImageCodec import StorageCodec, content_type
+
+
+def make_png(path: Path, mode: str = "RGB") -> Path:
+    Image.new(mode, (120, 80), (30, 120, 200, 255)[:len(mode)]).save(path, format="PNG")
+    return path
+
+
+def test_from_config_defaults_to_png():
+    codec = StorageCodec.from_config({})
+    assert (codec.format, codec.quality, codec.effort) == ("png", 90, None)
+    codec = StorageCodec.from_config({"storage_format": "WEBP", "storage_quality": 250, "storage_effort": 4})
+    assert (codec.format, codec.quality, codec.effort) == ("webp", 100, 4)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        StorageCodec("tiff")
+
+
+def test_default_png_keeps_the_original_bytes(tmp_path):
+    path = make_png(tmp_path / "img.png")
+    original = path.read_bytes()
+    assert StorageCodec().encode(path) == path
+    assert path.read_bytes() == original
+
+
+@pytest.mark.parametrize("storage_format, extension, pil_format", [
+    ("webp", ".webp", "WEBP"),
+    ("jpeg", ".jpg", "JPEG"),
+])
+def test_encode_replaces_the_png(tmp_path, storage_format, extension, pil_format):
+    path = make_png(tmp_path / "20250101T000000_output_image.png", mode="RGBA")
+    stored = StorageCodec(storage_format, quality=80, effort=1).encode(path)
+    assert stored == tmp_path / f"20250101T000000_output_image{extension}"
+    assert list(tmp_path.iterdir()) == [stored]
+    with Image.open(stored) as img:
+        assert img.format == pil_format
+        assert img.size == (120, 80)
+
+
+def test_png_effort_reencodes_in_place(tmp_path):
+    path = make_png(tmp_path / "img.png")
+    assert StorageCodec("png", effort=9).encode(path) == path
+    with Image.open(path) as img:
+        assert img.format == "PNG"
+
+
+def test_failed_encode_leaves_the_source(tmp_path):
+    path = tmp_path / "img.png"
+    path.write_bytes(b"not an image")
+    with pytest.raises(Exception):
+        StorageCodec("webp").encode(path)
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_content_type():
+    assert content_type("a/b.webp") == "image/webp"
+    assert content_type("a/b.png") == "image/png"
+    assert content_type("a/b.txt") == "text/plain"
@@ -0,0 +1,98 @@
+import base64
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from HttpTransport import HttpTransport
+from ImageGenerator import ImageGenerator, ImGenError
+from ImageLoader import sniff_image_extension
+from Resilience import Resilience
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 32), (200, 10, 10)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeImages:
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+
+    def generate(self, **kwargs):
+        self.requests.append(kwargs)
+        return SimpleNamespace(data=[self.data])
+
+
+def make_generator(response_format, data, transport=None):
+    config = {"image_response_format": response_format}
+    prompt_generator = SimpleNamespace(
+        config_mgr=SimpleNamespace(current=config),
+        resilience=Resilience(attempts=1),
+        transport=transport or HttpTransport())
+    generator = ImageGenerator(prompt_generator, api_key="test")
+    generator.client = SimpleNamespace(images=FakeImages(data))
+    return generator
+
+
+def test_sniff_image_extension():
+    assert sniff_image_extension(png_bytes()[:16]) == ".png"
+    assert sniff_image_extension(b"\xff\xd8\xff\xe0rest") == ".jpg"
+    assert sniff_image_extension(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == ".webp"
+    assert sniff_image_extension(b"<html>") is None
+
+
+def test_b64_json_is_written_as_returned(tmp_path):
+    original = png_bytes()
+    generator = make_generator("b64_json", SimpleNamespace(b64_json=base64.b64encode(original).decode(), url=None))
+    path = generator.get_image_from_service("a prompt", (1920, 1080), tmp_path / "20250101T000000_output_image")
+    assert path == tmp_path / "20250101T000000_output_image.png"
+    assert path.read_bytes() == original
+    assert generator.client.images.requests[0]["response_format"] == "b64_json"
+    assert generator.client.images.requests[0]["size"] == "1792x1024"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = b""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_server():
+    ImageHandler.body = png_bytes()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/image.png"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_url_is_streamed_to_disk(tmp_path, image_server):
+    generator = make_generator("url", SimpleNamespace(b64_json=None, url=image_server))
+    path = generator.get_image_from_service("a prompt", (1080, 1920), tmp_path / "img")
+    assert path.read_bytes() == ImageHandler.body
+    assert generator.client.images.requests[0]["size"] == "1024x1792"
+    assert not Path(str(tmp_path / "img") + ".part").exists()
+
+
+def test_non_image_is_rejected(tmp_path):
+    generator = make_generator("b64_json", SimpleNamespace(b64_json=base64.b64encode(b"oops").decode(), url=None))
+    with pytest.raises(ImGenError):
+        generator.get_image_from_service("a prompt", (100, 100), tmp_path / "img")
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,34 @@
+import pytest
+from PIL import Image
+
+from ImageLoader import fit_size, load_for_display, resample_filter
+
+
+@pytest.mark.parametrize("ext", ["png", "jpg"])
+@pytest.mark.parametrize("source, target", [
+    ((1792, 1024), (800, 480)),
+    ((1024, 1792), (1920, 1080)),
+    ((1024, 1024), (1920, 1080)),  # scaled up
+    ((4096, 2340), (800, 480)),  # reduce + draft by a large factor
+])
+def test_load_for_display_returns_fitted_size(tmp_path, ext, source, target):
+    path = tmp_path / f"sample.{ext}"
+    Image.new("RGB", source, (10, 200, 30)).save(path)
+    img = load_for_display(path, target)
+    assert img.mode == "RGB"
+    assert img.size == fit_size(target[0], target[1], source[0], source[1])
+
+
+def test_load_for_display_without_target_is_full_size(tmp_path):
+    path = tmp_path / "sample.png"
+    Image.new("RGBA", (300, 200)).save(path)
+    img = load_for_display(path)
+    assert img.size == (300, 200)
+    assert img.mode == "RGB"
+
+
+def test_resample_filter_names():
+    assert resample_filter("bicubic") == Image.Resampling.BICUBIC
+    assert resample_filter("NEAREST") == Image.Resampling.NEAREST
+    assert resample_filter(None) == Image.Resampling.LANCZOS
+    assert resample_filter("bogus") == Image.Resampling.LANCZOS
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from LibraryIndex import LibraryIndex, UNRATED, parse_rating
+
+
+@pytest.fixture
+def library(tmp_path):
+    theme_dir = tmp_path / "creative"
+    theme_dir.mkdir()
+    for name in [
+        "20250219T000001_output_image.png",
+        "20250219T000001_prompt.txt",
+        "20250219T000002_output_image r[2.0].png",
+        "20250219T000002_prompt r[2.0].txt",
+        "20250219T000003_output_image r[4.0].jpg",
+        "20250219T000004_output_image.jpeg",
+        "notes.md",
+    ]:
+        (theme_dir / name).write_text("dummy")
+    (tmp_path / "halloween").mkdir()
+    index = LibraryIndex(str(tmp_path))
+    index.build()
+    return index, tmp_path
+
+
+def test_parse_rating():
+    assert parse_rating("20250219T000002_output_image r[2.0].png") == 2.0
+    assert parse_rating("20250219T000002_output_image.png") == UNRATED
+
+
+def test_build_indexes_images_and_prompts(library):
+    index, root = library
+    assert set(index.themes()) == {"creative", "halloween"}
+    assert index.count("creative") == 4
+    record = index.record(root / "creative" / "20250219T000001_output_image.png")
+    assert record.prefix == "20250219T000001"
+    assert record.rating == UNRATED
+    assert record.prompt_path == os.path.join(str(root), "creative", "20250219T000001_prompt.txt")
+
+
+def test_unrated_and_rated_queries(library):
+    index, root = library
+    assert [os.path.basename(p) for p in index.unrated("creative")] == [
+        "20250219T000001_output_image.png", "20250219T000004_output_image.jpeg"]
+    assert [(r, os.path.basename(p)) for r, p in index.rated("creative", (0.0, 5.0))] == [
+        (2.0, "20250219T000002_output_image r[2.0].png"), (4.0, "20250219T000003_output_image r[4.0].jpg")]
+    assert [r for r, _ in index.rated("creative", (3.0, 4.0))] == [4.0]
+
+
+def test_random_image_respects_rating_floor(library):
+    index, _ = library
+    for _ in range(20):
+        assert os.path.basename(index.random_image("creative", 3.0)) == "20250219T000003_output_image r[4.0].jpg"
+    # nothing at 5.0 or above: falls back to any image
+    assert index.random_image("creative", 5.0) is not None
+    assert index.random_image("halloween") is None
+
+
+def test_incremental_updates(library):
+    index, root = library
+    old = root / "creative" / "20250219T000001_output_image.png"
+    new = root / "creative" / "20250219T000001_output_image r[5.0].png"
+    os.rename(old, new)
+    index.rename_file(old, new)
+    assert index.record(old) is None
+    assert index.record(new).rating == 5.0
+    assert len(index.unrated("creative")) == 1
+
+    index.remove_file(new)
+    assert index.count("creative") == 3
+
+    added = root / "halloween" / "20250301T000000_output_image.png"
+    added.write_text("dummy")
+    index.add_file(added)
+    assert index.random_image("halloween") == str(added)
+
+
+def test_refresh_changed_picks_up_external_changes(library):
+    index, root = library
+    (root / "creative" / "20250219T000004_output_image.jpeg").unlink()
+    (root / "creative" / "20250220T000000_output_image.png").write_text("dummy")
+    # make sure the directory mtime moves even on coarse-grained filesystems
+    stat = os.stat(root / "creative")
+    os.utime(root / "creative", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    index.refresh_changed()
+    names = {os.path.basename(p) for p in index.unrated("creative")}
+    assert names == {"20250219T000001_output_image.png", "20250220T000000_output_image.png"}
+
+
+def test_listeners_see_renames_as_remove_then_add(library):
+    index, root = library
+    events = []
+    index.subscribe(lambda theme, path, rating: events.append((theme, os.path.basename(path), rating)))
+    old = root / "creative" / "20250219T000001_output_image.png"
+    new = root / "creative" / "20250219T000001_output_image r[3.0].png"
+    os.rename(old, new)
+    index.rename_file(old, new)
+    assert events == [("creative", "20250219T000001_output_image.png", None),
+                      ("creative", "20250219T000001_output_image r[3.0].png", 3.0)]
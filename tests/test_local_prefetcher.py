@@ -0,0 +1,81 @@
+import time
+
+from PIL import Image
+
+from LocalPrefetcher import LocalPrefetcher
+
+
+def wait_until_ready(prefetcher, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not prefetcher._future.done():
+        time.sleep(0.01)
+
+
+def test_prefetched_image_is_handed_over_with_metrics(tmp_path):
+    img_path = tmp_path / "20250219T171207_output_image.png"
+    Image.new("RGB", (200, 100)).save(img_path)
+    chosen = []
+
+    prefetcher = LocalPrefetcher()
+    prefetcher.ensure(lambda: chosen.append(img_path) or img_path, (400, 300), (0, 0, 0))
+    wait_until_ready(prefetcher)
+    # a second ensure() doesn't choose again
+    prefetcher.ensure(lambda: chosen.append(img_path) or img_path, (400, 300), (0, 0, 0))
+    assert len(chosen) == 1
+
+    prepared = prefetcher.take((400, 300), (0, 0, 0))
+    assert prepared.source_path == img_path
+    assert prepared.frame.size == (400, 300)
+    metrics = prefetcher.metrics()
+    assert metrics["hits"] == 1 and metrics["misses"] == 0
+    assert metrics["last_decode_ms"] >= 0.0
+    prefetcher.shutdown()
+
+
+def test_canvas_change_rebuilds_frame_from_same_file(tmp_path):
+    img_path = tmp_path / "20250219T171207_output_image.png"
+    Image.new("RGB", (200, 100)).save(img_path)
+
+    prefetcher = LocalPrefetcher()
+    prefetcher.ensure(lambda: img_path, (400, 300), (0, 0, 0))
+    wait_until_ready(prefetcher)
+    prefetcher.ensure(lambda: None, (800, 600), (0, 0, 0))
+    wait_until_ready(prefetcher)
+
+    prepared = prefetcher.take((800, 600), (0, 0, 0))
+    assert prepared.source_path == img_path
+    assert prepared.frame.size == (800, 600)
+    prefetcher.shutdown()
+
+
+def test_take_without_prefetch_is_a_miss():
+    prefetcher = LocalPrefetcher()
+    assert prefetcher.take((400, 300), (0, 0, 0)) is None
+    assert prefetcher.metrics()["misses"] == 1
+    prefetcher.shutdown()
+
+
+def test_backs_off_while_there_is_nothing_to_choose(tmp_path):
+    img_path = tmp_path / "20250219T171207_output_image.png"
+    Image.new("RGB", (200, 100)).save(img_path)
+    now = [100.0]
+    calls = []
+
+    prefetcher = LocalPrefetcher(retry_delay=1.0, max_retry_delay=2.0, clock=lambda: now[0])
+    choose_nothing = lambda: calls.append(now[0]) or None
+    for _ in range(4):
+        prefetcher.ensure(choose_nothing, (400, 300), (0, 0, 0))
+    assert calls == [100.0]
+    now[0] = 101.0
+    prefetcher.ensure(choose_nothing, (400, 300), (0, 0, 0))
+    now[0] = 102.5  # the delay has doubled to 2s
+    prefetcher.ensure(choose_nothing, (400, 300), (0, 0, 0))
+    now[0] = 103.0
+    prefetcher.ensure(choose_nothing, (400, 300), (0, 0, 0))
+    assert calls == [100.0, 101.0, 103.0]
+
+    now[0] = 105.0
+    prefetcher.ensure(lambda: img_path, (400, 300), (0, 0, 0))
+    wait_until_ready(prefetcher)
+    assert prefetcher.take((400, 300), (0, 0, 0)).source_path == img_path
+    prefetcher.shutdown()
@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from PromptGenerator import PromptGenerator
+from PromptPool import PromptPool
+from Theme import Theme
+from ThemeMgr import ThemeMgr
+
+
+class DummyPromptGenerator:
+    """Builds prompts from a real ThemeMgr; 'embellishes' by tagging them."""
+
+    def __init__(self, themes_dir):
+        self.theme_mgr = ThemeMgr(str(themes_dir))
+        self.config_mgr = SimpleNamespace(current={"active_theme": "default.yaml", "active_style": "random"})
+        self.batches = []
+
+    def build_prompt(self, theme_name, active_style):
+        theme = self.theme_mgr.get_compiled_theme(theme_name)
+        return {PromptGenerator.FULL_PROMPT: theme.format_prompt(theme.prompts[0]),
+                PromptGenerator.SYSTEM_PROMPT: theme.system_prompt}
+
+    def embellish_prompts(self, user_prompts, system_prompt):
+        self.batches.append(len(user_prompts))
+        return [f"embellished: {p}" for p in user_prompts]
+
+
+@pytest.fixture
+def pool(tmp_path):
+    generator = DummyPromptGenerator(tmp_path / "themes")
+    return PromptPool(generator, pool_dir=str(tmp_path / "pool"), batch_size=4, low_water=2)
+
+
+def test_refill_fetches_one_batch_and_take_serves_in_order(pool):
+    assert pool.take() is None  # empty, never blocks
+    assert pool.refill("default.yaml", "random") == 4
+    assert pool.prompt_generator.batches == [4]
+    pooled = pool.take()
+    assert pooled.prompt.startswith("embellished: ")
+    assert pooled.theme_name == "default.yaml"
+    assert pool.count("default.yaml", "random") == 3
+    # already above the low-water mark: only tops up what was taken
+    assert pool.refill("default.yaml", "random") == 1
+
+
+def test_pool_persists_across_instances(pool, tmp_path):
+    pool.refill("default.yaml", "random")
+    pool.take()
+    restarted = PromptPool(pool.prompt_generator, pool_dir=str(tmp_path / "pool"), batch_size=4)
+    assert restarted.count("default.yaml", "random") == 3
+    assert restarted.count("default.yaml", "realistic") == 0
+
+
+def test_theme_change_drops_pool(pool):
+    pool.refill("default.yaml", "random")
+    theme = pool.prompt_generator.theme_mgr.get_theme("default")
+    theme.prompts = ["Something new"]
+    pool.prompt_generator.theme_mgr.write_theme(theme)
+    assert pool.count("default.yaml", "random") == 0
+
+
+def test_background_refill_below_low_water(pool):
+    pool.start()
+    try:
+        pool.take()  # empty: asks for a refill
+        deadline = time.time() + 5
+        while pool.count("default.yaml", "random") < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        assert pool.count("default.yaml", "random") == 4
+        pool.take()
+        pool.take()
+        pool.take()  # 1 left, below low water
+        deadline = time.time() + 5
+        while pool.count("default.yaml", "random") < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        assert pool.prompt_generator.batches == [4, 3]
+    finally:
+        pool.shutdown()
@@ -2,12 +2,15 @@ import os
 
 import pytest
 
+from LibraryIndex import LibraryIndex
 from RatingManager import (
     RatingManager,
     update_filename_with_rating,
     SortEnum,
     is_image_file  # assuming is_image_file is exported from RatingManager.py
 )
+from S3Manager import OperationResult
+from UploadOutbox import UploadOutbox
 
 
 # ----------------------------
@@ -31,6 +34,15 @@ class DummyS3Manager:
     def is_in_s3(self, s3_prefix: str, filename: str) -> bool:
         return self.is_in_s3_result
 
+    def rename_many(self, pairs):
+        results = []
+        for old_key, new_key in pairs:
+            if self.is_in_s3_result:
+                self.changes.append((os.path.basename(old_key), os.path.basename(new_key)))
+            results.append(OperationResult(key=old_key, ok=self.is_in_s3_result, new_key=new_key,
+                                           missing=not self.is_in_s3_result))
+        return results
+
 
 
 # ----------------------------
@@ -44,6 +56,11 @@ def test_is_image_file_true(tmp_path):
     assert is_image_file(str(image_path))
 
 
+def test_is_image_file_webp(tmp_path):
+    # WebP is one of the storage formats, see ImageCodec
+    assert is_image_file(str(tmp_path / "20250101T000000_output_image.webp"))
+
+
 def test_is_image_file_false(tmp_path):
     # Non-image file with a .txt extension.
     non_image_path = tmp_path / "document.txt"
@@ -140,6 +157,25 @@ def test_start_rating(tmp_path):
     assert rm.current_index == 0
 
 
+def test_unrated_files_from_library_index(tmp_path):
+    theme_dir = tmp_path / "creative"
+    theme_dir.mkdir()
+    file1 = theme_dir / "20250219T171207_img1.png"
+    file1.write_text("dummy")
+    (theme_dir / "20250219T171207_prompt.txt").write_text("dummy")
+    index = LibraryIndex(str(tmp_path))
+    index.build()
+
+    rm = RatingManager(DummyS3Manager(), index)
+    assert rm.start_rating(str(theme_dir)) == [str(file1)]
+
+    # renames are reported back to the index
+    rm.rate_file(str(file1), 4.0)
+    assert rm.find_all_unrated_files(str(theme_dir)) == []
+    assert rm.find_all_rated_files(str(theme_dir), (4.0, 4.0), SortEnum.NONE) == [
+        str(theme_dir / "20250219T171207_img1 r[4.0].png")]
+
+
 # ----------------------------
 # Tests for rate_file
 # ----------------------------
@@ -186,6 +222,37 @@ def test_rate_file(tmp_path):
         rm.rate_file(str(tmp_path / "non_existent_file.png"), 3.0)
 
 
+def test_rate_file_uploads_companions_missing_from_s3(tmp_path):
+    file_img = tmp_path / "20250219T171207_img1.png"
+    file_img.write_text("image content")
+    dummy_s3 = DummyS3Manager()
+    dummy_s3.is_in_s3_result = False
+    rm = RatingManager(dummy_s3)
+    rm.rate_file(str(file_img), 2.0)
+
+    new_img_path = tmp_path / "20250219T171207_img1 r[2.0].png"
+    prefix = os.path.basename(tmp_path)
+    assert dummy_s3.changes == [(str(new_img_path), f"{prefix}/20250219T171207_img1 r[2.0].png")]
+
+
+def test_rate_file_queues_uploads_in_the_outbox(tmp_path):
+    file_img = tmp_path / "20250219T171207_img1.png"
+    file_img.write_text("image content")
+    dummy_s3 = DummyS3Manager()
+    dummy_s3.is_in_s3_result = False  # its upload hasn't run yet
+    prefix = os.path.basename(tmp_path)
+    outbox = UploadOutbox(dummy_s3, db_path=str(tmp_path / "outbox.sqlite3"))
+    outbox.enqueue(file_img, f"{prefix}/20250219T171207_img1.png")
+
+    rm = RatingManager(dummy_s3, upload_outbox=outbox)
+    rm.rate_file(str(file_img), 2.0)
+
+    new_img_path = tmp_path / "20250219T171207_img1 r[2.0].png"
+    assert dummy_s3.changes == []  # nothing uploaded on the spot
+    assert outbox.pending() == [(str(new_img_path), f"{prefix}/20250219T171207_img1 r[2.0].png")]
+    outbox.close()
+
+
 # ----------------------------
 # Tests for next() and prev() with only image files
 # ----------------------------
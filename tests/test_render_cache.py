@@ -0,0 +1,57 @@
+from PIL import Image
+
+from RenderCache import RenderCache, compose_frame
+
+
+def test_compose_frame_letterboxes_and_centers():
+    img = Image.new("RGB", (200, 100), (255, 0, 0))
+    frame = compose_frame(img, (400, 400), (0, 0, 255))
+    assert frame.size == (400, 400)
+    # top band is background, center is image
+    assert frame.getpixel((200, 10)) == (0, 0, 255)
+    assert frame.getpixel((200, 200)) == (255, 0, 0)
+
+
+def test_compose_frame_full_frame_is_passed_through():
+    img = Image.new("RGB", (320, 240))
+    assert compose_frame(img, (320, 240), (0, 0, 0)) is img
+
+
+def test_compose_frame_scales_oversized_images_matching_one_canvas_side():
+    # portrait on landscape: same width as the canvas, but far too tall
+    portrait = compose_frame(Image.new("RGB", (800, 2000), (255, 0, 0)), (800, 600), (0, 0, 255))
+    assert portrait.size == (800, 600)
+    assert portrait.getpixel((10, 300)) == (0, 0, 255)  # pillarboxed, not cropped
+    assert portrait.getpixel((400, 300)) == (255, 0, 0)
+
+    # wide on landscape: same height as the canvas, but far too wide
+    wide = compose_frame(Image.new("RGB", (1600, 600), (255, 0, 0)), (800, 600), (0, 0, 255))
+    assert wide.size == (800, 600)
+    assert wide.getpixel((400, 10)) == (0, 0, 255)  # letterboxed, not cropped
+    assert wide.getpixel((400, 300)) == (255, 0, 0)
+
+
+def test_render_cache_skips_identical_frames():
+    cache = RenderCache()
+    img = Image.new("RGB", (10, 10))
+    key = cache.make_key(img, (800, 600), "#000000")
+    assert not cache.is_current(key)
+    cache.remember(key, img)
+
+    assert cache.is_current(cache.make_key(img, (800, 600), "#000000"))
+    assert cache.is_current(cache.make_key(img, (800, 600), "#000000"))
+    assert cache.stats() == {"renders_performed": 1, "renders_skipped": 2}
+
+
+def test_render_cache_detects_changes():
+    cache = RenderCache()
+    img = Image.new("RGB", (10, 10))
+    cache.remember(cache.make_key(img, (800, 600), "#000000"), img)
+
+    other = Image.new("RGB", (10, 10))
+    assert not cache.is_current(cache.make_key(other, (800, 600), "#000000"))
+    assert not cache.is_current(cache.make_key(img, (1024, 768), "#000000"))
+    assert not cache.is_current(cache.make_key(img, (800, 600), "#112233"))
+
+    cache.invalidate()
+    assert not cache.is_current(cache.make_key(img, (800, 600), "#000000"))
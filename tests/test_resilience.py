@@ -0,0 +1,108 @@
+import httpx
+import openai
+import pytest
+import requests
+
+from Resilience import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, Resilience, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_resilience(clock, **kwargs):
+    return Resilience(sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def flaky(failures, error=requests.ConnectionError("reset")):
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise error
+        return "ok"
+
+    return fn, calls
+
+
+def test_retryable_errors():
+    request = httpx.Request("POST", "https://api.openai.com/v1/images/generations")
+    assert is_retryable(openai.APITimeoutError(request=request))
+    assert is_retryable(requests.Timeout())
+    busy = openai.RateLimitError("slow down", response=httpx.Response(429, request=request), body=None)
+    assert is_retryable(busy)
+    rejected = openai.BadRequestError("no", response=httpx.Response(400, request=request), body=None)
+    assert not is_retryable(rejected)
+    assert not is_retryable(ValueError())
+
+
+def test_retries_with_backoff_then_succeeds(clock):
+    resilience = make_resilience(clock, attempts=3, timeout=5.0)
+    fn, calls = flaky(2)
+    assert resilience.call("svc", fn) == "ok"
+    assert len(calls) == 3
+    assert all(t <= 5.0 for t in calls)
+    metrics = resilience.metrics()["svc"]
+    assert metrics["retries"] == 2
+    assert metrics["state"] == CLOSED
+
+
+def test_non_retryable_error_is_raised_at_once(clock):
+    resilience = make_resilience(clock, failure_threshold=1)
+    fn, calls = flaky(5, error=ValueError("bad prompt"))
+    with pytest.raises(ValueError):
+        resilience.call("svc", fn)
+    assert len(calls) == 1
+    # not the service's fault, so the breaker stays closed
+    assert resilience.breaker("svc").state == CLOSED
+
+
+def test_deadline_caps_attempt_timeouts(clock):
+    resilience = make_resilience(clock, attempts=10, timeout=30.0, deadline=40.0, base_delay=4.0)
+
+    def slow(timeout):
+        clock.now += timeout
+        raise requests.Timeout()
+
+    with pytest.raises(requests.Timeout):
+        resilience.call("svc", slow)
+    assert clock.now <= 40.0
+
+
+def test_breaker_opens_fails_fast_and_recovers(clock):
+    resilience = make_resilience(clock, attempts=1, failure_threshold=2, reset_timeout=60.0)
+    fn, calls = flaky(3)
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            resilience.call("svc", fn)
+    assert resilience.breaker("svc").state == OPEN
+    assert not resilience.is_available("svc")
+    with pytest.raises(CircuitOpenError):
+        resilience.call("svc", fn)
+    assert len(calls) == 2  # short-circuited, fn not called
+
+    clock.now += 61
+    assert resilience.breaker("svc").state == HALF_OPEN
+    with pytest.raises(requests.ConnectionError):
+        resilience.call("svc", fn)  # trial call fails: open again
+    assert resilience.breaker("svc").state == OPEN
+
+    clock.now += 61
+    assert resilience.call("svc", fn) == "ok"
+    assert resilience.breaker("svc").state == CLOSED
+    metrics = resilience.metrics()["svc"]
+    assert metrics["short_circuits"] == 1
+    assert metrics["times_opened"] == 1
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from LibraryIndex import LibraryIndex
+from RetentionMgr import RetentionMgr, RetentionPolicy
+
+
+def _write(theme_dir, prefix, mtime, rating=None, size=10):
+    marker = f" r[{rating:.1f}]" if rating is not None else ""
+    image = theme_dir / f"{prefix}_output_image{marker}.png"
+    prompt = theme_dir / f"{prefix}_prompt{marker}.txt"
+    image.write_bytes(b"x" * size)
+    prompt.write_text("prompt")
+    os.utime(image, (mtime, mtime))
+    return image, prompt
+
+
+@pytest.fixture
+def library(tmp_path):
+    creative = tmp_path / "creative"
+    halloween = tmp_path / "halloween"
+    creative.mkdir()
+    halloween.mkdir()
+    files = {
+        "c1": _write(creative, "20250101T000001", 1000),
+        "c2": _write(creative, "20250101T000002", 2000, rating=5.0),
+        "c3": _write(creative, "20250101T000003", 3000),
+        "h1": _write(halloween, "20250101T000004", 1500),
+        "h2": _write(halloween, "20250101T000005", 4000),
+    }
+    index = LibraryIndex(str(tmp_path))
+    index.build()
+    return index, files
+
+
+def test_evicts_oldest_across_themes_with_prompts(library):
+    index, files = library
+    retention = RetentionMgr(index, RetentionPolicy(max_files=3))
+    assert retention.enforce() == 2
+    for key in ("c1", "h1"):
+        assert not files[key][0].exists()
+        assert not files[key][1].exists()
+    assert all(files[key][0].exists() for key in ("c2", "c3", "h2"))
+    assert retention.total_files == 3
+    assert index.count("creative") == 2
+
+
+def test_protected_and_kept_images_are_skipped(library):
+    index, files = library
+    retention = RetentionMgr(index, RetentionPolicy(max_files=1, protect_min_rating=4.0))
+    retention.enforce(keep={str(files["c1"][0])})
+    assert files["c1"][0].exists()  # in use
+    assert files["c2"][0].exists()  # protected
+    assert not files["c3"][0].exists()
+    assert not files["h1"][0].exists()
+    assert not files["h2"][0].exists()
+
+
+def test_theme_quota_and_byte_budget(library):
+    index, files = library
+    retention = RetentionMgr(index, RetentionPolicy(max_files=100, theme_quotas={"halloween": 1}))
+    assert retention.enforce() == 1
+    assert not files["h1"][0].exists()
+
+    retention.set_policy(RetentionPolicy(max_files=100, max_bytes=25))
+    retention.enforce()
+    assert retention.total_bytes <= 25
+    assert [key for key in ("c1", "c2", "c3", "h2") if files[key][0].exists()] == ["c3", "h2"]
+
+
+def test_tracks_files_added_and_renamed_later(library, tmp_path):
+    index, files = library
+    retention = RetentionMgr(index, RetentionPolicy(max_files=5, protect_min_rating=4.0))
+    image, _ = _write(tmp_path / "creative", "20250101T000000", 500)
+    index.add_file(image)
+    assert retention.total_files == 6
+
+    # re-rating the oldest image protects it
+    rated = image.with_name("20250101T000000_output_image r[4.0].png")
+    os.rename(image, rated)
+    index.rename_file(image, rated)
+    retention.enforce()
+    assert rated.exists()
+    assert not files["c1"][0].exists()
+
+
+def test_a_failed_delete_stays_in_the_index(library, monkeypatch):
+    index, files = library
+    stuck = str(files["c1"][0])
+    remove = os.remove
+
+    def failing_remove(path):
+        if os.fspath(path) == stuck:
+            raise PermissionError("read-only")
+        remove(path)
+
+    monkeypatch.setattr(os, "remove", failing_remove)
+    retention = RetentionMgr(index, RetentionPolicy(max_files=4))
+    assert retention.enforce() == 0
+    assert files["c1"][0].exists()
+    assert index.record(stuck) is not None
+    assert not files["c1"][1].exists()  # its prompt went
@@ -0,0 +1,119 @@
+from datetime import datetime, timezone
+
+from S3Inventory import S3Inventory
+from S3Manager import S3Manager
+
+
+class ListingClient:
+    """list_objects_v2 with Prefix, Delimiter and StartAfter, counting requests per prefix."""
+
+    def __init__(self, keys):
+        self.keys = dict.fromkeys(keys, 5)
+        self.requests = []
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix="", Delimiter=None, StartAfter=""):
+                client.requests.append((Prefix, Delimiter, StartAfter))
+                now = datetime.now(timezone.utc)
+                contents, prefixes = [], set()
+                for key in sorted(client.keys):
+                    if not key.startswith(Prefix) or key <= StartAfter:
+                        continue
+                    rest = key[len(Prefix):]
+                    if Delimiter and Delimiter in rest:
+                        prefixes.add(Prefix + rest[:rest.index(Delimiter) + 1])
+                        continue
+                    contents.append({"Key": key, "Size": client.keys[key], "LastModified": now,
+                                     "ETag": f'"etag-{client.keys[key]}"'})
+                page = {"Contents": contents}
+                if prefixes:
+                    page["CommonPrefixes"] = [{"Prefix": p} for p in sorted(prefixes)]
+                return [page]
+        return Paginator()
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.keys.pop(obj["Key"], None)
+        return {}
+
+    def copy_object(self, Bucket, CopySource, Key):
+        self.keys[Key] = self.keys[CopySource["Key"]]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_inventory(tmp_path, client, clock):
+    manager = S3Manager()
+    manager.s3 = client
+    return manager, S3Inventory(manager, path=str(tmp_path / "inventory.json"), reconcile_interval=100, clock=clock)
+
+
+def names(files):
+    return sorted(file["name"] for file in files)
+
+
+def test_incremental_refresh_lists_only_new_keys(tmp_path):
+    client = ListingClient(["creative/20250101T000000 a.png", "halloween/20250101T000000 b.png", "stray.txt"])
+    clock = Clock()
+    _, inventory = make_inventory(tmp_path, client, clock)
+    assert names(inventory.refresh()) == ["creative/20250101T000000 a.png", "halloween/20250101T000000 b.png",
+                                         "stray.txt"]
+
+    client.keys["creative/20250102T000000 c.png"] = 7
+    client.requests.clear()
+    files = inventory.refresh()
+    assert "creative/20250102T000000 c.png" in names(files)
+    assert ("creative/", None, "creative/20250101T000000 a.png") in client.requests
+    assert ("halloween/", None, "halloween/20250101T000000 b.png") in client.requests
+
+
+def test_own_changes_are_applied_and_reconciliation_catches_the_rest(tmp_path):
+    client = ListingClient(["creative/20250101T000000 a.png", "creative/20250101T000000 b.txt"])
+    clock = Clock()
+    manager, inventory = make_inventory(tmp_path, client, clock)
+    inventory.refresh()
+
+    manager.rename_many([("creative/20250101T000000 a.png", "creative/20250101T000000 a r[3.0].png")])
+    manager.delete_many(["creative/20250101T000000 b.txt"])
+    assert names(inventory.files()) == ["creative/20250101T000000 a r[3.0].png"]
+
+    # changed behind our back; an incremental refresh can't see it
+    client.keys.pop("creative/20250101T000000 a r[3.0].png")
+    client.keys["creative/20250101T000000 a r[4.0].png"] = 5
+    assert names(inventory.refresh()) == ["creative/20250101T000000 a r[3.0].png"]
+    clock.now += 101
+    assert names(inventory.refresh()) == ["creative/20250101T000000 a r[4.0].png"]
+
+
+def test_inventory_is_persisted(tmp_path):
+    client = ListingClient(["creative/20250101T000000 a.png"])
+    clock = Clock()
+    _, inventory = make_inventory(tmp_path, client, clock)
+    inventory.refresh()
+
+    client.requests.clear()
+    _, reloaded = make_inventory(tmp_path, client, clock)
+    assert len(reloaded) == 1
+    reloaded.refresh()
+    assert ("creative/", None, "creative/20250101T000000 a.png") in client.requests
+
+
+def test_etags_are_listed_and_survive_our_renames(tmp_path):
+    client = ListingClient(["creative/20250101T000000 a.png"])
+    _, inventory = make_inventory(tmp_path, client, Clock())
+    manager = inventory.s3_manager
+    assert inventory.refresh()[0]["etag"] == "etag-5"
+
+    manager.rename_many([("creative/20250101T000000 a.png", "creative/20250101T000000 a r[3.0].png")])
+    assert inventory.files()[0]["etag"] == "etag-5"
+    inventory.on_bucket_change(None, "creative/20250101T000000 a r[3.0].png", 9)  # uploaded over it
+    assert inventory.files()[0]["etag"] == ""
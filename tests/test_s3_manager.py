@@ -0,0 +1,186 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from S3Manager import S3Manager
+from S3Manifest import ManifestEntry, S3Manifest
+
+
+class FakeS3Client:
+    """Just enough of the boto3 S3 client for the bulk operations."""
+
+    def __init__(self, keys=(), failing_deletes=()):
+        self.keys = set(keys)
+        self.failing_deletes = set(failing_deletes)
+        self.delete_requests = []
+        self.lock = threading.Lock()
+
+    def copy_object(self, Bucket, CopySource, Key):
+        with self.lock:
+            if CopySource["Key"] not in self.keys:
+                raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "missing"}}, "CopyObject")
+            self.keys.add(Key)
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [obj["Key"] for obj in Delete["Objects"]]
+        self.delete_requests.append(keys)
+        errors = [{"Key": key, "Code": "AccessDenied", "Message": "no"} for key in keys if key in self.failing_deletes]
+        self.keys -= set(keys) - self.failing_deletes
+        return {"Errors": errors} if errors else {}
+
+
+def make_manager(client) -> S3Manager:
+    manager = S3Manager(max_workers=4)
+    manager.s3 = client
+    return manager
+
+
+def test_delete_many_batches_by_1000():
+    client = FakeS3Client(keys=[f"creative/{i}.png" for i in range(2500)], failing_deletes=["creative/7.png"])
+    results = make_manager(client).delete_many([f"creative/{i}.png" for i in range(2500)])
+    assert [len(request) for request in client.delete_requests] == [1000, 1000, 500]
+    assert len(results) == 2500
+    assert [r.key for r in results if not r.ok] == ["creative/7.png"]
+    assert client.keys == {"creative/7.png"}
+
+
+def test_rename_many_reports_per_key():
+    client = FakeS3Client(keys=["creative/a.png", "creative/b.txt"], failing_deletes=["creative/b.txt"])
+    results = make_manager(client).rename_many([
+        ("creative/a.png", "creative/a r[3.0].png"),
+        ("creative/b.txt", "creative/b r[3.0].txt"),
+        ("creative/c.png", "creative/c r[3.0].png"),
+    ])
+    assert [(r.key, r.ok, r.missing) for r in results] == [
+        ("creative/a.png", True, False),
+        ("creative/b.txt", False, False),
+        ("creative/c.png", False, True),
+    ]
+    assert "not deleted" in results[1].error
+    assert client.delete_requests == [["creative/a.png", "creative/b.txt"]]
+    assert "creative/a r[3.0].png" in client.keys and "creative/a.png" not in client.keys
+
+
+class ListingS3Client(FakeS3Client):
+    """Adds listing and HEAD requests, counting both."""
+
+    def __init__(self, keys=()):
+        super().__init__(keys)
+        self.listings = 0
+        self.heads = 0
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket):
+                client.listings += 1
+                now = datetime.now(timezone.utc)
+                return [{"Contents": [{"Key": key, "Size": 5, "ETag": '"abc"', "LastModified": now}
+                                      for key in sorted(client.keys)]}]
+        return Paginator()
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        if Key not in self.keys:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {}
+
+    def upload_file(self, file_path, bucket, key, ExtraArgs=None, Callback=None, Config=None):
+        self.keys.add(key)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_existence_checks_use_the_manifest(tmp_path):
+    client = ListingS3Client(keys=["creative/a.png"])
+    clock = Clock()
+    manager = make_manager(client)
+    manager.manifest = S3Manifest(str(tmp_path / "manifest.json"), max_age=60, clock=clock)
+
+    # not seeded yet: answered with a HEAD request while the bucket is listed in the background
+    assert manager.is_in_s3("creative", "a.png")
+    manager._refresh_thread.join()
+    assert (client.listings, client.heads) == (1, 1)
+
+    assert manager.is_in_s3("creative", "a.png")
+    assert not manager.is_in_s3("creative", "b.png")
+    assert (client.listings, client.heads) == (1, 1)
+    assert manager.manifest.get("creative/a.png").etag == "abc"
+
+    # kept current by our own changes
+    path = tmp_path / "b.png"
+    path.write_bytes(b"12345")
+    manager.upload_to_s3(str(path), "creative/b.png")
+    manager.rename_many([("creative/a.png", "creative/a r[3.0].png"), ("creative/x.png", "creative/y.png")])
+    assert manager.exists("creative/b.png")
+    assert manager.exists("creative/a r[3.0].png") and not manager.exists("creative/a.png")
+    assert client.listings == 1
+
+    # revalidated once it is older than max_age, without the caller waiting for the listing
+    clock.now += 61
+    client.keys.add("creative/from_elsewhere.png")
+    assert manager.exists("creative/from_elsewhere.png")
+    assert client.heads == 2
+    manager._refresh_thread.join()
+    assert client.listings == 2
+    assert manager.exists("creative/from_elsewhere.png")
+    assert client.heads == 2
+
+
+def test_changes_made_during_a_listing_survive_it():
+    client = ListingS3Client(keys=["creative/a.png"])
+    manager = make_manager(client)
+    manager.manifest = S3Manifest(None, max_age=60)
+    manager.manifest.start_listing()
+    entries = [ManifestEntry(key="creative/a.png", size=5, etag="abc", last_modified=0.0)]
+    # a rename made while the listing was in flight, after it had already seen a.png
+    manager.manifest.put(ManifestEntry(key="creative/a.png", size=5, etag="abc", last_modified=0.0))
+    manager.manifest.rename("creative/a.png", "creative/a r[3.0].png")
+    manager.manifest.seed(entries)
+    assert "creative/a r[3.0].png" in manager.manifest and "creative/a.png" not in manager.manifest
+
+
+def test_manifest_survives_a_restart(tmp_path):
+    client = ListingS3Client(keys=["creative/a.png"])
+    clock = Clock()
+    manager = make_manager(client)
+    manager.manifest = S3Manifest(str(tmp_path / "manifest.json"), max_age=60, clock=clock)
+    manager.refresh_manifest()
+    manager.delete_many(["creative/a.png"])
+    manager.manifest.save()
+
+    reloaded = S3Manifest(str(tmp_path / "manifest.json"), max_age=60, clock=clock)
+    assert reloaded.is_fresh()
+    assert "creative/a.png" not in reloaded
+
+
+def test_manifest_changes_are_saved_without_a_clean_quit(tmp_path):
+    client = ListingS3Client(keys=["creative/a.png"])
+    manager = make_manager(client)
+    manager.manifest = S3Manifest(str(tmp_path / "manifest.json"), max_age=60, save_delay=0.05)
+    manager.refresh_manifest()
+    manager.rename_many([("creative/a.png", "creative/a r[3.0].png")])
+
+    # as if the app had crashed: the manifest is read back without save() having been called
+    deadline = time.monotonic() + 5
+    reloaded = S3Manifest(str(tmp_path / "manifest.json"), max_age=60)
+    while "creative/a.png" in reloaded and time.monotonic() < deadline:
+        time.sleep(0.01)
+        reloaded = S3Manifest(str(tmp_path / "manifest.json"), max_age=60)
+    assert "creative/a r[3.0].png" in reloaded and "creative/a.png" not in reloaded
+
+
+def test_without_a_manifest_existence_is_a_head_request():
+    client = ListingS3Client(keys=["creative/a.png"])
+    manager = make_manager(client)
+    assert manager.exists("creative/a.png")
+    assert (client.listings, client.heads) == (0, 1)
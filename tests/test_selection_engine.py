@@ -0,0 +1,118 @@
+import random
+from collections import Counter
+
+from LibraryIndex import UNRATED
+from SelectionEngine import FenwickTree, SelectionEngine, image_identity
+
+
+def test_fenwick_matches_brute_force():
+    rng = random.Random(7)
+    tree = FenwickTree()
+    values = []
+    for _ in range(200):
+        v = rng.randrange(0, 10)
+        tree.append(v)
+        values.append(v)
+    for _ in range(200):
+        idx = rng.randrange(len(values))
+        values[idx] = rng.randrange(0, 10)
+        tree.set(idx, values[idx])
+    assert tree.total == sum(values)
+    for count in range(len(values) + 1):
+        assert tree.prefix_sum(count) == sum(values[:count])
+    # find() returns the slot whose cumulative range contains the target
+    running = 0
+    for idx, v in enumerate(values):
+        for target in range(running, running + v):
+            assert tree.find(target) == idx
+        running += v
+
+
+def test_image_identity_ignores_rating_marker():
+    assert image_identity("image_out/creative/20250219T171207_output_image r[3.0].png") == "creative/20250219T171207"
+    assert image_identity("image_out/creative/20250219T171207_output_image.png") == "creative/20250219T171207"
+
+
+def test_draw_is_weighted_by_rating():
+    engine = SelectionEngine({"1": 1.0, "5": 9.0}, history_path=None)
+    engine.add("out/creative/20250101T000001_output_image r[1.0].png", 1.0)
+    engine.add("out/creative/20250101T000005_output_image r[5.0].png", 5.0)
+    counts = Counter(engine.draw() for _ in range(2000))
+    high = counts["out/creative/20250101T000005_output_image r[5.0].png"]
+    assert 0.85 < high / 2000 < 0.95
+
+
+def test_min_rating_excludes_until_nothing_is_left():
+    engine = SelectionEngine(min_rating=4.0, history_path=None)
+    engine.add("out/creative/20250101T000001_output_image.png", UNRATED)
+    engine.add("out/creative/20250101T000002_output_image r[4.0].png", 4.0)
+    assert {engine.draw() for _ in range(50)} == {"out/creative/20250101T000002_output_image r[4.0].png"}
+    engine.remove("out/creative/20250101T000002_output_image r[4.0].png")
+    assert engine.draw() == "out/creative/20250101T000001_output_image.png"
+
+
+def test_no_repeat_window():
+    engine = SelectionEngine(no_repeat_window=3, history_path=None)
+    paths = [f"out/creative/2025010{i}T000000_output_image.png" for i in range(4)]
+    for p in paths:
+        engine.add(p, UNRATED)
+    for _ in range(10):
+        seen = [engine.draw() for _ in range(4)]
+        # any 4 consecutive draws from 4 images with a window of 3 are all distinct
+        assert len(set(seen)) == 4
+
+
+def test_window_smaller_library_still_draws():
+    engine = SelectionEngine(no_repeat_window=10, history_path=None)
+    engine.add("out/creative/20250101T000000_output_image.png", UNRATED)
+    assert engine.draw() is not None
+    assert engine.draw() is not None
+
+
+def test_rerating_updates_in_place_and_keeps_window(tmp_path):
+    engine = SelectionEngine(no_repeat_window=5, history_path=None, theme="creative")
+    old = "out/creative/20250101T000001_output_image.png"
+    other = "out/creative/20250101T000002_output_image.png"
+    engine.on_library_change("creative", old, UNRATED)
+    engine.on_library_change("creative", other, UNRATED)
+    engine.on_library_change("halloween", "out/halloween/20250101T000003_output_image.png", UNRATED)
+    assert len(engine) == 2
+
+    while engine.draw() != old:
+        pass
+    # rename as LibraryIndex reports it: removed, then added with the new name
+    new = "out/creative/20250101T000001_output_image r[5.0].png"
+    engine.on_library_change("creative", old, None)
+    engine.on_library_change("creative", new, 5.0)
+    assert len(engine) == 2
+    assert engine.draw() == other
+
+
+def test_window_persists_across_restarts(tmp_path):
+    history = str(tmp_path / "history.json")
+    paths = ["out/creative/20250101T000001_output_image.png", "out/creative/20250101T000002_output_image.png"]
+    engine = SelectionEngine(no_repeat_window=1, history_path=history)
+    for p in paths:
+        engine.add(p, UNRATED)
+    first = engine.draw()
+
+    restarted = SelectionEngine(no_repeat_window=1, history_path=history)
+    for p in paths:
+        restarted.add(p, UNRATED)
+    assert restarted.draw() != first
+
+
+def test_an_image_drawn_ahead_counts_once_it_is_shown():
+    engine = SelectionEngine(no_repeat_window=1, history_path=None)
+    paths = ["out/creative/20250101T000001_output_image.png", "out/creative/20250101T000002_output_image.png"]
+    for p in paths:
+        engine.add(p, UNRATED)
+    # drawn for a prefetch that was then discarded: nothing is held out of the next draws
+    engine.draw(record=False)
+    assert {engine.draw(record=False) for _ in range(50)} == set(paths)
+
+    shown = engine.draw(record=False)
+    engine.record_shown(shown)
+    assert {engine.draw(record=False) for _ in range(20)} == set(paths) - {shown}
+    engine.record_shown("out/halloween/20250101T000003_output_image.png")  # not one of ours; ignored
+    assert {engine.draw(record=False) for _ in range(20)} == set(paths) - {shown}
@@ -0,0 +1,210 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+from ContentHash import HashCache
+from S3Manager import OperationResult
+from S3Sync import iter_local_files
+from SyncPlanner import (DELETE_DUPE, DOWNLOAD, RENAME_LOCAL, RENAME_REMOTE, UPLOAD, SyncAction, SyncExecutor,
+                         SyncPlanner, apply_plan, checkpoint_path, filter_actions, plan_progress, read_plan,
+                         write_plan)
+from TransferEngine import TransferSummary
+
+PART = 1024
+
+
+class DummyManager:
+    def __init__(self):
+        self.transfer_config = SimpleNamespace(multipart_chunksize=PART, multipart_threshold=PART)
+        self.calls = []
+
+    def rename_many(self, pairs):
+        self.calls.append(("rename_many", pairs))
+        return [OperationResult(key=old, ok=True, new_key=new) for old, new in pairs]
+
+    def delete_many(self, keys):
+        self.calls.append(("delete_many", keys))
+        return [OperationResult(key=key, ok=True) for key in keys]
+
+
+class DummyEngine:
+    def __init__(self, manager):
+        self.manager = manager
+
+    def run(self, tasks):
+        self.manager.calls.append(("transfer", [(task.direction, task.key) for task in tasks]))
+        return TransferSummary(files_done=len(tasks))
+
+
+def write(root, name, data):
+    path = root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return {"name": name, "size": len(data)}
+
+
+def s3(name, data):
+    return {"name": name, "size": len(data), "etag": hashlib.md5(data).hexdigest()}
+
+
+def plan(tmp_path, s3_files, local_files, **kwargs):
+    planner = SyncPlanner(DummyManager(), HashCache(path=None), root_dir=str(tmp_path), **kwargs)
+    return [(action.kind, action.name, action.new_name) for action in planner.plan(s3_files, local_files)]
+
+
+def test_iter_local_files_yields_names_in_s3_order(tmp_path):
+    for name in ["creative/20250101T000000 a.png", "creative2/x.png", "creative.txt", "stray.txt",
+                 "creative/.derived/thumb.jpg"]:
+        write(tmp_path, name, b"x")
+    names = [file["name"] for file in iter_local_files(str(tmp_path))]
+    assert names == ["creative.txt", "creative/20250101T000000 a.png", "creative2/x.png", "stray.txt"]
+    assert names == sorted(names)
+
+
+def test_plan_emits_each_kind_of_action(tmp_path):
+    local = [
+        write(tmp_path, "creative/20250101T000001 a r[3.0].png", b"aaaa"),
+        write(tmp_path, "creative/20250101T000002 b.png", b"bbbb"),
+        write(tmp_path, "creative/20250101T000004 d.png", b"dddd"),
+        write(tmp_path, "creative/20250101T000005 e.png", b"ee"),
+    ]
+    s3_files = [
+        s3("creative/20250101T000001 a.png", b"aaaa"),
+        s3("creative/20250101T000002 b r[4.0].png", b"bbbb"),
+        s3("creative/20250101T000003 c r[2.0].png", b"cccc"),
+        s3("creative/20250101T000003 c.png", b"cccc"),
+        s3("creative/20250101T000005 e.png", b"eeee"),
+    ]
+    actions = plan(tmp_path, s3_files, local, move_window=0)
+    assert actions == [
+        (RENAME_REMOTE, "creative/20250101T000001 a.png", "creative/20250101T000001 a r[3.0].png"),
+        (RENAME_LOCAL, "creative/20250101T000002 b.png", "creative/20250101T000002 b r[4.0].png"),
+        (DELETE_DUPE, "creative/20250101T000003 c.png", ""),
+        (DOWNLOAD, "creative/20250101T000003 c r[2.0].png", "creative/20250101T000003 c r[2.0].png"),
+        (UPLOAD, "creative/20250101T000004 d.png", "creative/20250101T000004 d.png"),
+        # truncated locally
+        (DOWNLOAD, "creative/20250101T000005 e.png", "creative/20250101T000005 e.png"),
+    ]
+
+
+def test_plan_turns_a_local_rename_into_a_remote_one(tmp_path):
+    local = [write(tmp_path, "creative/20250102T000000 renamed.png", b"same bytes")]
+    s3_files = [s3("creative/20250101T000000 original.png", b"same bytes")]
+    assert plan(tmp_path, s3_files, local) == \
+           [(RENAME_REMOTE, "creative/20250101T000000 original.png", "creative/20250102T000000 renamed.png")]
+    assert [kind for kind, _, _ in plan(tmp_path, s3_files, local, move_window=0)] == [DOWNLOAD, UPLOAD]
+
+
+def test_plan_pairs_only_images_in_the_same_theme(tmp_path):
+    local = [write(tmp_path, "creative/20250102T000000 prompt.txt", b"same prompt"),
+             write(tmp_path, "halloween/20250102T000000 image.png", b"same bytes")]
+    s3_files = [s3("creative/20250101T000000 prompt.txt", b"same prompt"),
+                s3("spring/20250101T000000 image.png", b"same bytes")]
+    assert sorted(kind for kind, _, _ in plan(tmp_path, s3_files, local)) == [DOWNLOAD, DOWNLOAD, UPLOAD, UPLOAD]
+
+
+def test_plan_only_compares_files_that_could_be_a_rename(tmp_path, monkeypatch):
+    s3_files = [s3(f"creative/20250101T{i:06d} original.png", bytes(i + 1)) for i in range(500)]
+    local = [write(tmp_path, "creative/20250102T000000 renamed.png", bytes(42))]
+    compared = []
+    is_moved = SyncPlanner._is_moved
+    monkeypatch.setattr(SyncPlanner, "_is_moved", lambda self, *items: compared.append(items) or is_moved(self, *items))
+    actions = plan(tmp_path, s3_files, local)
+    assert len(compared) == 1
+    assert (RENAME_REMOTE, "creative/20250101T000041 original.png", "creative/20250102T000000 renamed.png") in actions
+
+
+def test_plan_rejects_unsorted_input(tmp_path):
+    with pytest.raises(ValueError):
+        plan(tmp_path, [s3("creative/20250102T000000 b.png", b"b"), s3("creative/20250101T000000 a.png", b"a")], [])
+
+
+def test_executor_runs_transfers_before_renames():
+    manager = DummyManager()
+    actions = [
+        SyncAction(RENAME_REMOTE, "t/20250101T000001 a.png", "t/20250101T000001 a r[3.0].png"),
+        SyncAction(DOWNLOAD, "t/20250101T000002 b.png", "t/20250101T000002 b.png"),
+        SyncAction(DOWNLOAD, "t/20250101T000003 c.png", "t/20250101T000003 c.png"),
+        SyncAction(DELETE_DUPE, "t/20250101T000004 d.png"),
+    ]
+    result = SyncExecutor(manager, DummyEngine(manager), batch_size=10).run(iter(actions))
+    assert [call[0] for call in manager.calls] == ["transfer", "rename_many", "delete_many"]
+    assert manager.calls[0][1] == [("download", "t/20250101T000002 b.png"), ("download", "t/20250101T000003 c.png")]
+    assert result.done == {DOWNLOAD: 2, RENAME_REMOTE: 1, DELETE_DUPE: 1}
+
+
+def remote_renames(count):
+    return [SyncAction(RENAME_REMOTE, f"t/2025010{i}T000000 a.png", f"t/2025010{i}T000000 a r[3.0].png")
+            for i in range(count)]
+
+
+def renamed_keys(manager):
+    return [old for name, pairs in manager.calls if name == "rename_many" for old, _ in pairs]
+
+
+def test_plan_round_trips_through_jsonl(tmp_path):
+    actions = remote_renames(2) + [SyncAction(UPLOAD, "t/20250109T000000 b.png", "t/20250109T000000 b.png", 12,
+                                              "only local")]
+    counts = write_plan(iter(actions), tmp_path / "plan.jsonl")
+    assert counts == {RENAME_REMOTE: 2, UPLOAD: 1}
+    assert list(read_plan(tmp_path / "plan.jsonl")) == actions
+    assert list(read_plan(tmp_path / "plan.jsonl", skip=2)) == actions[2:]
+
+
+def test_filter_actions():
+    actions = [
+        SyncAction(UPLOAD, "creative/20250101T000000 a r[4.0].png", "creative/20250101T000000 a r[4.0].png"),
+        SyncAction(DOWNLOAD, "creative/20250101T000001 b r[2.0].png", "creative/20250101T000001 b r[2.0].png"),
+        SyncAction(RENAME_LOCAL, "halloween/20250101T000002 c.png", "halloween/20250101T000002 c r[5.0].png"),
+        SyncAction(DELETE_DUPE, "creative/20250101T000003 d.png"),
+    ]
+
+    def kinds(**kwargs):
+        return [action.kind for action in filter_actions(actions, **kwargs)]
+
+    assert kinds(theme="creative") == [UPLOAD, DOWNLOAD, DELETE_DUPE]
+    assert kinds(direction="up") == [UPLOAD, DELETE_DUPE]
+    assert kinds(direction="down") == [DOWNLOAD, RENAME_LOCAL]
+    assert kinds(min_rating=3.0) == [UPLOAD, RENAME_LOCAL]
+
+
+def test_apply_plan_checkpoints_and_resumes(tmp_path):
+    plan_path = tmp_path / "plan.jsonl"
+    write_plan(remote_renames(5), plan_path)
+    manager = DummyManager()
+    executor = SyncExecutor(manager, DummyEngine(manager), batch_size=1)
+
+    result, finished = apply_plan(plan_path, executor, max_count=2)
+    assert not finished and result.done == {RENAME_REMOTE: 2}
+    assert plan_progress(plan_path) == 2
+
+    result, finished = apply_plan(plan_path, executor)
+    assert finished and result.done == {RENAME_REMOTE: 3}
+    assert renamed_keys(manager) == [action.name for action in remote_renames(5)]
+
+
+def test_apply_plan_resumes_after_a_crash(tmp_path):
+    plan_path = tmp_path / "plan.jsonl"
+    write_plan(remote_renames(4), plan_path)
+
+    class CrashingManager(DummyManager):
+        def rename_many(self, pairs):
+            if len(self.calls) == 2:
+                raise KeyboardInterrupt
+            return super().rename_many(pairs)
+
+    crashing = CrashingManager()
+    with pytest.raises(KeyboardInterrupt):
+        apply_plan(plan_path, SyncExecutor(crashing, DummyEngine(crashing), batch_size=1))
+    assert plan_progress(plan_path) == 2
+
+    manager = DummyManager()
+    _, finished = apply_plan(plan_path, SyncExecutor(manager, DummyEngine(manager), batch_size=1))
+    assert finished
+    assert renamed_keys(manager) == [action.name for action in remote_renames(4)[2:]]
+
+    # a new plan starts from the beginning
+    write_plan(remote_renames(1), plan_path)
+    assert not checkpoint_path(plan_path).exists()
+    assert plan_progress(plan_path) == 0
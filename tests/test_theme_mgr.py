@@ -1,3 +1,4 @@
+import hashlib
 import os
 
 import pytest
@@ -68,6 +69,70 @@ def test_write_theme(theme_test_setup):
     assert saved_theme.display_name == "New Theme"
 
 
+def test_get_compiled_theme_is_cached_until_file_changes(theme_test_setup):
+    """Compiled themes are reused until the theme file is rewritten."""
+    mgr = ThemeMgr(theme_test_setup)
+    compiled = mgr.get_compiled_theme("creative")
+    assert mgr.get_compiled_theme("creative.yaml") is compiled
+    assert isinstance(compiled.prompts, tuple)
+    assert "random" not in compiled.style_keys
+    assert compiled.format_prompt("X").startswith('Original prompt: "X"')
+
+    theme = mgr.get_theme("creative")
+    theme.disk_name = "delete_me.yaml"
+    mgr.write_theme(theme)
+    first = mgr.get_compiled_theme("delete_me")
+    theme.prompts = ["Only this one"]
+    mgr.write_theme(theme)
+    assert mgr.get_compiled_theme("delete_me").prompts == ("Only this one",)
+    assert mgr.get_compiled_theme("delete_me") is not first
+
+
+def test_theme_fingerprint_is_rehashed_only_when_the_file_changes(theme_test_setup, monkeypatch):
+    """The fingerprint is cached against the file's mtime and size."""
+    mgr = ThemeMgr(theme_test_setup)
+    theme = mgr.get_theme("creative")
+    theme.disk_name = "delete_me.yaml"
+    mgr.write_theme(theme)
+    first = mgr.theme_fingerprint("delete_me")
+
+    hashed = []
+    real_sha256 = hashlib.sha256
+    monkeypatch.setattr(hashlib, "sha256", lambda data: hashed.append(data) or real_sha256(data))
+    assert mgr.theme_fingerprint("delete_me.yaml") == first
+    assert hashed == []
+
+    theme.prompts = ["Only this one"]
+    mgr.write_theme(theme)
+    assert mgr.theme_fingerprint("delete_me") != first
+    assert len(hashed) == 1
+
+
+def test_get_compiled_theme_rejects_bad_template(theme_test_setup):
+    """A user_prompt with fields other than {prompt} is caught when compiling."""
+    mgr = ThemeMgr(theme_test_setup)
+    mgr.write_theme(Theme(
+        disk_name="delete_me.yaml",
+        display_name="Broken",
+        description="Bad template.",
+        system_prompt="AI creative mode.",
+        user_prompt="Transform: \"{prompt}\" in {style}",
+        prompts=["A floating castle"],
+        styles={"fantasy": "Whimsical, colorful lighting."}
+    ))
+    with pytest.raises(ValueError, match="style"):
+        mgr.get_compiled_theme("delete_me")
+
+
+def test_get_theme_list_info(theme_test_setup):
+    """Display metadata comes back for every theme file."""
+    mgr = ThemeMgr(theme_test_setup)
+    infos = {info.disk_name: info for info in mgr.get_theme_list_info()}
+    assert set(infos) == {f + ".yaml" for f in mgr.get_theme_list()}
+    assert infos["creative.yaml"].display_name == "Creative"
+    assert infos["creative.yaml"].description.startswith("A free-form theme")
+
+
 def test_delete_theme(theme_test_setup):
     """Test deleting a theme."""
     mgr = ThemeMgr(theme_test_setup)
@@ -76,3 +141,66 @@ def test_delete_theme(theme_test_setup):
 
     with pytest.raises(FileNotFoundError):
         mgr.get_theme("default")
+
+
+def test_bundle_loads_without_yaml_until_a_source_changes(tmp_path, monkeypatch):
+    """An up-to-date bundle is used instead of YAML; a changed file falls back and refreshes it."""
+    import ThemeMgr as theme_mgr_module
+    mgr = ThemeMgr(str(tmp_path))
+    mgr.write_theme(Theme(
+        disk_name="bundled.yaml",
+        display_name="Bundled",
+        description="From the bundle.",
+        system_prompt="AI creative mode.",
+        user_prompt="Transform: \"{prompt}\"",
+        prompts=["A floating castle"],
+        styles={"fantasy": "Whimsical, colorful lighting."}
+    ))
+    assert os.path.exists(mgr.build_bundle())
+
+    def no_yaml():
+        raise AssertionError("YAML should not be needed")
+
+    cold = ThemeMgr(str(tmp_path))
+    monkeypatch.setattr(theme_mgr_module, "_yaml", no_yaml)
+    assert cold.get_theme("bundled").display_name == "Bundled"
+    assert {info.display_name for info in cold.get_theme_list_info()} == {"Bundled", "Default Theme"}
+    monkeypatch.undo()
+
+    theme_path = tmp_path / "bundled.yaml"
+    theme_path.write_text(theme_path.read_text(encoding="utf-8").replace("Bundled", "Edited"), encoding="utf-8")
+    assert ThemeMgr(str(tmp_path)).get_theme("bundled").display_name == "Edited"
+    # the fallback refreshed the bundle, so the next cold start needs no YAML again
+    monkeypatch.setattr(theme_mgr_module, "_yaml", no_yaml)
+    assert ThemeMgr(str(tmp_path)).get_theme("bundled").display_name == "Edited"
+
+
+def test_build_bundle_fails_loudly_when_a_theme_cannot_be_bundled(tmp_path):
+    mgr = ThemeMgr(str(tmp_path))
+    (tmp_path / "dated.yaml").write_text(
+        "disk_name: dated.yaml\ndisplay_name: Dated\ndescription: 2025-01-01\nsystem_prompt: AI\n"
+        "user_prompt: '{prompt}'\nprompts: [A prompt]\nstyles: {plain: Plain}\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        mgr.build_bundle()  # YAML reads the description as a date, which marshal can't store
+    assert not os.path.exists(mgr.bundle_path)
+    assert not os.path.exists(mgr.bundle_path + ".tmp")
+
+
+def test_a_malformed_bundle_entry_falls_back_to_yaml(tmp_path):
+    import marshal
+    from ThemeMgr import BUNDLE_FORMAT_VERSION
+    mgr = ThemeMgr(str(tmp_path))
+    mgr.write_theme(Theme(
+        disk_name="broken.yaml",
+        display_name="Broken",
+        description="Its bundle entry has no data.",
+        system_prompt="AI creative mode.",
+        user_prompt="Transform: \"{prompt}\"",
+        prompts=["A floating castle"],
+        styles={"fantasy": "Whimsical, colorful lighting."}
+    ))
+    raw = (tmp_path / "broken.yaml").read_bytes()
+    with open(mgr.bundle_path, "wb") as file:
+        marshal.dump({"version": BUNDLE_FORMAT_VERSION,
+                      "themes": {"broken.yaml": {"sha256": hashlib.sha256(raw).hexdigest()}}}, file)
+    assert ThemeMgr(str(tmp_path)).get_theme("broken").display_name == "Broken"
@@ -0,0 +1,94 @@
+import threading
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from SyncPlanner import UPLOAD as UPLOAD_ACTION, SyncAction, SyncExecutor
+from TransferEngine import DOWNLOAD, UPLOAD, TokenBucket, TransferEngine, TransferTask
+
+
+class FakeS3Manager:
+    """put_file/get_file that report progress in 1000-byte chunks and fail as told."""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})  # key -> list of errors to raise, in order
+        self.done = []
+        self.lock = threading.Lock()
+
+    def _transfer(self, key, size, callback):
+        with self.lock:
+            errors = self.failures.get(key)
+            error = errors.pop(0) if errors else None
+        for _ in range(size // 1000):
+            callback(1000)
+            if error is not None:
+                raise error
+        with self.lock:
+            self.done.append(key)
+
+    def put_file(self, file_path, s3_key, callback=None):
+        with open(file_path, "rb") as f:
+            size = len(f.read())
+        self._transfer(s3_key, size, callback)
+
+    def get_file(self, s3_key, local_file_path, callback=None):
+        self._transfer(s3_key, 3000, callback)
+
+
+def make_files(tmp_path, count, size=2000):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"{i}.png"
+        path.write_bytes(b"x" * size)
+        paths.append(path)
+    return paths
+
+
+def test_all_transfers_run_and_are_summarized(tmp_path):
+    s3 = FakeS3Manager()
+    engine = TransferEngine(s3, workers=3, show_progress=False)
+    tasks = [TransferTask(UPLOAD, f"creative/{p.name}", str(p)) for p in make_files(tmp_path, 5)]
+    tasks.append(TransferTask(DOWNLOAD, "creative/remote.png", str(tmp_path / "remote.png"), 3000))
+    summary = engine.run(tasks)
+    assert summary.files_done == 6
+    assert summary.bytes_done == 5 * 2000 + 3000
+    assert summary.failed == []
+    assert sorted(s3.done) == sorted(task.key for task in tasks)
+
+
+def test_retryable_errors_are_retried_and_others_are_not(tmp_path):
+    forbidden = ClientError({"Error": {"Code": "AccessDenied"}, "ResponseMetadata": {"HTTPStatusCode": 403}},
+                            "PutObject")
+    s3 = FakeS3Manager({"creative/0.png": [EndpointConnectionError(endpoint_url="https://s3")],
+                        "creative/1.png": [forbidden]})
+    engine = TransferEngine(s3, workers=2, show_progress=False, sleep=lambda seconds: None)
+    paths = make_files(tmp_path, 2)
+    summary = engine.run([TransferTask(UPLOAD, f"creative/{p.name}", str(p)) for p in paths])
+    assert summary.files_done == 1
+    assert summary.retries == 1
+    assert summary.bytes_done == 2000  # the failed attempt's bytes aren't counted
+    assert [task.key for task, _ in summary.failed] == ["creative/1.png"]
+
+
+def test_token_bucket_sleeps_off_debt():
+    now = [0.0]
+    slept = []
+    bucket = TokenBucket(rate=1000, clock=lambda: now[0], sleep=slept.append)
+    bucket.consume(1000)  # the initial burst
+    assert slept == []
+    bucket.consume(500)
+    assert slept == [0.5]
+    now[0] += 2.0  # refills to the burst size, no further
+    bucket.consume(1000)
+    assert slept == [0.5]
+
+
+def test_sync_executor_runs_uploads_on_the_engine(tmp_path):
+    theme_dir = tmp_path / "creative"
+    theme_dir.mkdir(parents=True)
+    (theme_dir / "20250219T171207_output_image.png").write_bytes(b"x" * 4000)
+    s3 = FakeS3Manager()
+    name = "creative/20250219T171207_output_image.png"
+    result = SyncExecutor(s3, TransferEngine(s3, show_progress=False), root_dir=str(tmp_path)).run(
+        [SyncAction(UPLOAD_ACTION, name, name, 4000)])
+    assert s3.done == [name]
+    assert result.done == {UPLOAD_ACTION: 1}
@@ -0,0 +1,141 @@
+import threading
+import time
+
+from UploadOutbox import UploadOutbox
+
+
+class DummyS3Manager:
+    def __init__(self, fail_times: int = 0):
+        self.fail_times = fail_times
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    def upload_to_s3(self, file_path, s3_key: str) -> bool:
+        with self.lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                return False
+            self.uploads.append((file_path, s3_key))
+            return True
+
+
+def make_file(tmp_path, name="20250219T171207_output_image.png"):
+    path = tmp_path / name
+    path.write_bytes(b"image")
+    return path
+
+
+def test_enqueued_uploads_are_drained(tmp_path):
+    s3 = DummyS3Manager()
+    outbox = UploadOutbox(s3, db_path=str(tmp_path / "outbox.sqlite3"))
+    path = make_file(tmp_path)
+    outbox.enqueue(path, "creative/20250219T171207_output_image.png")
+    assert outbox.metrics()["pending"] == 1
+    assert outbox.process_due() == 1
+    assert s3.uploads == [(str(path), "creative/20250219T171207_output_image.png")]
+    assert outbox.metrics()["pending"] == 0
+    assert outbox.metrics()["uploaded"] == 1
+    outbox.close()
+
+
+def test_pending_uploads_survive_a_restart(tmp_path):
+    db_path = str(tmp_path / "outbox.sqlite3")
+    path = make_file(tmp_path)
+    outbox = UploadOutbox(DummyS3Manager(), db_path=db_path)
+    outbox.enqueue(path, "creative/a.png")
+    outbox.close()  # e.g. the app was stopped before the upload ran
+
+    s3 = DummyS3Manager()
+    reopened = UploadOutbox(s3, db_path=db_path)
+    assert reopened.pending() == [(str(path), "creative/a.png")]
+    reopened.process_due()
+    assert s3.uploads == [(str(path), "creative/a.png")]
+    reopened.close()
+
+
+def test_failures_are_retried_after_a_backoff(tmp_path):
+    s3 = DummyS3Manager(fail_times=1)
+    outbox = UploadOutbox(s3, db_path=str(tmp_path / "outbox.sqlite3"), base_delay=0.05, max_delay=0.05)
+    outbox.enqueue(make_file(tmp_path), "creative/a.png")
+    assert outbox.process_due() == 1
+    assert s3.uploads == []
+    assert outbox.metrics()["failures"] == 1
+    assert outbox.process_due() == 0  # not due yet
+    time.sleep(0.06)
+    assert outbox.process_due() == 1
+    assert len(s3.uploads) == 1
+    outbox.close()
+
+
+def test_missing_files_are_dropped(tmp_path):
+    s3 = DummyS3Manager()
+    outbox = UploadOutbox(s3, db_path=str(tmp_path / "outbox.sqlite3"))
+    outbox.enqueue(tmp_path / "gone.png", "creative/gone.png")
+    outbox.process_due()
+    assert s3.uploads == []
+    assert outbox.pending() == []
+    outbox.close()
+
+
+def test_requeueing_a_key_replaces_the_file(tmp_path):
+    outbox = UploadOutbox(DummyS3Manager(), db_path=str(tmp_path / "outbox.sqlite3"))
+    outbox.enqueue(tmp_path / "old.png", "creative/a.png")
+    outbox.enqueue(tmp_path / "new.png", "creative/a.png")
+    assert outbox.pending() == [(str(tmp_path / "new.png"), "creative/a.png")]
+    outbox.close()
+
+
+def test_renaming_a_pending_file_rekeys_its_upload(tmp_path):
+    s3 = DummyS3Manager()
+    outbox = UploadOutbox(s3, db_path=str(tmp_path / "outbox.sqlite3"))
+    path = make_file(tmp_path)
+    outbox.enqueue(path, "creative/20250219T171207_output_image.png")
+    rated = tmp_path / "20250219T171207_output_image r[4.0].png"
+    path.rename(rated)  # rated before the upload ran
+    assert outbox.rekey(path, rated, "creative/20250219T171207_output_image r[4.0].png")
+    assert not outbox.rekey(path, rated, "creative/elsewhere.png")  # nothing pending for the old path now
+
+    outbox.process_due()
+    assert s3.uploads == [(str(rated), "creative/20250219T171207_output_image r[4.0].png")]
+    assert outbox.metrics()["pending"] == 0
+    outbox.close()
+
+
+def test_workers_drain_in_the_background(tmp_path):
+    s3 = DummyS3Manager()
+    outbox = UploadOutbox(s3, db_path=str(tmp_path / "outbox.sqlite3"), workers=3)
+    outbox.start()
+    for i in range(10):
+        outbox.enqueue(make_file(tmp_path, f"{i}.png"), f"creative/{i}.png")
+    deadline = time.time() + 5
+    while outbox.metrics()["pending"] and time.time() < deadline:
+        time.sleep(0.01)
+    outbox.close()
+    assert sorted(key for _, key in s3.uploads) == sorted(f"creative/{i}.png" for i in range(10))
+
+
+def test_an_upload_outliving_close_leaves_the_journal_alone(tmp_path, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    class SlowS3Manager(DummyS3Manager):
+        def upload_to_s3(self, file_path, s3_key: str) -> bool:
+            started.set()
+            release.wait(5)
+            return super().upload_to_s3(file_path, s3_key)
+
+    errors = []
+    monkeypatch.setattr(threading, "excepthook", errors.append)
+    db_path = str(tmp_path / "outbox.sqlite3")
+    outbox = UploadOutbox(SlowS3Manager(), db_path=db_path)
+    outbox.enqueue(make_file(tmp_path), "creative/a.png")
+    outbox.start()
+    assert started.wait(5)
+    worker = outbox._threads[0]
+    outbox.close(timeout=0.01)
+    release.set()
+    worker.join(5)
+    assert errors == []
+
+    reopened = UploadOutbox(DummyS3Manager(), db_path=db_path)
+    assert reopened.metrics()["pending"] == 1  # uploaded, but not recorded; it is uploaded again
+    reopened.close()